@@ -2,16 +2,57 @@ import datetime
 import shutil
 from PIL import Image
 
-from dj_server.config import DEFAULT_PART_IMAGE
+from dj_server.config import DEFAULT_PART_IMAGE, ADMIN_ESTIMATED_COUNT_MIN_ROWS
 from dj_server.settings import MEDIA_ROOT
 
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connection
+from django.utils.functional import cached_property
+from . import orders
+from .analytics import sales_report
 from .models import (
-    Admin, User, Part, Order, ConfirmedOrder, CompletedOrder
+    Admin, User, Part, PartVersion, PartPhoto, Order, Reservation, ConfirmedOrder, CompletedOrder, ArchivedCompletedOrder,
+    DailySales, DailyCategorySales, DailyPartSales, CustomerSales, PartStockForecast
 )
 
 # Register your models here.
 
+class EstimatedCountPaginator(Paginator):
+    """Takes row count of big unfiltered tables from MySQL table statistics instead of COUNT(*)"""
+
+    @cached_property
+    def count(self):
+        if connection.vendor == "mysql" and not self.object_list.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT TABLE_ROWS FROM information_schema.TABLES "
+                    "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+                    [self.object_list.model._meta.db_table]
+                )
+                row = cursor.fetchone()
+
+            if row and row[0] and row[0] >= ADMIN_ESTIMATED_COUNT_MIN_ROWS:
+                return row[0]
+
+        return super().count
+
+
+class BigTableArticle(admin.ModelAdmin):
+    """Changelist settings for tables growing with orders history"""
+
+    paginator = EstimatedCountPaginator
+
+    # don't count the whole table once more for "N total" next to filtered count
+    show_full_result_count = False
+
+    list_select_related = ['user']
+
+    def get_queryset(self, request):
+        # order lines aren't shown in lists
+        return super().get_queryset(request).defer('parts')
+
+
 class AdminArticle(admin.ModelAdmin):
     list_display = ['admin_id', 'admin_name', 'is_notification_enabled']
 
@@ -35,6 +76,8 @@ class PartArticle(admin.ModelAdmin):
             obj.image.name = destination
         super().save_model(request, obj, form, change)
         if (file != DEFAULT_PART_IMAGE) and ("/" not in load_name):
+            # new photo could be saved to the path of the old one
+            PartPhoto.objects.filter(image=obj.image.name).delete()
             img = Image.open(obj.image.path)
             img = img.resize((1920, 1080))
             img.save(obj.image.path, quality=95)
@@ -43,34 +86,121 @@ class PartArticle(admin.ModelAdmin):
 
     list_filter = ['category', 'is_available']
 
-    search_fields = ['part_id', 'name']
+    search_fields = ['=part_id', 'name']
     
 
-class OrderArticle(admin.ModelAdmin):
-    list_display = ['order_id', 'user', 'cost']
+class PartVersionArticle(admin.ModelAdmin):
+    list_display = ['version_id', 'part_id', 'name', 'category', 'price', 'created_time']
+
+    search_fields = ['=part_id', 'name']
+
+    # versions are append-only, order lines refer to them
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+class OrderArticle(BigTableArticle):
+    list_display = ['order_id', 'user', 'cost', 'updated_time']
+
+    search_fields = ['=order_id', '=user__user_id']
+
+
+class ReservationArticle(admin.ModelAdmin):
+    list_display = ['order', 'part', 'count', 'expires_time']
+
+    list_select_related = ['order', 'part']
+
+    search_fields = ['=order__order_id', '=part__part_id']
+
 
-    search_fields = ['order_id']
+class ConfirmedOrderArticle(BigTableArticle):
 
+    @admin.action(description="Принять выбранные заказы")
+    def accept_orders(self, request, queryset):
+        accepted_orders = orders.accept_orders(queryset.values_list("order_id", flat=True))
+        self.message_user(request, f"принято заказов: {len(accepted_orders)}")
+
+    @admin.action(description="Завершить выбранные принятые заказы")
+    def complete_orders(self, request, queryset):
+        completed_orders = orders.complete_orders(queryset.values_list("order_id", flat=True))
+        self.message_user(request, f"завершено заказов: {len(completed_orders)}")
+
+    actions = ['accept_orders', 'complete_orders']
 
-class ConfirmedOrderArticle(admin.ModelAdmin):
     list_display = ['order_id', 'user', 'cost', 'ordered_time', 'is_accepted', 'accepted_time']
 
-    list_filter = ['ordered_time', 'is_accepted', 'accepted_time']
+    list_filter = ['is_accepted', 'accepted_time']
+
+    search_fields = ['=order_id', '=user__user_id']
 
-    search_fields = ['order_id', 'ordered_time', 'accepted_time']
+    date_hierarchy = 'ordered_time'
 
 
-class CompletedOrderArticle(admin.ModelAdmin):
+class CompletedOrderArticle(BigTableArticle):
     list_display = ['order_id', 'user', 'cost', 'completed_time']
 
-    list_filter = ['completed_time']
+    search_fields = ['=order_id', '=user__user_id']
+
+    date_hierarchy = 'completed_time'
+
+
+class DailySalesArticle(admin.ModelAdmin):
+    change_list_template = "admin/app_bot/dailysales/change_list.html"
+
+    def changelist_view(self, request, extra_context=None):
+        extra_context = dict(extra_context or {}, report=sales_report())
+        return super().changelist_view(request, extra_context=extra_context)
+
+    list_display = ['day', 'orders_count', 'items_count', 'revenue', 'repeat_orders_count']
+
+    date_hierarchy = 'day'
+
+
+class DailyCategorySalesArticle(admin.ModelAdmin):
+    list_display = ['day', 'category', 'items_count', 'revenue']
+
+    list_filter = ['category']
+
+
+class DailyPartSalesArticle(admin.ModelAdmin):
+    show_full_result_count = False
+
+    list_display = ['day', 'part_id', 'name', 'items_count', 'revenue']
+
+    search_fields = ['=part_id', 'name']
+
+
+class CustomerSalesArticle(admin.ModelAdmin):
+    list_display = ['user_id', 'orders_count', 'first_order_day']
+
+    search_fields = ['=user_id']
+
+
+class PartStockForecastArticle(admin.ModelAdmin):
+    list_display = ['part', 'sales_velocity', 'updated_time', 'alerted_time']
+
+    list_select_related = ['part']
 
-    search_fields = ['order_id', 'completed_time']
+    search_fields = ['=part__part_id', 'part__name']
 
 
 admin.site.register(Admin, AdminArticle)
 admin.site.register(User, UserArticle)
 admin.site.register(Part, PartArticle)
+admin.site.register(PartVersion, PartVersionArticle)
 admin.site.register(Order, OrderArticle)
+admin.site.register(Reservation, ReservationArticle)
 admin.site.register(ConfirmedOrder, ConfirmedOrderArticle)
-admin.site.register(CompletedOrder, CompletedOrderArticle)
\ No newline at end of file
+admin.site.register(CompletedOrder, CompletedOrderArticle)
+admin.site.register(ArchivedCompletedOrder, CompletedOrderArticle)
+admin.site.register(DailySales, DailySalesArticle)
+admin.site.register(DailyCategorySales, DailyCategorySalesArticle)
+admin.site.register(DailyPartSales, DailyPartSalesArticle)
+admin.site.register(CustomerSales, CustomerSalesArticle)
+admin.site.register(PartStockForecast, PartStockForecastArticle)
\ No newline at end of file
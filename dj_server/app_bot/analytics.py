@@ -0,0 +1,236 @@
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from django.db import transaction
+from django.db.models import Q, Sum, Max, Count
+
+import dj_server.config as CONFIG
+
+from .money import amount, line_cost
+from .versions import resolve_orders
+from .models import (
+    CompletedOrder, ArchivedCompletedOrder,
+    DailySales, DailyCategorySales, DailyPartSales, CustomerSales, RollupCursor
+)
+
+logger = logging.getLogger(__name__)
+
+# Sales reports are built from daily rollup tables, which are incrementally filled
+# from completed orders in order of (completed_time, order_id) after the saved cursor.
+
+ROLLUP_CURSOR_NAME = "completed_orders"
+
+# orders completed this recently are left for the next rollup, so that a transaction
+# committed a bit later with an earlier completed_time isn't skipped by the cursor
+ROLLUP_LAG = timedelta(minutes=1)
+
+
+def local_day(time: datetime):
+    return (time + CONFIG.TZ_OFFSET).date()
+
+
+def after(cursor: RollupCursor):
+    return (
+        Q(completed_time__gt=cursor.time) |
+        Q(completed_time=cursor.time, order_id__gt=cursor.order_id)
+    )
+
+
+def next_completed_orders(cursor: RollupCursor, batch_size: int):
+    """Orders completed after the cursor from recent orders and archive"""
+
+    after_cursor = after(cursor)
+    completed_before = datetime.now(timezone.utc) - ROLLUP_LAG
+
+    orders = list()
+    for model in (CompletedOrder, ArchivedCompletedOrder):
+        orders += model.objects.filter(after_cursor, completed_time__lt=completed_before) \
+            .order_by("completed_time", "order_id")[:batch_size]
+
+    orders.sort(key=lambda order: (order.completed_time, order.order_id))
+    return orders[:batch_size]
+
+
+def add_to_rollup(model, key_fields: tuple, increments: dict):
+    """Add increments to rollup rows with given keys, creating missing rows"""
+
+    if not increments:
+        return
+
+    rows = model.objects.filter(day__in={key[0] for key in increments})
+    existing_rows = {tuple(getattr(row, field) for field in key_fields): row for row in rows}
+
+    rows_to_create = list()
+    rows_to_update = list()
+    fields = set()
+
+    for key, values in increments.items():
+        row = existing_rows.get(key)
+        if row is None:
+            row = model(**dict(zip(key_fields, key)))
+            rows_to_create.append(row)
+        else:
+            rows_to_update.append(row)
+
+        for field, value in values.items():
+            if field == "name":
+                row.name = value
+            else:
+                setattr(row, field, getattr(row, field) + value)
+            fields.add(field)
+
+    model.objects.bulk_create(rows_to_create)
+    model.objects.bulk_update(rows_to_update, fields=list(fields))
+
+
+def roll_up(orders: list):
+    """Add completed orders to daily rollups and customers stats"""
+
+    days = defaultdict(lambda: defaultdict(int))
+    categories = defaultdict(lambda: defaultdict(int))
+    parts = defaultdict(lambda: defaultdict(int))
+
+    customers = CustomerSales.objects.in_bulk({order.user_id for order in orders})
+    new_customers = dict()
+
+    for order, lines in zip(orders, resolve_orders(orders)):
+        day = local_day(order.completed_time)
+        day_sales = days[(day,)]
+        day_sales["orders_count"] += 1
+
+        customer = customers.get(order.user_id) or new_customers.get(order.user_id)
+        if customer is None:
+            customer = CustomerSales(user_id=order.user_id, orders_count=0, first_order_day=day)
+            new_customers[order.user_id] = customer
+        if customer.orders_count > 0:
+            day_sales["repeat_orders_count"] += 1
+        customer.orders_count += 1
+
+        if order.accepted_time >= order.ordered_time:
+            day_sales["accept_seconds"] += int((order.accepted_time - order.ordered_time).total_seconds())
+        if order.completed_time >= order.accepted_time:
+            day_sales["complete_seconds"] += int((order.completed_time - order.accepted_time).total_seconds())
+
+        for part_id, line in lines.items():
+            count = line['count']
+            revenue = line_cost(count, line['price'])
+
+            day_sales["items_count"] += count
+            day_sales["revenue"] += revenue
+
+            category_sales = categories[(day, line['category'])]
+            category_sales["items_count"] += count
+            category_sales["revenue"] += revenue
+
+            part_sales = parts[(day, int(part_id))]
+            part_sales["name"] = line['name']
+            part_sales["items_count"] += count
+            part_sales["revenue"] += revenue
+
+    add_to_rollup(DailySales, ("day",), days)
+    add_to_rollup(DailyCategorySales, ("day", "category"), categories)
+    add_to_rollup(DailyPartSales, ("day", "part_id"), parts)
+
+    CustomerSales.objects.bulk_create(new_customers.values())
+    CustomerSales.objects.bulk_update(customers.values(), fields=["orders_count"])
+
+
+def rollup_completed_orders(batch_size: int = CONFIG.ANALYTICS_ROLLUP_BATCH_SIZE):
+    """Roll up all orders completed since the last rollup, one transaction per batch"""
+
+    rolled_up_count = 0
+
+    while True:
+        with transaction.atomic():
+            # locked cursor serializes concurrent rollups
+            RollupCursor.objects.get_or_create(name=ROLLUP_CURSOR_NAME)
+            cursor = RollupCursor.objects.select_for_update().get(name=ROLLUP_CURSOR_NAME)
+
+            orders = next_completed_orders(cursor, batch_size)
+            if not orders:
+                break
+
+            roll_up(orders)
+
+            cursor.time = orders[-1].completed_time
+            cursor.order_id = orders[-1].order_id
+            cursor.save()
+
+        rolled_up_count += len(orders)
+
+        if len(orders) < batch_size:
+            break
+
+    if rolled_up_count:
+        logger.info("[ANALYTICS] %s completed orders rolled up", rolled_up_count)
+
+    return rolled_up_count
+
+
+def completed_orders_count():
+    """Count of all completed orders: rolled up ones from daily rollups, the rest by completed_time index"""
+
+    count = DailySales.objects.aggregate(orders_count=Sum("orders_count", default=0))["orders_count"]
+
+    cursor = RollupCursor.objects.filter(name=ROLLUP_CURSOR_NAME).first() or RollupCursor()
+    for model in (CompletedOrder, ArchivedCompletedOrder):
+        count += model.objects.filter(after(cursor)).count()
+
+    return count
+
+
+def sales_report(days: int = CONFIG.ANALYTICS_REPORT_DAYS):
+    """Sales for the last days from rollups"""
+
+    since = local_day(datetime.now(timezone.utc)) - timedelta(days=days - 1)
+
+    daily_sales = DailySales.objects.filter(day__gte=since)
+
+    totals = daily_sales.aggregate(
+        orders_count=Sum("orders_count", default=0),
+        items_count=Sum("items_count", default=0),
+        revenue=Sum("revenue", default=0),
+        repeat_orders_count=Sum("repeat_orders_count", default=0),
+        accept_seconds=Sum("accept_seconds", default=0),
+        complete_seconds=Sum("complete_seconds", default=0),
+    )
+
+    by_day = list(daily_sales.order_by("day").values("day", "orders_count", "items_count", "revenue"))
+
+    by_category = list(
+        DailyCategorySales.objects.filter(day__gte=since)
+        .values("category")
+        .annotate(items_count=Sum("items_count"), total_revenue=Sum("revenue"))
+        .order_by("-total_revenue")
+    )
+
+    top_parts = list(
+        DailyPartSales.objects.filter(day__gte=since)
+        .values("part_id")
+        .annotate(part_name=Max("name"), items_count=Sum("items_count"), total_revenue=Sum("revenue"))
+        .order_by("-total_revenue")[:CONFIG.ANALYTICS_TOP_PARTS_COUNT]
+    )
+
+    customers = CustomerSales.objects.aggregate(
+        total=Count("user_id"),
+        repeat=Count("user_id", filter=Q(orders_count__gt=1))
+    )
+
+    orders_count = totals["orders_count"]
+
+    return {
+        "days": days,
+        "since": since,
+        "orders_count": orders_count,
+        "items_count": totals["items_count"],
+        "revenue": amount(totals["revenue"]),
+        "average_order_cost": amount(totals["revenue"] / orders_count) if orders_count else amount(0),
+        "repeat_orders_rate": totals["repeat_orders_count"] / orders_count if orders_count else 0.0,
+        "repeat_customers_rate": customers["repeat"] / customers["total"] if customers["total"] else 0.0,
+        "average_accept_hours": totals["accept_seconds"] / orders_count / 3600 if orders_count else 0.0,
+        "average_complete_hours": totals["complete_seconds"] / orders_count / 3600 if orders_count else 0.0,
+        "by_day": by_day,
+        "by_category": by_category,
+        "top_parts": top_parts,
+    }
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class AppBotConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app_bot'
+
+    def ready(self):
+        # connect signal receivers which version parts and keep in-memory snapshots fresh,
+        # versions first, so the catalog snapshot gets parts with their new version
+        from . import versions
+        from . import cache
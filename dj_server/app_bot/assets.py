@@ -0,0 +1,128 @@
+import asyncio
+import json
+import logging
+import os
+
+from django.conf import settings
+
+import dj_server.config as CONFIG
+from dj_server.credentials import URL
+
+from . import static_files
+
+logger = logging.getLogger(__name__)
+
+# URLs of images telegram downloads, with the hash of file content in `v`,
+# so telegram downloads an image again only when it is changed.
+# URLs are built from `versions` without touching the disk: bot images and files of the manifest built by
+# `build_asset_manifest` are hashed at startup (unchanged files take their hash from the manifest),
+# other files are hashed in a worker thread on first use, until then their URL has no `v`.
+
+BOT_IMAGES_DIR = "img/bot"
+
+versions = dict()       # file path -> hash of file content
+hashing = set()         # paths being hashed in worker threads
+
+
+def static_path(name: str):
+    return os.path.normpath(os.path.join(settings.STATIC_ROOT, name))
+
+
+def media_path(name: str):
+    return os.path.normpath(os.path.join(settings.MEDIA_ROOT, name))
+
+
+def hash_file(path: str):
+    """Put hash of the file into versions, blocks on disk, so runs at startup or in a worker thread"""
+
+    try:
+        versions[path] = static_files.file_hash(path, os.stat(path))
+    except OSError:
+        pass
+    finally:
+        hashing.discard(path)
+
+
+def asset_url(url_prefix: str, path: str, name: str):
+    url = f"{URL}/{url_prefix.strip('/')}/{name}"
+
+    version = versions.get(path)
+    if version is not None:
+        return f"{url}?v={version}"
+
+    if path not in hashing:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # not in the event loop, e.g. admin site
+            hash_file(path)
+            return f"{url}?v={versions[path]}" if path in versions else url
+
+        hashing.add(path)
+        loop.run_in_executor(None, hash_file, path)
+
+    return url
+
+
+def static_url(name: str):
+    """URL of file in static files, e.g. `img/bot/malarka_shop_bot_logo.jpg`"""
+
+    return asset_url(settings.STATIC_URL, static_path(name), name)
+
+
+def media_url(name: str):
+    """URL of uploaded file, e.g. name of `Part.image`"""
+
+    return asset_url(settings.MEDIA_URL, media_path(name), name)
+
+
+def build_manifest(static_names: list, media_names: list):
+    """Hash given files and save their hashes to the manifest, return number of files"""
+
+    manifest = dict()
+
+    for path in [static_path(name) for name in static_names] + [media_path(name) for name in media_names]:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+
+        manifest[os.path.relpath(path, settings.BASE_DIR)] = {
+            "hash": static_files.file_hash(path, stat),
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+        }
+
+    with open(CONFIG.ASSET_MANIFEST_FILE, "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+
+    return len(manifest)
+
+
+def bot_image_names():
+    return [f"{BOT_IMAGES_DIR}/{name}" for name in sorted(os.listdir(static_path(BOT_IMAGES_DIR)))]
+
+
+def load_manifest():
+    """Take hashes of files unchanged since the manifest was built, hash bot images and changed files"""
+
+    manifest = dict()
+    if os.path.exists(CONFIG.ASSET_MANIFEST_FILE):
+        with open(CONFIG.ASSET_MANIFEST_FILE, encoding="utf-8") as file:
+            manifest = json.load(file)
+
+    paths = list()
+    for relative_path, entry in manifest.items():
+        path = os.path.normpath(os.path.join(settings.BASE_DIR, relative_path))
+        static_files.file_hashes[path] = (entry["mtime_ns"], entry["size"], entry["hash"])
+        paths.append(path)
+
+    try:
+        paths += [static_path(name) for name in bot_image_names()]
+    except OSError:
+        pass
+
+    for path in paths:
+        hash_file(path)
+
+    logger.info("[ASSETS] %s asset hashes loaded from manifest, %s assets versioned", len(manifest), len(versions))
@@ -0,0 +1,130 @@
+import logging
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Admin, Part, PartPhoto
+
+logger = logging.getLogger(__name__)
+
+# In-memory snapshots of rarely changing tables, shared by the bot handlers.
+# The admin site runs in the same process as the bot, so model signals keep them fresh;
+# queryset .update() calls don't send signals and must refresh the snapshot by hand.
+
+admins = dict()             # admin_id -> is_notification_enabled
+parts = dict()              # part_id -> Part, only parts available in catalog
+category_counts = dict()    # category -> count of parts available in catalog
+search_version = 0          # changes when parts join or leave catalog or their names or categories change
+photo_file_ids = dict()     # part image name -> telegram file id of uploaded photo
+
+
+def load_admins():
+    """Load all admins from db"""
+
+    admins.clear()
+    for admin_id, is_notification_enabled in Admin.objects.values_list("admin_id", "is_notification_enabled"):
+        admins[admin_id] = is_notification_enabled
+
+    logger.info("[CACHE] %s admins loaded", len(admins))
+
+
+def drop_part(part_id: int):
+    global search_version
+
+    part = parts.pop(part_id, None)
+    if part is not None:
+        category_counts[part.category] -= 1
+        search_version += 1
+
+
+def put_part(part: Part):
+    global search_version
+
+    # stock of parts changes on every order, it doesn't change search results
+    old_part = parts.get(part.part_id)
+    parts[part.part_id] = part
+
+    if old_part is not None and old_part.category == part.category:
+        if old_part.name != part.name:
+            search_version += 1
+        return
+
+    if old_part is not None:
+        category_counts[old_part.category] -= 1
+    category_counts[part.category] = category_counts.get(part.category, 0) + 1
+    search_version += 1
+
+
+def load_catalog():
+    """Load all parts available in catalog from db"""
+
+    parts.clear()
+    category_counts.clear()
+    for part in Part.objects.filter(is_available=True, available_count__gt=0).order_by("part_id"):
+        put_part(part)
+
+    logger.info("[CACHE] %s parts loaded", len(parts))
+
+
+def load_photos():
+    """Load file ids of part photos already uploaded to telegram"""
+
+    photo_file_ids.clear()
+    for image, file_id in PartPhoto.objects.values_list("image", "file_id"):
+        photo_file_ids[image] = file_id
+
+    logger.info("[CACHE] %s photo file ids loaded", len(photo_file_ids))
+
+
+def refresh_part(part: Part):
+    """Put the part into catalog snapshot or drop it if it isn't available anymore"""
+
+    if part.is_available and part.available_count > 0:
+        put_part(part)
+    else:
+        drop_part(part.part_id)
+
+
+def refresh_parts(part_ids):
+    """Reload given parts from db after queryset updates of their stock"""
+
+    part_ids = {int(part_id) for part_id in part_ids}
+
+    for part in Part.objects.filter(part_id__in=part_ids):
+        refresh_part(part)
+        part_ids.discard(part.part_id)
+
+    # deleted from db
+    for part_id in part_ids:
+        drop_part(part_id)
+
+
+def admins_with_notifications_enabled():
+    """Ids of admins who want to be notified about orders"""
+
+    return [admin_id for admin_id, is_notification_enabled in admins.items() if is_notification_enabled]
+
+
+@receiver(post_save, sender=Admin)
+def admin_saved(sender, instance: Admin, **kwargs):
+    admins[instance.admin_id] = instance.is_notification_enabled
+
+
+@receiver(post_delete, sender=Admin)
+def admin_deleted(sender, instance: Admin, **kwargs):
+    admins.pop(instance.admin_id, None)
+
+
+@receiver(post_save, sender=Part)
+def part_saved(sender, instance: Part, **kwargs):
+    refresh_part(instance)
+
+
+@receiver(post_delete, sender=Part)
+def part_deleted(sender, instance: Part, **kwargs):
+    drop_part(instance.part_id)
+
+
+@receiver(post_delete, sender=PartPhoto)
+def part_photo_deleted(sender, instance: PartPhoto, **kwargs):
+    photo_file_ids.pop(instance.image, None)
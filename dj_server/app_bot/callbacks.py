@@ -0,0 +1,100 @@
+from telegram import Update
+from telegram.ext import CallbackQueryHandler, ContextTypes
+
+# Callback data of inline buttons is "<version>:<action code>[:<argument>...]",
+# integer arguments (ids) are packed in base 36, strings (category names) are kept as is.
+# Each conversation state has one Router, which finds the callback of a button by its code in a dict,
+# instead of PTB trying a regex handler after another.
+# VERSION is changed when codes or arguments of buttons change, buttons of older messages are answered as expired.
+
+VERSION = "1"
+SPLIT = ":"
+
+MAX_DATA_LENGTH = 64    # bytes of callback data telegram accepts
+
+EXPIRED_TEXT = "⌛ кнопка устарела, нажмите /start"
+
+
+def pack(argument):
+    if isinstance(argument, int):
+        digits = ""
+        while True:
+            argument, digit = divmod(argument, 36)
+            digits = "0123456789abcdefghijklmnopqrstuvwxyz"[digit] + digits
+            if argument == 0:
+                return digits
+
+    return str(argument)
+
+
+def number(argument: str):
+    """Integer argument packed by `pack`"""
+
+    return int(argument, 36)
+
+
+def encode(code: int, *arguments):
+    """Callback data of a button with action code and arguments"""
+
+    data = SPLIT.join([VERSION, str(code), *(pack(argument) for argument in arguments)])
+
+    if len(data.encode()) > MAX_DATA_LENGTH:
+        raise ValueError(f"callback data is longer than {MAX_DATA_LENGTH} bytes: {data}")
+
+    return data
+
+
+def decode(data: str):
+    """(action code, list of arguments) of callback data, None if it is of another version"""
+
+    version, _, rest = data.partition(SPLIT)
+    if version != VERSION or not rest:
+        return None
+
+    code, *arguments = rest.split(SPLIT)
+    try:
+        return int(code), arguments
+    except ValueError:
+        return None
+
+
+def code(data: str):
+    """Action code of callback data"""
+
+    action = decode(data)
+    return action[0] if action else None
+
+
+async def expired(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Answer a button made by the bot before its callback data changed"""
+
+    await update.callback_query.answer(EXPIRED_TEXT, show_alert=True)
+
+
+class Router(CallbackQueryHandler):
+    """Handler of all buttons of a conversation state, `routes` is action code -> callback"""
+
+    def __init__(self, routes: dict):
+        super().__init__(expired)
+        self.routes = routes
+
+    def check_update(self, update: object):
+        if not isinstance(update, Update) or update.callback_query is None or update.callback_query.data is None:
+            return None
+
+        action = decode(update.callback_query.data)
+        if action is None:
+            return self.callback, []
+
+        code, arguments = action
+        callback = self.routes.get(code)
+        if callback is None:
+            return None
+
+        return callback, arguments
+
+    async def handle_update(self, update, application, check_result, context):
+        callback, arguments = check_result
+        context.args = arguments
+
+        return await callback(update, context)
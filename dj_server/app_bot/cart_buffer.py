@@ -0,0 +1,160 @@
+import copy
+import logging
+import time
+from datetime import datetime, timezone
+
+import dj_server.config as CONFIG
+
+from . import versions
+from .models import Order
+
+logger = logging.getLogger(__name__)
+
+# Write-behind buffer of carts of active users: handlers take carts from memory and only mark them changed,
+# a burst of ➕/➖ taps is written with one query. A changed cart is written when it is shown (cart view, checkout),
+# after CART_BUFFER_IDLE_TIME without use and on shutdown, then idle carts are dropped from memory.
+# Handlers run in the event loop one after another, writes copy the cart first, so they may interleave with changes.
+# Cleanup jobs of carts.py skip buffered carts. Writes still check updated_time of the row like
+# carts.refresh_cart_prices does: a cart deleted in the meantime is created again with the same id,
+# a row changed by someone else keeps the part versions it points to and gets counts of the buffered cart.
+
+
+class BufferedCart:
+    __slots__ = ("order", "changes_count", "written_count", "used_time", "saved_updated_time")
+
+    def __init__(self, order: Order):
+        self.order = order
+        self.changes_count = 0
+        self.written_count = 0
+        self.used_time = time.monotonic()
+        self.saved_updated_time = order.updated_time    # updated_time of the row in db
+
+    def is_unsaved(self):
+        return self.changes_count != self.written_count
+
+
+carts = dict()      # order_id -> BufferedCart
+
+
+def get(order_id: int):
+    """Buffered cart, None if it isn't in memory"""
+
+    cart = carts.get(order_id)
+    if cart is None:
+        return None
+
+    cart.used_time = time.monotonic()
+    return cart.order
+
+
+def keep(order: Order):
+    """Put cart read from db into the buffer, return the buffered one"""
+
+    if order.order_id not in carts:
+        carts[order.order_id] = BufferedCart(order)
+
+    return carts[order.order_id].order
+
+
+def changed(order: Order):
+    """Mark cart contents changed, to be written later"""
+
+    order.updated_time = datetime.now(timezone.utc)
+
+    cart = carts.get(order.order_id)
+    if cart is None or cart.order is not order:
+        cart = carts[order.order_id] = BufferedCart(order)
+
+    cart.changes_count += 1
+    cart.used_time = time.monotonic()
+
+
+def discard(order_id: int):
+    """Forget cart deleted from db"""
+
+    carts.pop(order_id, None)
+
+
+def buffered_order_ids():
+    """Ids of carts in memory, for jobs in worker threads"""
+
+    # list() of dict keys doesn't switch threads, iterating the dict in python could see it changed
+    return list(carts)
+
+
+def keep_refreshed_versions(order: Order, saved_order: Order):
+    """Point lines of buffered cart to versions the saved cart was refreshed to"""
+
+    for part_id, line in order.parts.items():
+        saved_line = saved_order.parts.get(part_id)
+        if saved_line is not None and "version" in saved_line and "count" in line:
+            order.parts[part_id] = versions.line(saved_line["version"], line["count"])
+
+
+async def flush(order_id: int):
+    """Write the cart if it has unsaved changes"""
+
+    cart = carts.get(order_id)
+    if cart is None or not cart.is_unsaved():
+        return False
+
+    order, changes_count = cart.order, cart.changes_count
+
+    while True:
+        updated_time = order.updated_time
+        parts = copy.deepcopy(order.parts)
+
+        updated_count = await Order.objects.filter(
+            order_id=order_id,
+            updated_time=cart.saved_updated_time
+        ).aupdate(parts=parts, updated_time=updated_time)
+        if updated_count:
+            break
+
+        saved_order = await Order.objects.filter(order_id=order_id).afirst()
+        if saved_order is None:
+            await Order.objects.acreate(order_id=order_id, user_id=order.user_id, parts=parts, updated_time=updated_time)
+            logger.warning("[CARTS] Cart [id: %s] was deleted with unsaved changes, created again", order_id)
+            break
+
+        # the row was changed by someone else, write again on top of it
+        keep_refreshed_versions(order, saved_order)
+        cart.saved_updated_time = saved_order.updated_time
+
+    cart.saved_updated_time = updated_time
+    cart.written_count = max(cart.written_count, changes_count)
+
+    return True
+
+
+async def flush_idle():
+    """Write carts unused for CART_BUFFER_IDLE_TIME and drop them from memory"""
+
+    idle_since = time.monotonic() - CONFIG.CART_BUFFER_IDLE_TIME
+    written_count = 0
+
+    for order_id in [order_id for order_id, cart in carts.items() if cart.used_time <= idle_since]:
+        written_count += await flush(order_id)
+
+        # the cart could be used again while it was written
+        cart = carts.get(order_id)
+        if cart is not None and cart.used_time <= idle_since and not cart.is_unsaved():
+            del carts[order_id]
+
+    if written_count:
+        logger.info("[CARTS] %s idle carts written", written_count)
+
+
+async def flush_all():
+    """Write all carts with unsaved changes, on shutdown"""
+
+    written_count = 0
+    for order_id in list(carts):
+        written_count += await flush(order_id)
+
+    if written_count:
+        logger.info("[CARTS] %s carts written on shutdown", written_count)
+
+
+def unsaved_count():
+    return sum(1 for cart in list(carts.values()) if cart.is_unsaved())
@@ -0,0 +1,101 @@
+import logging
+from datetime import datetime, timezone
+
+from django.db.models import Q
+
+import dj_server.config as CONFIG
+
+from . import cart_buffer, money, versions
+from .models import Order, Part
+
+logger = logging.getLogger(__name__)
+
+
+def delete_abandoned_carts():
+    """Delete carts which weren't changed for a long time in batches"""
+
+    deleted_count = 0
+
+    while True:
+        now = datetime.now(timezone.utc)
+        abandoned = (
+            Q(updated_time__lt=now - CONFIG.ABANDONED_CART_TTL) |
+            Q(parts={}, updated_time__lt=now - CONFIG.EMPTY_CART_TTL)
+        )
+
+        # carts in the write-behind buffer are in use, their row may be older than the cart
+        abandoned &= ~Q(order_id__in=cart_buffer.buffered_order_ids())
+
+        order_ids = list(
+            Order.objects.filter(abandoned).values_list("order_id", flat=True)[:CONFIG.ABANDONED_CART_BATCH_SIZE]
+        )
+        if not order_ids:
+            break
+
+        # check staleness again, the cart could be changed or buffered after ids were selected
+        abandoned &= ~Q(order_id__in=cart_buffer.buffered_order_ids())
+        Order.objects.filter(abandoned, order_id__in=order_ids).delete()
+        deleted_count += len(order_ids)
+
+        if len(order_ids) < CONFIG.ABANDONED_CART_BATCH_SIZE:
+            break
+
+    if deleted_count:
+        logger.info("[CARTS] %s abandoned carts deleted", deleted_count)
+
+
+def refresh_cart_prices():
+    """Point cart lines to actual versions of parts and recount cart cost"""
+
+    refreshed_count = 0
+    last_order_id = 0
+
+    while True:
+        # buffered carts are refreshed after they are written and dropped from memory,
+        # otherwise their next write would point lines back to the versions they were read with
+        orders = list(
+            Order.objects.filter(order_id__gt=last_order_id).exclude(parts={})
+            .exclude(order_id__in=cart_buffer.buffered_order_ids())
+            .order_by("order_id")[:CONFIG.ABANDONED_CART_BATCH_SIZE]
+        )
+        if not orders:
+            break
+
+        last_order_id = orders[-1].order_id
+
+        part_ids = {int(part_id) for order in orders for part_id in order.parts}
+        parts = Part.objects.in_bulk(part_ids)
+
+        for order in orders:
+            cart = dict()
+            cost = money.ZERO
+
+            for part_id, line in order.parts.items():
+                part = parts.get(int(part_id))
+                if part is None:
+                    continue
+
+                cart[part_id] = versions.line(part.version_id or versions.snapshot(part), line['count'])
+                cost += money.line_cost(line['count'], part.price)
+
+            if cart == order.parts and cost == order.cost:
+                continue
+
+            # don't overwrite cart changed by user in the meantime
+            refreshed_count += Order.objects.filter(
+                order_id=order.order_id,
+                updated_time=order.updated_time
+            ).update(parts=cart, cost=cost)
+
+        if len(orders) < CONFIG.ABANDONED_CART_BATCH_SIZE:
+            break
+
+    if refreshed_count:
+        logger.info("[CARTS] %s carts refreshed", refreshed_count)
+
+
+def cleanup_carts():
+    """Periodic job keeping the cart table small and its prices actual"""
+
+    delete_abandoned_carts()
+    refresh_cart_prices()
@@ -0,0 +1,206 @@
+import asyncio
+import json
+import logging
+import os
+
+from asgiref.sync import sync_to_async
+
+from django.db import connection, close_old_connections
+
+from telegram import Bot, Update
+from telegram.error import NetworkError, RetryAfter, TimedOut
+from telegram.ext import Application
+
+import dj_server.config as CONFIG
+
+from . import assets, cache, cart_buffer, metrics, notifications, throttling
+
+logger = logging.getLogger(__name__)
+
+# health endpoint reports ready only between startup() and shutdown()
+is_ready = False
+
+background_tasks = list()
+
+
+async def ingest(application: Application, update: Update):
+    """Put the update into `update_queue`, the same way for webhook, polling and restored updates"""
+
+    metrics.update_enqueued(update)
+    throttling.update_received(update)
+    await application.update_queue.put(update)
+
+
+async def set_webhook(bot: Bot, url: str):
+    """Pass webhook settings to telegram if they differ from the current ones"""
+
+    webhook_info = await bot.get_webhook_info()
+
+    if webhook_info.url == url and set(webhook_info.allowed_updates or ()) == set(Update.ALL_TYPES):
+        logger.info("[PTB] Webhook [%s] is already set", url)
+        return
+
+    await bot.set_webhook(url=url, allowed_updates=Update.ALL_TYPES)
+    logger.info("[PTB] Webhook [%s] set", url)
+
+
+def prewarm():
+    """Open db connection and load in-memory snapshots before the first update"""
+
+    connection.ensure_connection()
+    cache.load_admins()
+    cache.load_catalog()
+    cache.load_photos()
+    assets.load_manifest()
+
+
+def run_job(job):
+    """Run sync job in a worker thread with its own db connection"""
+
+    close_old_connections()
+    try:
+        return job()
+    finally:
+        close_old_connections()
+
+
+def run_periodically(job, interval: float):
+    """Run sync job or coroutine function in background every interval seconds until shutdown"""
+
+    async def run_forever():
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if asyncio.iscoroutinefunction(job):
+                    await job()
+                else:
+                    await sync_to_async(run_job, thread_sensitive=False)(job)
+            except Exception:
+                logger.exception("[PTB] Background job [%s] failed", job.__name__)
+
+    background_tasks.append(asyncio.create_task(run_forever(), name=job.__name__))
+
+
+def persist_pending_updates(application: Application):
+    """Take all updates left in the queue and save them to file"""
+
+    pending_updates = list()
+
+    while not application.update_queue.empty():
+        update = application.update_queue.get_nowait()
+        application.update_queue.task_done()
+        metrics.update_dequeued(update)
+
+        if isinstance(update, Update):
+            pending_updates.append(update.to_dict())
+
+    if pending_updates:
+        with open(CONFIG.PENDING_UPDATES_FILE, "w", encoding="utf-8") as file:
+            json.dump(pending_updates, file)
+
+        logger.warning("[PTB] %s pending updates saved to [%s]", len(pending_updates), CONFIG.PENDING_UPDATES_FILE)
+
+
+async def restore_pending_updates(application: Application):
+    """Put updates saved on previous shutdown back into the queue"""
+
+    if not os.path.exists(CONFIG.PENDING_UPDATES_FILE):
+        return
+
+    with open(CONFIG.PENDING_UPDATES_FILE, encoding="utf-8") as file:
+        pending_updates = json.load(file)
+
+    os.remove(CONFIG.PENDING_UPDATES_FILE)
+
+    for data in pending_updates:
+        await ingest(application, Update.de_json(data=data, bot=application.bot))
+
+    logger.info("[PTB] %s pending updates restored", len(pending_updates))
+
+
+async def poll_updates(application: Application):
+    """Take updates from telegram with batched long polling until cancelled"""
+
+    offset = None
+
+    try:
+        while True:
+            try:
+                updates = await application.bot.get_updates(
+                    offset=offset,
+                    limit=CONFIG.POLLING_BATCH_SIZE,
+                    timeout=CONFIG.POLLING_TIMEOUT,
+                    read_timeout=CONFIG.POLLING_TIMEOUT + CONFIG.BOT_API_READ_TIMEOUT,
+                    allowed_updates=Update.ALL_TYPES,
+                )
+            except TimedOut:
+                continue
+            except RetryAfter as error:
+                await asyncio.sleep(error.retry_after)
+                continue
+            except NetworkError as error:
+                logger.warning("[PTB] Polling failed: %s", error)
+                await asyncio.sleep(CONFIG.POLLING_RETRY_INTERVAL)
+                continue
+
+            for update in updates:
+                await ingest(application, update)
+
+            if updates:
+                offset = updates[-1].update_id + 1
+    except asyncio.CancelledError:
+        # confirm taken updates, or telegram gives them again after restart
+        if offset is not None:
+            try:
+                await application.bot.get_updates(offset=offset, limit=1, timeout=0)
+            except NetworkError as error:
+                logger.warning("[PTB] Taken updates weren't confirmed: %s", error)
+        raise
+
+
+async def startup(application: Application, webhook_url: str = None):
+    """Prewarm the process, replay pending updates and make sure telegram sends updates the chosen way:
+    to the webhook if `webhook_url` is given, otherwise to long polling"""
+
+    global is_ready
+
+    await sync_to_async(prewarm)()
+    notifications.start(application.bot)
+    await restore_pending_updates(application)
+
+    if webhook_url is not None:
+        await set_webhook(application.bot, webhook_url)
+    else:
+        # telegram doesn't give updates with getUpdates while a webhook is set
+        await application.bot.delete_webhook()
+        background_tasks.append(asyncio.create_task(poll_updates(application), name="poll_updates"))
+        logger.info("[PTB] Polling for updates")
+
+    is_ready = True
+    logger.info("[PTB] Bot is ready")
+
+
+async def shutdown(application: Application):
+    """Drain the update queue within a deadline, save what is left, send queued notifications, stop the application, write buffered carts"""
+
+    global is_ready
+    is_ready = False
+
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+
+    try:
+        await asyncio.wait_for(application.update_queue.join(), timeout=CONFIG.SHUTDOWN_DRAIN_TIMEOUT)
+    except asyncio.TimeoutError:
+        persist_pending_updates(application)
+
+    await notifications.stop(timeout=CONFIG.SHUTDOWN_DRAIN_TIMEOUT)
+
+    await application.stop()
+
+    # handlers are finished, carts are changed no more
+    await cart_buffer.flush_all()
+
+    logger.info("[PTB] Bot is stopped")
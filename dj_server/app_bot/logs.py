@@ -0,0 +1,151 @@
+import copy
+import functools
+import json
+import logging
+import os
+import queue
+import re
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+
+from telegram.ext import Application, ConversationHandler
+
+import dj_server.config as CONFIG
+
+from .callbacks import Router
+
+# Logging of the bot process: the loop thread only puts records into a queue,
+# a listener thread serializes them to JSON lines and writes them to a file rotated daily and by size.
+
+CONTEXT_FIELDS = ("user_id", "order_id", "handler")
+
+log_context = ContextVar("log_context", default=dict())     # fields of the update being handled
+
+listener = None
+
+
+class ContextQueueHandler(QueueHandler):
+    """Puts records into the queue with fields of the update being handled, leaving formatting to the listener"""
+
+    def prepare(self, record):
+        record = copy.copy(record)
+
+        # args may change after the call returns, so only the message is merged here
+        record.msg = record.getMessage()
+        record.args = None
+
+        for field, value in log_context.get().items():
+            if getattr(record, field, None) is None:
+                setattr(record, field, value)
+
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record"""
+
+    def format(self, record):
+        data = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+
+        for field in CONTEXT_FIELDS:
+            if getattr(record, field, None) is not None:
+                data[field] = getattr(record, field)
+
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class DailySizeRotatingFileHandler(TimedRotatingFileHandler):
+    """Rotated at midnight and whenever the file grows over `max_bytes`, rotated files are named by the time they were closed"""
+
+    def __init__(self, filename, max_bytes, backup_count):
+        super().__init__(filename, when="midnight", backupCount=backup_count, encoding="utf-8")
+        self.max_bytes = max_bytes
+        self.suffix = "%Y-%m-%d_%H-%M-%S"
+        # rotated files of the same second get a counter, see rotation_filename
+        self.extMatch = re.compile(r"^\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2}(\.\d+)?$", re.ASCII)
+
+    def shouldRollover(self, record):
+        if super().shouldRollover(record):
+            return True
+
+        return self.stream is not None and self.stream.tell() >= self.max_bytes
+
+    def rotation_filename(self, default_name):
+        name = f"{self.baseFilename}.{time.strftime(self.suffix)}"
+        number = 0
+        while os.path.exists(name if not number else f"{name}.{number}"):
+            number += 1
+        return name if not number else f"{name}.{number}"
+
+
+def setup():
+    """Send records of all loggers through the queue to the rotated file"""
+
+    global listener
+
+    file_handler = DailySizeRotatingFileHandler(CONFIG.LOG_FILE, CONFIG.LOG_MAX_BYTES, CONFIG.LOG_BACKUP_COUNT)
+    file_handler.setFormatter(JsonFormatter())
+
+    records = queue.SimpleQueue()
+    listener = QueueListener(records, file_handler, respect_handler_level=True)
+    listener.start()
+
+    logging.basicConfig(level=logging.INFO, handlers=[ContextQueueHandler(records)], force=True)
+
+
+def stop():
+    """Write queued records and stop the listener thread"""
+
+    global listener
+
+    if listener is not None:
+        listener.stop()
+        listener = None
+
+
+def named(callback):
+    @functools.wraps(callback)
+    async def named_callback(update, context):
+        token = log_context.set({
+            "user_id": update.effective_user.id if update.effective_user else None,
+            "order_id": context.user_data.get("order_id") if context.user_data is not None else None,
+            "handler": callback.__name__,
+        })
+        try:
+            return await callback(update, context)
+        finally:
+            log_context.reset(token)
+
+    return named_callback
+
+
+def name_handlers(application: Application):
+    """Make records logged by handlers carry user_id, order_id and handler name"""
+
+    named_handlers = set()
+
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            if isinstance(handler, ConversationHandler):
+                callback_handlers = handler.entry_points + handler.fallbacks
+                for state_handlers in handler.states.values():
+                    callback_handlers += state_handlers
+            else:
+                callback_handlers = [handler]
+
+            for callback_handler in callback_handlers:
+                if id(callback_handler) not in named_handlers:
+                    named_handlers.add(id(callback_handler))
+                    callback_handler.callback = named(callback_handler.callback)
+                    if isinstance(callback_handler, Router):
+                        callback_handler.routes = {code: named(callback) for code, callback in callback_handler.routes.items()}
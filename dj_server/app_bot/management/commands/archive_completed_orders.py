@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+import dj_server.config as CONFIG
+
+from app_bot.models import CompletedOrder, ArchivedCompletedOrder
+
+
+class Command(BaseCommand):
+    help = "Move completed orders older than given age into archive table in chunks"
+
+    # url checks import views, which need the running bot
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=CONFIG.COMPLETED_ORDER_ARCHIVE_AGE.days,
+            help="archive orders completed more than this number of days ago"
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=CONFIG.COMPLETED_ORDER_ARCHIVE_BATCH_SIZE,
+            help="orders moved per transaction"
+        )
+
+    def handle(self, *args, **options):
+        completed_before = datetime.now(timezone.utc) - timedelta(days=options["days"])
+        batch_size = options["batch_size"]
+
+        archived_count = 0
+
+        while True:
+            with transaction.atomic():
+                orders = list(
+                    CompletedOrder.objects.filter(completed_time__lt=completed_before)
+                    .order_by("order_id")[:batch_size]
+                )
+                if not orders:
+                    break
+
+                ArchivedCompletedOrder.objects.bulk_create(
+                    [
+                        ArchivedCompletedOrder(
+                            order_id=order.order_id,
+                            user_id=order.user_id,
+                            parts=order.parts,
+                            cost=order.cost,
+                            ordered_time=order.ordered_time,
+                            accepted_time=order.accepted_time,
+                            completed_time=order.completed_time
+                        ) for order in orders
+                    ],
+                    ignore_conflicts=True
+                )
+                CompletedOrder.objects.filter(order_id__in=[order.order_id for order in orders]).delete()
+
+            archived_count += len(orders)
+            self.stdout.write(f"{archived_count} orders archived")
+
+            if len(orders) < batch_size:
+                break
+
+        self.stdout.write(self.style.SUCCESS(f"done, {archived_count} orders archived"))
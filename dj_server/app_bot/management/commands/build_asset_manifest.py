@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from app_bot.assets import bot_image_names, build_manifest
+from app_bot.models import Part
+
+
+class Command(BaseCommand):
+    help = "Save content hashes of bot images and part photos used in their URLs"
+
+    # url checks import views, which need the running bot
+    requires_system_checks = []
+
+    def handle(self, *args, **options):
+        static_names = bot_image_names()
+        media_names = list(Part.objects.exclude(image="").values_list("image", flat=True).distinct())
+
+        files_count = build_manifest(static_names, media_names)
+
+        self.stdout.write(self.style.SUCCESS(f"done, {files_count} files hashed"))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+import dj_server.config as CONFIG
+
+from app_bot.analytics import rollup_completed_orders
+
+
+class Command(BaseCommand):
+    help = "Roll up orders completed since the last rollup into daily sales tables"
+
+    # url checks import views, which need the running bot
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=CONFIG.ANALYTICS_ROLLUP_BATCH_SIZE,
+            help="orders rolled up per transaction"
+        )
+
+    def handle(self, *args, **options):
+        rolled_up_count = rollup_completed_orders(batch_size=options["batch_size"])
+
+        self.stdout.write(self.style.SUCCESS(f"done, {rolled_up_count} orders rolled up"))
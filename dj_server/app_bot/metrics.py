@@ -0,0 +1,64 @@
+import time
+from collections import deque
+
+from telegram.ext import SimpleUpdateProcessor
+
+# Live counters of the bot process, reported by the health endpoint
+
+enqueued_times = dict()     # update_id -> monotonic time the update was put into update_queue
+handlers_in_progress = 0
+notification_backlog = 0    # notifications which are going to be sent but aren't sent yet
+throttled_updates = 0       # updates dropped because users sent them too often
+coalesced_updates = 0       # navigation callbacks superseded by later ones of the same user
+outbound_waiting = 0        # bot API requests waiting for their turn
+outbound_retries = 0        # bot API requests repeated after flood limit errors
+outbound_delays = {         # seconds recent bot API requests waited for their turn, by priority
+    "interactive": deque(maxlen=1000),
+    "notification": deque(maxlen=1000),
+}
+
+
+def update_enqueued(update):
+    """Remember when the update was put into update_queue"""
+
+    enqueued_times[update.update_id] = time.monotonic()
+
+
+def update_dequeued(update):
+    """Forget the update which left update_queue"""
+
+    enqueued_times.pop(getattr(update, "update_id", None), None)
+
+
+def outbound_delay(priority_name: str):
+    """Average and maximum seconds recent bot API requests of the priority waited for their turn"""
+
+    delays = list(outbound_delays[priority_name])
+    if not delays:
+        return 0.0, 0.0
+    return sum(delays) / len(delays), max(delays)
+
+
+def oldest_update_age():
+    """Seconds the oldest update is waiting in update_queue"""
+
+    for enqueued_time in enqueued_times.values():
+        return time.monotonic() - enqueued_time
+    return 0.0
+
+
+class MeteredUpdateProcessor(SimpleUpdateProcessor):
+    """Update processor which counts updates taken from update_queue and handlers in progress"""
+
+    __slots__ = ()
+
+    async def do_process_update(self, update, coroutine):
+        global handlers_in_progress
+
+        update_dequeued(update)
+
+        handlers_in_progress += 1
+        try:
+            await coroutine
+        finally:
+            handlers_in_progress -= 1
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.3 on 2026-10-19 16:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_bot', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Reservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='зарезервированное количество')),
+                ('expires_time', models.DateTimeField(verbose_name='резерв действует до')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app_bot.order', verbose_name='заказ в корзине')),
+                ('part', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app_bot.part', verbose_name='товар')),
+            ],
+            options={
+                'verbose_name': 'резерв товара',
+                'verbose_name_plural': 'резервы товаров',
+                'indexes': [models.Index(fields=['part', 'expires_time'], name='reservation_part_expires_idx'), models.Index(fields=['expires_time'], name='reservation_expires_idx')],
+                'constraints': [models.UniqueConstraint(fields=('order', 'part'), name='unique_reservation_order_part')],
+            },
+        ),
+    ]
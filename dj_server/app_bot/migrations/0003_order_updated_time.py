@@ -0,0 +1,19 @@
+# Generated by Django 5.1.3 on 2026-10-19 16:23
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_bot', '0002_reservation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='updated_time',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='время изменения корзины'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.3 on 2026-10-19 16:24
+
+import datetime
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_bot', '0003_order_updated_time'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='completedorder',
+            name='completed_time',
+            field=models.DateTimeField(db_index=True, default=datetime.datetime(1970, 1, 1, 0, 0, tzinfo=datetime.timezone.utc), verbose_name='время доставки'),
+        ),
+        migrations.CreateModel(
+            name='ArchivedCompletedOrder',
+            fields=[
+                ('order_id', models.BigIntegerField(primary_key=True, serialize=False, verbose_name='номер заказа')),
+                ('parts', models.JSONField(default=dict, verbose_name='товары в заказе')),
+                ('cost', models.FloatField(default=0.0, verbose_name='стоимость заказа')),
+                ('ordered_time', models.DateTimeField(default=datetime.datetime(1970, 1, 1, 0, 0, tzinfo=datetime.timezone.utc), verbose_name='время оформления')),
+                ('accepted_time', models.DateTimeField(default=datetime.datetime(1970, 1, 1, 0, 0, tzinfo=datetime.timezone.utc), verbose_name='время принятия')),
+                ('completed_time', models.DateTimeField(db_index=True, default=datetime.datetime(1970, 1, 1, 0, 0, tzinfo=datetime.timezone.utc), verbose_name='время доставки')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app_bot.user', verbose_name='пользователь в тг')),
+            ],
+            options={
+                'verbose_name': 'архивный заказ',
+                'verbose_name_plural': 'архивные заказы',
+                'indexes': [models.Index(fields=['user', 'order_id'], name='archived_order_user_idx')],
+            },
+        ),
+    ]
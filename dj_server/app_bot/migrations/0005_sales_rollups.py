@@ -0,0 +1,85 @@
+# Generated by Django 5.1.3 on 2026-10-19 16:25
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_bot', '0004_archived_completed_order'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerSales',
+            fields=[
+                ('user_id', models.BigIntegerField(primary_key=True, serialize=False, verbose_name='ID пользователя в тг')),
+                ('orders_count', models.PositiveIntegerField(db_index=True, default=0, verbose_name='заказов')),
+                ('first_order_day', models.DateField(verbose_name='день первого заказа')),
+            ],
+            options={
+                'verbose_name': 'покупатель',
+                'verbose_name_plural': 'покупатели',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('day', models.DateField(primary_key=True, serialize=False, verbose_name='день')),
+                ('orders_count', models.PositiveIntegerField(default=0, verbose_name='заказов')),
+                ('items_count', models.PositiveIntegerField(default=0, verbose_name='товаров')),
+                ('revenue', models.FloatField(default=0.0, verbose_name='выручка')),
+                ('repeat_orders_count', models.PositiveIntegerField(default=0, verbose_name='повторных заказов')),
+                ('accept_seconds', models.BigIntegerField(default=0, verbose_name='сумма времени до принятия, с')),
+                ('complete_seconds', models.BigIntegerField(default=0, verbose_name='сумма времени доставки, с')),
+            ],
+            options={
+                'verbose_name': 'продажи за день',
+                'verbose_name_plural': 'продажи по дням',
+            },
+        ),
+        migrations.CreateModel(
+            name='RollupCursor',
+            fields=[
+                ('name', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='имя')),
+                ('completed_time', models.DateTimeField(default=datetime.datetime(1970, 1, 1, 0, 0, tzinfo=datetime.timezone.utc), verbose_name='время доставки последнего заказа')),
+                ('order_id', models.BigIntegerField(default=0, verbose_name='номер последнего заказа')),
+            ],
+            options={
+                'verbose_name': 'позиция сводки',
+                'verbose_name_plural': 'позиции сводок',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyCategorySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='день')),
+                ('category', models.CharField(max_length=64, verbose_name='категория')),
+                ('items_count', models.PositiveIntegerField(default=0, verbose_name='товаров')),
+                ('revenue', models.FloatField(default=0.0, verbose_name='выручка')),
+            ],
+            options={
+                'verbose_name': 'продажи категории за день',
+                'verbose_name_plural': 'продажи по категориям',
+                'constraints': [models.UniqueConstraint(fields=('day', 'category'), name='unique_daily_category_sales')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyPartSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='день')),
+                ('part_id', models.BigIntegerField(verbose_name='ID товара')),
+                ('name', models.CharField(default='', max_length=64, verbose_name='имя')),
+                ('items_count', models.PositiveIntegerField(default=0, verbose_name='товаров')),
+                ('revenue', models.FloatField(default=0.0, verbose_name='выручка')),
+            ],
+            options={
+                'verbose_name': 'продажи товара за день',
+                'verbose_name_plural': 'продажи по товарам',
+                'constraints': [models.UniqueConstraint(fields=('day', 'part_id'), name='unique_daily_part_sales')],
+            },
+        ),
+    ]
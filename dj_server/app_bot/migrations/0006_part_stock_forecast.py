@@ -0,0 +1,54 @@
+# Generated by Django 5.1.3 on 2026-10-19 16:28
+
+import datetime
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_bot', '0005_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PartStockForecast',
+            fields=[
+                ('part', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='app_bot.part', verbose_name='товар')),
+                ('sales_velocity', models.FloatField(default=0.0, verbose_name='скорость продаж, шт./день')),
+                ('updated_time', models.DateTimeField(default=django.utils.timezone.now, verbose_name='время расчета скорости')),
+                ('alerted_time', models.DateTimeField(blank=True, null=True, verbose_name='время последнего уведомления')),
+            ],
+            options={
+                'verbose_name': 'прогноз остатка',
+                'verbose_name_plural': 'прогнозы остатков',
+            },
+        ),
+        migrations.RenameField(
+            model_name='rollupcursor',
+            old_name='completed_time',
+            new_name='time',
+        ),
+        migrations.AlterField(
+            model_name='rollupcursor',
+            name='time',
+            field=models.DateTimeField(default=datetime.datetime(1970, 1, 1, 0, 0, tzinfo=datetime.timezone.utc), verbose_name='время последнего заказа'),
+        ),
+        migrations.AlterField(
+            model_name='archivedcompletedorder',
+            name='ordered_time',
+            field=models.DateTimeField(db_index=True, default=datetime.datetime(1970, 1, 1, 0, 0, tzinfo=datetime.timezone.utc), verbose_name='время оформления'),
+        ),
+        migrations.AlterField(
+            model_name='completedorder',
+            name='ordered_time',
+            field=models.DateTimeField(db_index=True, default=datetime.datetime(1970, 1, 1, 0, 0, tzinfo=datetime.timezone.utc), verbose_name='время оформления'),
+        ),
+        migrations.AlterField(
+            model_name='confirmedorder',
+            name='ordered_time',
+            field=models.DateTimeField(db_index=True, default=datetime.datetime(1970, 1, 1, 0, 0, tzinfo=datetime.timezone.utc), verbose_name='время оформления'),
+        ),
+    ]
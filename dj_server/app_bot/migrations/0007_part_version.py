@@ -0,0 +1,54 @@
+# Generated by Django 5.1.3 on 2026-10-19 16:30
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def create_initial_versions(apps, schema_editor):
+    Part = apps.get_model("app_bot", "Part")
+    PartVersion = apps.get_model("app_bot", "PartVersion")
+
+    for part in Part.objects.filter(version__isnull=True).iterator():
+        version = PartVersion.objects.create(
+            part_id=part.part_id,
+            name=part.name,
+            category=part.category,
+            description=part.description,
+            price=part.price,
+            image=part.image.url,
+        )
+        Part.objects.filter(part_id=part.part_id).update(version=version)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_bot', '0006_part_stock_forecast'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PartVersion',
+            fields=[
+                ('version_id', models.BigAutoField(primary_key=True, serialize=False, verbose_name='ID версии')),
+                ('part_id', models.BigIntegerField(db_index=True, verbose_name='ID товара')),
+                ('name', models.CharField(default='', max_length=64, verbose_name='имя')),
+                ('category', models.CharField(default='OTHER', max_length=64, verbose_name='категория')),
+                ('description', models.TextField(default='', max_length=256, verbose_name='описание')),
+                ('price', models.FloatField(default=0.0, verbose_name='цена')),
+                ('image', models.CharField(default='', max_length=256, verbose_name='url фото')),
+                ('created_time', models.DateTimeField(default=django.utils.timezone.now, verbose_name='время создания')),
+            ],
+            options={
+                'verbose_name': 'версия товара',
+                'verbose_name_plural': 'версии товаров',
+            },
+        ),
+        migrations.AddField(
+            model_name='part',
+            name='version',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='app_bot.partversion', verbose_name='текущая версия'),
+        ),
+        migrations.RunPython(create_initial_versions, migrations.RunPython.noop),
+    ]
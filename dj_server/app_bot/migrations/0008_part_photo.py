@@ -0,0 +1,24 @@
+# Generated by Django 5.1.3 on 2026-10-19 16:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_bot', '0007_part_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PartPhoto',
+            fields=[
+                ('image', models.CharField(max_length=256, primary_key=True, serialize=False, verbose_name='путь к фото')),
+                ('file_id', models.CharField(max_length=256, verbose_name='ID файла в тг')),
+            ],
+            options={
+                'verbose_name': 'фото товара в тг',
+                'verbose_name_plural': 'фото товаров в тг',
+            },
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.1.3 on 2026-10-19 16:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_bot', '0008_part_photo'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='archivedcompletedorder',
+            name='cost',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='стоимость заказа'),
+        ),
+        migrations.AlterField(
+            model_name='completedorder',
+            name='cost',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='стоимость заказа'),
+        ),
+        migrations.AlterField(
+            model_name='confirmedorder',
+            name='cost',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='стоимость заказа'),
+        ),
+        migrations.AlterField(
+            model_name='dailycategorysales',
+            name='revenue',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='выручка'),
+        ),
+        migrations.AlterField(
+            model_name='dailypartsales',
+            name='revenue',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='выручка'),
+        ),
+        migrations.AlterField(
+            model_name='dailysales',
+            name='revenue',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='выручка'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='cost',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='стоимость корзины'),
+        ),
+        migrations.AlterField(
+            model_name='part',
+            name='price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='цена'),
+        ),
+        migrations.AlterField(
+            model_name='partversion',
+            name='price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='цена'),
+        ),
+    ]
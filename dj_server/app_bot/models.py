@@ -1,6 +1,7 @@
 import datetime
 
 from django.db import models
+from django.utils import timezone
 
 from dj_server.config import CATEGORY_CHOICES, DEFAULT_PART_IMAGE
 
@@ -37,7 +38,7 @@ class Part(models.Model):
     name = models.CharField(max_length=64, default="", verbose_name="имя")
     category = models.CharField(max_length=64, choices=CATEGORY_CHOICES, default="OTHER", verbose_name="категория")
     description = models.TextField(max_length=256, default="", verbose_name="описание")
-    price = models.FloatField(default=0.0, verbose_name="цена")
+    price = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="цена")
     available_count = models.PositiveIntegerField(default=0, verbose_name="доступное количество")
     image = models.ImageField(
         upload_to="",
@@ -45,29 +46,83 @@ class Part(models.Model):
         verbose_name="фото",
         max_length=256
     )
+    version = models.ForeignKey(
+        "PartVersion",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name="+",
+        verbose_name="текущая версия"
+    )
 
     class Meta:
         verbose_name = "товар"
         verbose_name_plural = "товары"
+
+
+# append-only snapshots of part data, which order lines refer to
+class PartVersion(models.Model):
+    version_id = models.BigAutoField(primary_key=True, verbose_name="ID версии")
+    part_id = models.BigIntegerField(db_index=True, verbose_name="ID товара")
+    name = models.CharField(max_length=64, default="", verbose_name="имя")
+    category = models.CharField(max_length=64, default="OTHER", verbose_name="категория")
+    description = models.TextField(max_length=256, default="", verbose_name="описание")
+    price = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="цена")
+    image = models.CharField(max_length=256, default="", verbose_name="url фото")
+    created_time = models.DateTimeField(default=timezone.now, verbose_name="время создания")
+
+    class Meta:
+        verbose_name = "версия товара"
+        verbose_name_plural = "версии товаров"
     
 
+# telegram file ids of uploaded part photos, so photos are uploaded once
+class PartPhoto(models.Model):
+    image = models.CharField(max_length=256, primary_key=True, verbose_name="путь к фото")
+    file_id = models.CharField(max_length=256, verbose_name="ID файла в тг")
+
+    class Meta:
+        verbose_name = "фото товара в тг"
+        verbose_name_plural = "фото товаров в тг"
+
+
 class Order(models.Model):
     order_id = models.BigAutoField(primary_key=True, verbose_name="номер заказа")
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="пользователь в тг")
     parts = models.JSONField(default=dict, verbose_name="товары в корзине")
-    cost = models.FloatField(default=0.0, verbose_name="стоимость корзины")
+    cost = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="стоимость корзины")
+    updated_time = models.DateTimeField(default=timezone.now, db_index=True, verbose_name="время изменения корзины")
 
     class Meta:
         verbose_name = "заказ в корзине"
         verbose_name_plural = "заказы в корзине"
 
 
+class Reservation(models.Model):
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, verbose_name="заказ в корзине")
+    part = models.ForeignKey(Part, on_delete=models.CASCADE, verbose_name="товар")
+    count = models.PositiveIntegerField(default=0, verbose_name="зарезервированное количество")
+    expires_time = models.DateTimeField(verbose_name="резерв действует до")
+
+    class Meta:
+        verbose_name = "резерв товара"
+        verbose_name_plural = "резервы товаров"
+        constraints = [
+            models.UniqueConstraint(fields=["order", "part"], name="unique_reservation_order_part")
+        ]
+        indexes = [
+            models.Index(fields=["part", "expires_time"], name="reservation_part_expires_idx"),
+            models.Index(fields=["expires_time"], name="reservation_expires_idx")
+        ]
+
+
 class ConfirmedOrder(models.Model):
     order_id = models.BigIntegerField(primary_key=True, verbose_name="номер заказа")
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="пользователь в тг")
     parts = models.JSONField(default=dict, verbose_name="товары в заказе")
-    cost = models.FloatField(default=0.0, verbose_name="стоимость заказа")
-    ordered_time = models.DateTimeField(default=datetime.datetime.fromtimestamp(0, tz=datetime.timezone.utc), verbose_name="время оформления")
+    cost = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="стоимость заказа")
+    ordered_time = models.DateTimeField(default=datetime.datetime.fromtimestamp(0, tz=datetime.timezone.utc), db_index=True, verbose_name="время оформления")
     is_accepted = models.BooleanField(default=False, verbose_name="заказ принят?")
     accepted_time = models.DateTimeField(default=datetime.datetime.fromtimestamp(0, tz=datetime.timezone.utc), verbose_name="время принятия")
 
@@ -76,15 +131,104 @@ class ConfirmedOrder(models.Model):
         verbose_name_plural = "выполняемые заказы"
 
 
-class CompletedOrder(models.Model):
+class AbstractCompletedOrder(models.Model):
     order_id = models.BigIntegerField(primary_key=True, verbose_name="номер заказа")
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="пользователь в тг")
     parts = models.JSONField(default=dict, verbose_name="товары в заказе")
-    cost = models.FloatField(default=0.0, verbose_name="стоимость заказа")
-    ordered_time = models.DateTimeField(default=datetime.datetime.fromtimestamp(0, tz=datetime.timezone.utc), verbose_name="время оформления")
+    cost = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="стоимость заказа")
+    ordered_time = models.DateTimeField(default=datetime.datetime.fromtimestamp(0, tz=datetime.timezone.utc), db_index=True, verbose_name="время оформления")
     accepted_time = models.DateTimeField(default=datetime.datetime.fromtimestamp(0, tz=datetime.timezone.utc), verbose_name="время принятия")
-    completed_time = models.DateTimeField(default=datetime.datetime.fromtimestamp(0, tz=datetime.timezone.utc), verbose_name="время доставки")
+    completed_time = models.DateTimeField(default=datetime.datetime.fromtimestamp(0, tz=datetime.timezone.utc), db_index=True, verbose_name="время доставки")
+
+    class Meta:
+        abstract = True
+
+
+class CompletedOrder(AbstractCompletedOrder):
 
     class Meta:
         verbose_name = "доставленный заказ"
-        verbose_name_plural = "доставленные заказы"
\ No newline at end of file
+        verbose_name_plural = "доставленные заказы"
+
+
+class ArchivedCompletedOrder(AbstractCompletedOrder):
+
+    class Meta:
+        verbose_name = "архивный заказ"
+        verbose_name_plural = "архивные заказы"
+        indexes = [
+            models.Index(fields=["user", "order_id"], name="archived_order_user_idx")
+        ]
+
+class DailySales(models.Model):
+    day = models.DateField(primary_key=True, verbose_name="день")
+    orders_count = models.PositiveIntegerField(default=0, verbose_name="заказов")
+    items_count = models.PositiveIntegerField(default=0, verbose_name="товаров")
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="выручка")
+    repeat_orders_count = models.PositiveIntegerField(default=0, verbose_name="повторных заказов")
+    accept_seconds = models.BigIntegerField(default=0, verbose_name="сумма времени до принятия, с")
+    complete_seconds = models.BigIntegerField(default=0, verbose_name="сумма времени доставки, с")
+
+    class Meta:
+        verbose_name = "продажи за день"
+        verbose_name_plural = "продажи по дням"
+
+
+class DailyCategorySales(models.Model):
+    day = models.DateField(verbose_name="день")
+    category = models.CharField(max_length=64, verbose_name="категория")
+    items_count = models.PositiveIntegerField(default=0, verbose_name="товаров")
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="выручка")
+
+    class Meta:
+        verbose_name = "продажи категории за день"
+        verbose_name_plural = "продажи по категориям"
+        constraints = [
+            models.UniqueConstraint(fields=["day", "category"], name="unique_daily_category_sales")
+        ]
+
+
+class DailyPartSales(models.Model):
+    day = models.DateField(verbose_name="день")
+    part_id = models.BigIntegerField(verbose_name="ID товара")
+    name = models.CharField(max_length=64, default="", verbose_name="имя")
+    items_count = models.PositiveIntegerField(default=0, verbose_name="товаров")
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="выручка")
+
+    class Meta:
+        verbose_name = "продажи товара за день"
+        verbose_name_plural = "продажи по товарам"
+        constraints = [
+            models.UniqueConstraint(fields=["day", "part_id"], name="unique_daily_part_sales")
+        ]
+
+
+class CustomerSales(models.Model):
+    user_id = models.BigIntegerField(primary_key=True, verbose_name="ID пользователя в тг")
+    orders_count = models.PositiveIntegerField(default=0, db_index=True, verbose_name="заказов")
+    first_order_day = models.DateField(verbose_name="день первого заказа")
+
+    class Meta:
+        verbose_name = "покупатель"
+        verbose_name_plural = "покупатели"
+
+
+class RollupCursor(models.Model):
+    name = models.CharField(max_length=64, primary_key=True, verbose_name="имя")
+    time = models.DateTimeField(default=datetime.datetime.fromtimestamp(0, tz=datetime.timezone.utc), verbose_name="время последнего заказа")
+    order_id = models.BigIntegerField(default=0, verbose_name="номер последнего заказа")
+
+    class Meta:
+        verbose_name = "позиция сводки"
+        verbose_name_plural = "позиции сводок"
+
+
+class PartStockForecast(models.Model):
+    part = models.OneToOneField(Part, on_delete=models.CASCADE, primary_key=True, verbose_name="товар")
+    sales_velocity = models.FloatField(default=0.0, verbose_name="скорость продаж, шт./день")
+    updated_time = models.DateTimeField(default=timezone.now, verbose_name="время расчета скорости")
+    alerted_time = models.DateTimeField(null=True, blank=True, verbose_name="время последнего уведомления")
+
+    class Meta:
+        verbose_name = "прогноз остатка"
+        verbose_name_plural = "прогнозы остатков"
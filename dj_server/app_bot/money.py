@@ -0,0 +1,23 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+# Prices, costs and revenues are Decimal with 2 places, stored in DecimalField(max_digits=12, decimal_places=2).
+# Cost of a line is an integer count times a price in whole kopecks, so it is exact and never rounded,
+# totals are exact sums of line costs. Only prices from outside (floats of order lines
+# made before prices were decimal, input) are rounded to kopecks.
+
+CENT = Decimal("0.01")
+ZERO = Decimal("0.00")
+
+
+def amount(value):
+    """Money amount of a Decimal, float, int or string"""
+
+    if not isinstance(value, Decimal):
+        # str, so that 0.1 becomes 0.10 and not 0.1000000000000000055...
+        value = Decimal(str(value))
+
+    return value.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def line_cost(count: int, price):
+    return count * amount(price)
@@ -0,0 +1,93 @@
+import asyncio
+import logging
+
+from telegram import Bot
+from telegram.constants import ParseMode
+from telegram.error import TelegramError
+
+import dj_server.config as CONFIG
+
+from . import metrics, outbound
+
+logger = logging.getLogger(__name__)
+
+# Queue of notifications sent by a worker, NOTIFICATIONS_IN_FLIGHT at once.
+# They are sent with notification priority, so the outbound scheduler lets answers to users go first.
+# enqueue() may be called from any thread, e.g. from admin site views.
+
+loop = None
+queue = None
+worker_task = None
+
+
+def put(chat_id: int, text: str):
+    metrics.notification_backlog += 1
+    queue.put_nowait((chat_id, text))
+
+
+def enqueue(chat_id: int, text: str):
+    """Queue notification to be sent by the worker"""
+
+    if loop is None:
+        logger.warning("[NOTIFICATIONS] Worker isn't running, notification to [%s] dropped", chat_id)
+        return
+
+    loop.call_soon_threadsafe(put, chat_id, text)
+
+
+async def send(bot: Bot, chat_id: int, text: str, in_flight: asyncio.Semaphore):
+    try:
+        await bot.send_message(
+            chat_id=chat_id,
+            text=text,
+            parse_mode=ParseMode.MARKDOWN,
+            rate_limit_args=outbound.NOTIFICATION
+        )
+    except TelegramError as error:
+        logger.warning("[NOTIFICATIONS] Notification to [%s] failed: %s", chat_id, error)
+    finally:
+        metrics.notification_backlog -= 1
+        queue.task_done()
+        in_flight.release()
+
+
+async def work(bot: Bot):
+    in_flight = asyncio.Semaphore(CONFIG.NOTIFICATIONS_IN_FLIGHT)
+    sending_tasks = set()
+
+    while True:
+        chat_id, text = await queue.get()
+
+        await in_flight.acquire()
+
+        task = asyncio.create_task(send(bot, chat_id, text, in_flight))
+        sending_tasks.add(task)
+        task.add_done_callback(sending_tasks.discard)
+
+
+def start(bot: Bot):
+    """Start the worker in the running loop"""
+
+    global loop, queue, worker_task
+
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    worker_task = asyncio.create_task(work(bot), name="notifications")
+
+
+async def stop(timeout: float):
+    """Send queued notifications within timeout and stop the worker"""
+
+    global loop
+
+    if worker_task is None:
+        return
+
+    try:
+        await asyncio.wait_for(queue.join(), timeout=timeout)
+    except asyncio.TimeoutError:
+        logger.warning("[NOTIFICATIONS] %s notifications weren't sent before shutdown", queue.qsize())
+
+    loop = None
+    worker_task.cancel()
+    await asyncio.gather(worker_task, return_exceptions=True)
@@ -0,0 +1,73 @@
+import logging
+from datetime import datetime, timezone
+
+from django.db import transaction
+
+from . import notifications
+from .models import ConfirmedOrder, CompletedOrder
+
+logger = logging.getLogger(__name__)
+
+# Order state changes shared by the bot admin panel and the admin site.
+# Each call changes all given orders in one transaction, users are notified through the queue.
+
+
+def accept_orders(order_ids):
+    """Accept given orders which aren't accepted yet, return accepted orders"""
+
+    accepted_time = datetime.now(timezone.utc)
+
+    with transaction.atomic():
+        orders = list(
+            ConfirmedOrder.objects.select_for_update()
+            .filter(order_id__in=list(order_ids), is_accepted=False)
+            .order_by("order_id")
+        )
+        ConfirmedOrder.objects.filter(order_id__in=[order.order_id for order in orders]).update(
+            is_accepted=True,
+            accepted_time=accepted_time
+        )
+
+    for order in orders:
+        order.is_accepted = True
+        order.accepted_time = accepted_time
+
+        notifications.enqueue(order.user_id, f"🔔 ваш заказ *№{order.order_id}*   📥  принят")
+
+    if orders:
+        logger.info("[ORDERS] Orders %s accepted", [order.order_id for order in orders])
+
+    return orders
+
+
+def complete_orders(order_ids):
+    """Move given accepted orders to completed orders, return completed orders"""
+
+    completed_time = datetime.now(timezone.utc)
+
+    with transaction.atomic():
+        orders = list(
+            ConfirmedOrder.objects.select_for_update()
+            .filter(order_id__in=list(order_ids), is_accepted=True)
+            .order_by("order_id")
+        )
+        CompletedOrder.objects.bulk_create([
+            CompletedOrder(
+                order_id=order.order_id,
+                user_id=order.user_id,
+                parts=order.parts,
+                cost=order.cost,
+                ordered_time=order.ordered_time,
+                accepted_time=order.accepted_time,
+                completed_time=completed_time
+            ) for order in orders
+        ])
+        ConfirmedOrder.objects.filter(order_id__in=[order.order_id for order in orders]).delete()
+
+    for order in orders:
+        notifications.enqueue(order.user_id, f"🔔 ваш заказ *№{order.order_id}*   ✅  завершён")
+
+    if orders:
+        logger.info("[ORDERS] Orders %s completed", [order.order_id for order in orders])
+
+    return orders
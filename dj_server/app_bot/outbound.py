@@ -0,0 +1,249 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextvars import ContextVar
+
+import httpx
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+from telegram.request import BaseRequest, HTTPXRequest
+
+import dj_server.config as CONFIG
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Scheduler of all requests to Telegram Bot API made by the bot.
+# Notifications wait for their chat's token bucket, then every request waits for a token of the global bucket,
+# global tokens are given to waiting requests in order of priority, then of arrival.
+# Interactive requests only take a chat token if there is one and never wait for their chat:
+# handlers run one at a time, so such a wait would hold up updates of all users. If a chat gets
+# more than telegram allows, its RetryAfter error pauses sending (see process_request).
+# Requests of each priority are sent through their own pool of HTTP connections.
+
+# priorities, passed as `rate_limit_args` to bot methods, interactive is the default
+INTERACTIVE = 0     # answers and edits of messages users are looking at
+NOTIFICATION = 1    # messages nobody is waiting for right now
+
+PRIORITY_NAMES = {INTERACTIVE: "interactive", NOTIFICATION: "notification"}
+
+current_priority = ContextVar("current_priority", default=INTERACTIVE)     # priority of the request being sent
+
+
+class TokenBucket:
+    """`burst` tokens refilled at `rate` per second"""
+
+    __slots__ = ("rate", "burst", "tokens", "refill_time")
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.refill_time = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.tokens + (now - self.refill_time) * self.rate, self.burst)
+        self.refill_time = now
+
+    def delay(self, now: float):
+        """Seconds until a token is available"""
+
+        self.refill(now)
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    def is_full(self, now: float):
+        self.refill(now)
+        return self.tokens >= self.burst
+
+    def take(self, now: float):
+        """Take a token, an empty bucket stays empty"""
+
+        self.refill(now)
+        self.tokens = max(self.tokens - 1, 0.0)
+
+
+class PriorityRateLimiter(BaseRateLimiter[int]):
+    """Keeps requests within per-chat and global limits, interactive requests go first"""
+
+    __slots__ = (
+        "global_bucket", "chat_buckets", "chat_queues", "waiting", "sequence", "wakeup", "paused_until", "dispatcher_task"
+    )
+
+    def __init__(self):
+        self.global_bucket = TokenBucket(CONFIG.OUTBOUND_PER_SECOND, CONFIG.OUTBOUND_BURST)
+        self.chat_buckets = dict()      # chat_id -> TokenBucket
+        self.chat_queues = dict()       # chat_id -> [lock taken in order of arrival, number of notifications in it]
+        self.waiting = []               # heap of (priority, sequence, future) waiting for a global token
+        self.sequence = itertools.count()
+        self.wakeup = None
+        self.paused_until = 0.0         # monotonic time until which telegram asked not to send anything
+        self.dispatcher_task = None
+
+    async def initialize(self):
+        self.wakeup = asyncio.Event()
+        self.dispatcher_task = asyncio.create_task(self.dispatch(), name="outbound")
+
+    async def shutdown(self):
+        if self.dispatcher_task is None:
+            return
+
+        self.dispatcher_task.cancel()
+        await asyncio.gather(self.dispatcher_task, return_exceptions=True)
+        self.dispatcher_task = None
+
+    async def dispatch(self):
+        """Give global tokens to waiting requests"""
+
+        while True:
+            if not self.waiting:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+
+            now = time.monotonic()
+            delay = max(self.paused_until - now, self.global_bucket.delay(now))
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            _, _, future = heapq.heappop(self.waiting)
+            if future.done():   # the request was cancelled while waiting
+                continue
+
+            self.global_bucket.tokens -= 1
+            future.set_result(None)
+
+    def chat_bucket(self, chat_id):
+        if chat_id not in self.chat_buckets and len(self.chat_buckets) >= CONFIG.OUTBOUND_MAX_CHATS:
+            now = time.monotonic()
+
+            # buckets of idle chats are full again, they are the same as new ones
+            for idle_chat_id in [
+                bucket_chat_id for bucket_chat_id, bucket in self.chat_buckets.items()
+                if bucket.is_full(now)
+            ]:
+                del self.chat_buckets[idle_chat_id]
+
+        return self.chat_buckets.setdefault(chat_id, TokenBucket(CONFIG.OUTBOUND_CHAT_RATE, CONFIG.OUTBOUND_CHAT_BURST))
+
+    async def wait_for_chat(self, chat_id):
+        """Wait for a token of the chat after notifications queued to it before"""
+
+        queue = self.chat_queues.setdefault(chat_id, [asyncio.Lock(), 0])
+        queue[1] += 1
+        try:
+            async with queue[0]:
+                # tokens aren't reserved in advance, so notifications waiting for a chat don't delay its edits
+                while (delay := self.chat_bucket(chat_id).delay(time.monotonic())) > 0:
+                    await asyncio.sleep(delay)
+
+                self.chat_bucket(chat_id).take(time.monotonic())
+        finally:
+            queue[1] -= 1
+            if not queue[1]:
+                del self.chat_queues[chat_id]
+
+    async def wait_for_turn(self, priority: int, chat_id):
+        if chat_id is not None and priority != INTERACTIVE:
+            await self.wait_for_chat(chat_id)
+        elif chat_id is not None:
+            self.chat_bucket(chat_id).take(time.monotonic())
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiting, (priority, next(self.sequence), future))
+        self.wakeup.set()
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        priority = INTERACTIVE if rate_limit_args is None else rate_limit_args
+        chat_id = data.get("chat_id")
+
+        for attempt in range(CONFIG.OUTBOUND_MAX_RETRIES + 1):
+            queued_time = time.monotonic()
+
+            metrics.outbound_waiting += 1
+            try:
+                await self.wait_for_turn(priority, chat_id)
+            finally:
+                metrics.outbound_waiting -= 1
+
+            metrics.outbound_delays[PRIORITY_NAMES[priority]].append(time.monotonic() - queued_time)
+
+            priority_token = current_priority.set(priority)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as error:
+                if attempt == CONFIG.OUTBOUND_MAX_RETRIES:
+                    raise
+
+                # flood limits of telegram are shared by all requests, so everything waits
+                metrics.outbound_retries += 1
+                self.paused_until = max(self.paused_until, time.monotonic() + error.retry_after)
+
+                logger.warning("[OUTBOUND] %s hit flood limit, requests paused for %ss", endpoint, error.retry_after)
+            finally:
+                current_priority.reset(priority_token)
+
+
+def make_pool(pool_size: int):
+    """HTTP client for bot API with `pool_size` kept alive connections"""
+
+    return HTTPXRequest(
+        connection_pool_size=pool_size,
+        connect_timeout=CONFIG.BOT_API_CONNECT_TIMEOUT,
+        read_timeout=CONFIG.BOT_API_READ_TIMEOUT,
+        write_timeout=CONFIG.BOT_API_WRITE_TIMEOUT,
+        pool_timeout=CONFIG.BOT_API_POOL_TIMEOUT,
+        http_version=CONFIG.BOT_API_HTTP_VERSION,
+        httpx_kwargs={
+            "limits": httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=pool_size,
+                keepalive_expiry=CONFIG.BOT_API_KEEPALIVE_EXPIRY,
+            ),
+        },
+    )
+
+
+class PriorityPoolsRequest(BaseRequest):
+    """Sends requests of each priority through its own connection pool,
+    so background sends never take connections needed by answers to users"""
+
+    __slots__ = ("pools",)
+
+    def __init__(self):
+        self.pools = {
+            INTERACTIVE: make_pool(CONFIG.BOT_API_INTERACTIVE_POOL_SIZE),
+            NOTIFICATION: make_pool(CONFIG.BOT_API_NOTIFICATION_POOL_SIZE),
+        }
+
+    @property
+    def read_timeout(self):
+        return CONFIG.BOT_API_READ_TIMEOUT
+
+    async def initialize(self):
+        await asyncio.gather(*(pool.initialize() for pool in self.pools.values()))
+
+    async def shutdown(self):
+        await asyncio.gather(*(pool.shutdown() for pool in self.pools.values()))
+
+    async def do_request(self, url, method, request_data=None, read_timeout=BaseRequest.DEFAULT_NONE,
+                         write_timeout=BaseRequest.DEFAULT_NONE, connect_timeout=BaseRequest.DEFAULT_NONE,
+                         pool_timeout=BaseRequest.DEFAULT_NONE):
+        return await self.pools[current_priority.get()].do_request(
+            url=url,
+            method=method,
+            request_data=request_data,
+            read_timeout=read_timeout,
+            write_timeout=write_timeout,
+            connect_timeout=connect_timeout,
+            pool_timeout=pool_timeout,
+        )
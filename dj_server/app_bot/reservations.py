@@ -0,0 +1,79 @@
+import logging
+from datetime import datetime, timezone
+
+from django.db.models import Sum
+
+import dj_server.config as CONFIG
+
+from .models import Part, Reservation
+
+logger = logging.getLogger(__name__)
+
+# Soft holds on part stock for parts added to carts (STOCK_RESERVATION_ENABLED).
+# Stock itself is decremented only on order confirmation, holds just hide it from other carts.
+
+
+async def apply_available_to_sell(part: Part, order_id: int):
+    """Replace part's available count with count which isn't held by other carts"""
+
+    if not CONFIG.STOCK_RESERVATION_ENABLED or hasattr(part, "reserved_count"):
+        return
+
+    reserved = await Reservation.objects.filter(
+        part_id=part.part_id,
+        expires_time__gt=datetime.now(timezone.utc)
+    ).exclude(order_id=order_id).aaggregate(count=Sum("count"))
+
+    part.reserved_count = reserved["count"] or 0
+    part.available_count = max(part.available_count - part.reserved_count, 0)
+
+
+async def hold(order_id: int, part_id: int, count: int):
+    """Hold count of the part for the cart, prolonging the hold, or release it on zero count"""
+
+    if not CONFIG.STOCK_RESERVATION_ENABLED:
+        return
+
+    if count > 0:
+        await Reservation.objects.aupdate_or_create(
+            order_id=order_id,
+            part_id=part_id,
+            defaults={
+                "count": count,
+                "expires_time": datetime.now(timezone.utc) + CONFIG.STOCK_RESERVATION_TTL
+            }
+        )
+    else:
+        await Reservation.objects.filter(order_id=order_id, part_id=part_id).adelete()
+
+
+async def release(order_id: int):
+    """Release all holds of the cart"""
+
+    if not CONFIG.STOCK_RESERVATION_ENABLED:
+        return
+
+    await Reservation.objects.filter(order_id=order_id).adelete()
+
+
+def sweep_expired():
+    """Delete expired holds in batches"""
+
+    deleted_count = 0
+
+    while True:
+        expired_ids = list(
+            Reservation.objects.filter(expires_time__lte=datetime.now(timezone.utc))
+            .values_list("id", flat=True)[:CONFIG.STOCK_RESERVATION_SWEEP_BATCH_SIZE]
+        )
+        if not expired_ids:
+            break
+
+        Reservation.objects.filter(id__in=expired_ids).delete()
+        deleted_count += len(expired_ids)
+
+        if len(expired_ids) < CONFIG.STOCK_RESERVATION_SWEEP_BATCH_SIZE:
+            break
+
+    if deleted_count:
+        logger.info("[RESERVATION] %s expired holds released", deleted_count)
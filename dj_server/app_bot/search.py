@@ -0,0 +1,72 @@
+import re
+from collections import OrderedDict
+
+import dj_server.config as CONFIG
+
+from . import cache
+
+# Inline search over the catalog snapshot: index of word prefixes and LRU of query results,
+# both rebuilt lazily when parts join or leave the catalog or their names or categories change, not on stock changes.
+# The snapshot is changed by admin site signals in worker threads, so the index is built from a copy of it.
+
+MAX_PREFIX_LENGTH = 32
+
+index = dict()              # word prefix -> set of part ids
+results = OrderedDict()     # normalized query -> sorted part ids, least recently used first
+indexed_search_version = None
+
+
+def words(text: str):
+    return re.findall(r"\w+", text.lower())
+
+
+def part_words(part):
+    return words(part.name) + words(CONFIG.CATEGORY_CHOICES.get(part.category, part.category)) + [str(part.part_id)]
+
+
+def build_index():
+    global indexed_search_version
+
+    search_version = cache.search_version
+
+    index.clear()
+    results.clear()
+
+    for part in list(cache.parts.values()):
+        for word in part_words(part):
+            for length in range(1, min(len(word), MAX_PREFIX_LENGTH) + 1):
+                index.setdefault(word[:length], set()).add(part.part_id)
+
+    indexed_search_version = search_version
+
+
+def find_part_ids(query_words: list):
+    if not query_words:
+        return sorted(cache.parts)
+
+    part_ids = None
+    for word in query_words:
+        matches = index.get(word[:MAX_PREFIX_LENGTH], set())
+        part_ids = matches if part_ids is None else part_ids & matches
+
+    return sorted(part_ids)
+
+
+def search(query: str):
+    """Available parts with words starting with each word of the query"""
+
+    if indexed_search_version != cache.search_version:
+        build_index()
+
+    query_words = sorted(set(words(query)))
+    key = " ".join(query_words)
+
+    if key in results:
+        results.move_to_end(key)
+    else:
+        results[key] = find_part_ids(query_words)
+        if len(results) > CONFIG.INLINE_RESULTS_CACHE_SIZE:
+            results.popitem(last=False)
+
+    parts = [cache.parts.get(part_id) for part_id in results[key]]
+    return [part for part in parts if part is not None]
@@ -0,0 +1,255 @@
+import gc
+import logging
+import sys
+import time
+from collections import OrderedDict
+from types import MappingProxyType
+
+from telegram import Update
+from telegram.ext import Application, ContextTypes, ConversationHandler
+
+import dj_server.config as CONFIG
+
+from . import throttling
+
+logger = logging.getLogger(__name__)
+
+# Memory of the bot grows with active users, not with all users who ever pressed /start:
+# - user_data of each user is a Session with fixed slots instead of a dict;
+# - users are kept in order of their last update (handler group -2), users idle for CONVERSATION_TIMEOUT
+#   and the least recently active ones over SESSIONS_MAX_USERS lose their conversation state and user_data,
+#   their next /start begins a new conversation, old buttons are answered as expired.
+# PTB has no public way to end a conversation from outside of its handlers, so the conversation handler
+# of the bot is a Conversation, which ends them with ConversationHandler's own state update
+# (python-telegram-bot is pinned in requirements.txt for that).
+
+activity = OrderedDict()    # user_id -> (monotonic time of last update, chat_id), least recently active first
+
+
+class Session:
+    """user_data of one user, used like a dict with a fixed set of keys"""
+
+    __slots__ = (
+        "user_id",
+        "msg_id",
+        "order_id",
+        "is_user_registration",
+        "user_name",
+        "user_phone_number",
+        "user_delivery_address",
+        "category_part",
+        "part_id",
+        "catalog_view",
+        "navigation_steps",
+        "list_first_part_id",
+        "list_last_part_id",
+        "list_has_previous_page",
+        "confirmed_order_id",
+        "completed_order_id",
+        "completed_order_source",
+        "all_confirmed_order_id",
+        "selected_order_ids",
+    )
+
+    def __getitem__(self, key: str):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key: str, value):
+        try:
+            setattr(self, key, value)
+        except AttributeError:
+            raise KeyError(f"{key} isn't a key of session, add it to Session.__slots__") from None
+
+    def __delitem__(self, key: str):
+        try:
+            delattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __contains__(self, key: str):
+        return hasattr(self, key)
+
+    def __iter__(self):
+        return iter([key for key in self.__slots__ if hasattr(self, key)])
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+    def get(self, key: str, default=None):
+        return getattr(self, key, default)
+
+    def pop(self, key: str, *default):
+        try:
+            value = getattr(self, key)
+        except AttributeError:
+            if default:
+                return default[0]
+            raise KeyError(key) from None
+
+        delattr(self, key)
+        return value
+
+    def setdefault(self, key: str, default=None):
+        if not hasattr(self, key):
+            self[key] = default
+        return getattr(self, key)
+
+    def update(self, values: dict = (), **kwargs):
+        for key, value in dict(values, **kwargs).items():
+            self[key] = value
+
+    def clear(self):
+        for key in self.__slots__:
+            if hasattr(self, key):
+                delattr(self, key)
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in self]
+
+    def __repr__(self):
+        return f"Session({dict(self.items())})"
+
+
+class Conversation(ConversationHandler):
+    """ConversationHandler whose conversations can be ended by user and chat"""
+
+    def key(self, chat_id: int, user_id: int):
+        return tuple([chat_id] * self.per_chat + [user_id] * self.per_user)
+
+    def end(self, chat_id: int, user_id: int):
+        """End the conversation as if its handler returned END"""
+
+        self._update_state(self.END, self.key(chat_id, user_id))
+
+    def state(self, chat_id: int, user_id: int):
+        return self._conversations.get(self.key(chat_id, user_id))
+
+    @property
+    def conversations(self):
+        """Read-only view of conversation key -> state"""
+
+        return MappingProxyType(self._conversations)
+
+    def conversations_size(self):
+        """Bytes the dict of conversation states takes, apart from its keys and values"""
+
+        return sys.getsizeof(self._conversations)
+
+
+def conversation_handlers(application: Application):
+    return [
+        handler for handlers in application.handlers.values() for handler in handlers
+        if isinstance(handler, Conversation)
+    ]
+
+
+def forget(application: Application, user_id: int, chat_id: int):
+    """Drop conversation state and user_data of the user"""
+
+    for handler in conversation_handlers(application):
+        handler.end(chat_id, user_id)
+
+    application.drop_user_data(user_id)
+    application.drop_chat_data(chat_id)
+    throttling.buckets.pop(user_id, None)
+    throttling.pending_navigation.pop(user_id, None)
+
+
+async def touch(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Mark the user as the most recently active one, forget the least recently active ones over the limit"""
+
+    if update.effective_user is None or update.effective_chat is None:
+        return
+
+    user_id = update.effective_user.id
+    activity[user_id] = (time.monotonic(), update.effective_chat.id)
+    activity.move_to_end(user_id)
+
+    while len(activity) > CONFIG.SESSIONS_MAX_USERS:
+        evicted_user_id, (_, chat_id) = activity.popitem(last=False)
+        forget(context.application, evicted_user_id, chat_id)
+
+
+def evict_idle(application: Application):
+    """Forget users idle for CONVERSATION_TIMEOUT, return their number"""
+
+    idle_since = time.monotonic() - CONFIG.CONVERSATION_TIMEOUT.total_seconds()
+    evicted_count = 0
+
+    while activity:
+        user_id, (last_time, chat_id) = next(iter(activity.items()))
+        if last_time > idle_since:
+            break
+
+        del activity[user_id]
+        forget(application, user_id, chat_id)
+        evicted_count += 1
+
+    if evicted_count:
+        logger.info("[SESSIONS] %s idle users forgotten", evicted_count)
+
+    return evicted_count
+
+
+def deep_size(value, seen: set):
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+
+    size = sys.getsizeof(value)
+
+    if isinstance(value, dict):
+        size += sum(deep_size(key, seen) + deep_size(item, seen) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, seen) for item in value)
+    elif isinstance(value, Session):
+        size += sum(deep_size(item, seen) for _, item in value.items())
+
+    return size
+
+
+def entry_size(size: int, count: int):
+    """Bytes a dict of `size` bytes takes per entry"""
+
+    return size / count if count else 0
+
+
+def memory_report(application: Application):
+    """Users kept in memory and bytes each of them takes, measured on up to SESSIONS_MEMORY_SAMPLE recently active users"""
+
+    handlers = conversation_handlers(application)
+    sample = list(activity.items())[-CONFIG.SESSIONS_MEMORY_SAMPLE:]
+
+    seen = set()
+    sample_bytes = 0
+    for user_id, entry in sample:
+        chat_id = entry[1]
+        sample_bytes += deep_size(user_id, seen) + deep_size(entry, seen)
+        if user_id in application.user_data:
+            sample_bytes += deep_size(application.user_data[user_id], seen)
+        if user_id in throttling.buckets:
+            sample_bytes += deep_size(throttling.buckets[user_id], seen)
+        for handler in handlers:
+            state = handler.state(chat_id, user_id)
+            if state is not None:
+                sample_bytes += deep_size(handler.key(chat_id, user_id), seen) + deep_size(state, seen)
+
+    bytes_per_user = sample_bytes / len(sample) if sample else 0.0
+    # application.user_data is a read-only view, the dict behind it is measured without copying it
+    user_data = gc.get_referents(application.user_data)[0]
+    bytes_per_user += sum(
+        entry_size(sys.getsizeof(mapping), len(mapping)) for mapping in (activity, user_data, throttling.buckets)
+    ) + sum(
+        entry_size(handler.conversations_size(), len(handler.conversations)) for handler in handlers
+    )
+
+    return {
+        "tracked_users": len(activity),
+        "conversations": sum(len(handler.conversations) for handler in handlers),
+        "user_data": len(application.user_data),
+        "bytes_per_user": round(bytes_per_user),
+        "total_bytes": round(bytes_per_user * len(activity)),
+    }
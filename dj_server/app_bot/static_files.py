@@ -0,0 +1,164 @@
+import asyncio
+import email.utils
+import hashlib
+import mimetypes
+import os
+import re
+from urllib.parse import parse_qs
+
+import dj_server.config as CONFIG
+
+# ASGI app serving static and media files before requests reach Django.
+# Files are sent by the kernel when the server supports the zerocopysend extension,
+# repeated requests with ETag or modification time get 304 without reading the file,
+# URLs with the current content hash in `v` (see assets.py) may be cached forever.
+
+ZEROCOPYSEND = "http.response.zerocopysend"
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+file_hashes = dict()    # path -> (mtime_ns, size, hash of file content), also filled from the asset manifest
+
+
+def file_hash(path: str, stat: os.stat_result):
+    """Hash of file content, computed again only when the file changes"""
+
+    cached = file_hashes.get(path)
+    if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[2]
+
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(CONFIG.STATIC_FILES_CHUNK_SIZE), b""):
+            digest.update(chunk)
+
+    file_hashes[path] = (stat.st_mtime_ns, stat.st_size, digest.hexdigest())
+    return digest.hexdigest()
+
+
+def parse_range(header: str, size: int):
+    """(start, end) of a single byte range, None to send the whole file, False if it is unsatisfiable"""
+
+    match = RANGE_PATTERN.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        # several ranges or a malformed header, the whole file is a valid answer
+        return None
+
+    first, last = match.groups()
+    if first == "":
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def is_not_modified(headers: dict, etag: str, mtime: float):
+    if "if-none-match" in headers:
+        return etag in [tag.strip() for tag in headers["if-none-match"].split(",")] or headers["if-none-match"].strip() == "*"
+
+    if "if-modified-since" in headers:
+        try:
+            return int(mtime) <= email.utils.parsedate_to_datetime(headers["if-modified-since"]).timestamp()
+        except (TypeError, ValueError):
+            return False
+
+    return False
+
+
+class StaticFilesApp:
+    """Serves files of `roots` (URL prefix -> directory), passes other requests to `app`"""
+
+    def __init__(self, app, roots: dict):
+        self.app = app
+        self.roots = {prefix: os.path.realpath(root) for prefix, root in roots.items()}
+
+    def find_file(self, path: str):
+        for prefix, root in self.roots.items():
+            if path.startswith(prefix):
+                file_path = os.path.realpath(os.path.join(root, path[len(prefix):]))
+                if file_path.startswith(root + os.sep) and os.path.isfile(file_path):
+                    return file_path
+                return None
+        return False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        file_path = self.find_file(scope["path"])
+        if file_path is False:
+            return await self.app(scope, receive, send)
+
+        if scope["method"] not in ("GET", "HEAD"):
+            return await self.respond(send, 405, [(b"allow", b"GET, HEAD")])
+
+        if file_path is None:
+            return await self.respond(send, 404)
+
+        await self.serve(scope, send, file_path)
+
+    async def respond(self, send, status: int, headers: list = ()):
+        if status != 304:
+            headers = [(b"content-length", b"0"), *headers]
+
+        await send({"type": "http.response.start", "status": status, "headers": list(headers)})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def serve(self, scope, send, file_path: str):
+        stat = os.stat(file_path)
+        content_hash = await asyncio.to_thread(file_hash, file_path, stat)
+        etag = f'"{content_hash}"'
+
+        request_headers = {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope["headers"]}
+
+        if parse_qs(scope.get("query_string", b"").decode("latin-1")).get("v") == [content_hash]:
+            cache_control = "public, max-age=31536000, immutable"
+        else:
+            cache_control = f"public, max-age={CONFIG.STATIC_FILES_MAX_AGE}"
+
+        headers = [
+            (b"etag", etag.encode()),
+            (b"last-modified", email.utils.formatdate(stat.st_mtime, usegmt=True).encode()),
+            (b"cache-control", cache_control.encode()),
+            (b"accept-ranges", b"bytes"),
+        ]
+
+        if is_not_modified(request_headers, etag, stat.st_mtime):
+            return await self.respond(send, 304, headers)
+
+        status, start, end = 200, 0, stat.st_size - 1
+
+        # If-Range with an old ETag asks for the whole changed file
+        if "range" in request_headers and request_headers.get("if-range", etag) == etag:
+            byte_range = parse_range(request_headers["range"], stat.st_size)
+
+            if byte_range is False:
+                return await self.respond(send, 416, [*headers, (b"content-range", f"bytes */{stat.st_size}".encode())])
+
+            if byte_range is not None:
+                status, (start, end) = 206, byte_range
+                headers.append((b"content-range", f"bytes {start}-{end}/{stat.st_size}".encode()))
+
+        content_type = mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+        headers += [(b"content-type", content_type.encode()), (b"content-length", str(end - start + 1).encode())]
+
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+
+        if scope["method"] == "HEAD" or end < start:
+            return await send({"type": "http.response.body", "body": b""})
+
+        with open(file_path, "rb") as file:
+            if ZEROCOPYSEND in scope.get("extensions", {}):
+                return await send({"type": ZEROCOPYSEND, "file": file, "offset": start, "count": end - start + 1})
+
+            file.seek(start)
+            left = end - start + 1
+            while left > 0:
+                chunk = await asyncio.to_thread(file.read, min(CONFIG.STATIC_FILES_CHUNK_SIZE, left))
+                left -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": left > 0 and bool(chunk)})
+                if not chunk:
+                    break
@@ -0,0 +1,145 @@
+import logging
+import math
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from django.db import transaction
+from django.db.models import Q, F
+
+import dj_server.config as CONFIG
+
+from .models import Part, ConfirmedOrder, CompletedOrder, PartStockForecast, RollupCursor
+
+logger = logging.getLogger(__name__)
+
+# Sales velocity of each part is an exponentially decayed rate of its sales:
+# each sold item adds 1 / tau items per day, decaying with time constant tau.
+# Only parts with new sales are written, the rest are decayed when read.
+
+ORDERS_CURSOR_NAME = "ordered_orders"
+
+# orders made this recently are left for the next run, see analytics.ROLLUP_LAG
+ORDERS_LAG = timedelta(minutes=1)
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+tau = CONFIG.SALES_VELOCITY_HALF_LIFE.total_seconds() / SECONDS_PER_DAY / math.log(2)
+
+
+def decay(velocity: float, since: datetime, now: datetime):
+    return velocity * math.exp(-(now - since).total_seconds() / SECONDS_PER_DAY / tau)
+
+
+def next_ordered_orders(cursor: RollupCursor, batch_size: int):
+    """Orders made after the cursor, still in delivery or already completed"""
+
+    after_cursor = (
+        Q(ordered_time__gt=cursor.time) |
+        Q(ordered_time=cursor.time, order_id__gt=cursor.order_id)
+    )
+    ordered_before = datetime.now(timezone.utc) - ORDERS_LAG
+
+    orders = dict()
+    for model in (ConfirmedOrder, CompletedOrder):
+        for order in model.objects.filter(after_cursor, ordered_time__lt=ordered_before) \
+                .order_by("ordered_time", "order_id")[:batch_size]:
+            orders[order.order_id] = order
+
+    return sorted(orders.values(), key=lambda order: (order.ordered_time, order.order_id))[:batch_size]
+
+
+def add_sales(orders: list):
+    """Add sold parts of orders to sales velocities"""
+
+    now = datetime.now(timezone.utc)
+    sales = defaultdict(float)
+
+    for order in orders:
+        for part_id, line in order.parts.items():
+            sales[int(part_id)] += decay(line['count'] / tau, order.ordered_time, now)
+
+    forecasts = PartStockForecast.objects.in_bulk(sales.keys())
+    new_forecasts = list()
+
+    for part_id, velocity in sales.items():
+        forecast = forecasts.get(part_id)
+        if forecast is None:
+            forecast = PartStockForecast(part_id=part_id, sales_velocity=0.0, updated_time=now)
+            new_forecasts.append(forecast)
+
+        forecast.sales_velocity = decay(forecast.sales_velocity, forecast.updated_time, now) + velocity
+        forecast.updated_time = now
+
+    # parts deleted since the order was made have nothing to forecast
+    existing_part_ids = set(
+        Part.objects.filter(part_id__in=[forecast.part_id for forecast in new_forecasts])
+        .values_list("part_id", flat=True)
+    )
+
+    PartStockForecast.objects.bulk_create(
+        [forecast for forecast in new_forecasts if forecast.part_id in existing_part_ids]
+    )
+    PartStockForecast.objects.bulk_update(forecasts.values(), fields=["sales_velocity", "updated_time"])
+
+
+def update_sales_velocities(batch_size: int = CONFIG.LOW_STOCK_BATCH_SIZE):
+    """Add all orders made since the last run to sales velocities"""
+
+    while True:
+        with transaction.atomic():
+            RollupCursor.objects.get_or_create(name=ORDERS_CURSOR_NAME)
+            cursor = RollupCursor.objects.select_for_update().get(name=ORDERS_CURSOR_NAME)
+
+            orders = next_ordered_orders(cursor, batch_size)
+            if not orders:
+                break
+
+            add_sales(orders)
+
+            cursor.time = orders[-1].ordered_time
+            cursor.order_id = orders[-1].order_id
+            cursor.save()
+
+        if len(orders) < batch_size:
+            break
+
+
+def find_low_stock_parts():
+    """Parts forecast to run out of stock soon, which weren't alerted recently, marked as alerted"""
+
+    now = datetime.now(timezone.utc)
+    low_stock_parts = list()
+
+    forecasts = PartStockForecast.objects.select_related("part").filter(
+        Q(part__is_available=True) | Q(part__available_count=0),
+        # alert again only about parts which were sold since the last alert
+        Q(alerted_time__isnull=True) |
+        Q(alerted_time__lt=now - CONFIG.LOW_STOCK_REALERT_INTERVAL) & Q(alerted_time__lt=F("updated_time")),
+        sales_velocity__gt=0
+    )
+
+    for forecast in forecasts.iterator():
+        part = forecast.part
+        velocity = decay(forecast.sales_velocity, forecast.updated_time, now)
+        days_left = part.available_count / velocity if velocity > 0 else math.inf
+
+        if days_left < CONFIG.LOW_STOCK_DAYS:
+            forecast.alerted_time = now
+            low_stock_parts.append((part, velocity, days_left, forecast))
+
+    PartStockForecast.objects.bulk_update([forecast for *_, forecast in low_stock_parts], fields=["alerted_time"])
+    low_stock_parts.sort(key=lambda low_stock_part: low_stock_part[2])
+
+    return [(part, velocity, days_left) for part, velocity, days_left, _ in low_stock_parts]
+
+
+def forecast_low_stock():
+    """Periodic job: update sales velocities, return parts running out of stock"""
+
+    update_sales_velocities()
+    low_stock_parts = find_low_stock_parts()
+
+    if low_stock_parts:
+        logger.info("[STOCK] %s parts are running out of stock", len(low_stock_parts))
+
+    return low_stock_parts
@@ -0,0 +1,88 @@
+import time
+
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, ContextTypes
+
+import dj_server.config as CONFIG
+
+from . import metrics
+
+# Flood control run before conversation handlers (handler group -1):
+# - navigation callbacks queued one after another by the same user are coalesced,
+#   only the latest one is handled, with the steps of dropped ones added to it;
+# - each user has a token bucket of THROTTLE_BURST updates refilled at THROTTLE_RATE per second.
+# Dropped callback queries are answered anyway, otherwise telegram clients show a spinner on the button.
+
+navigation_steps = dict()       # callback data -> step, filled by the bot with its navigation buttons
+
+buckets = dict()                # user_id -> [tokens, monotonic time of last refill, is_warned]
+pending_navigation = dict()     # user_id -> [update_id of latest navigation callback, sum of steps]
+
+
+def update_received(update: Update):
+    """Remember the latest navigation callback of the user, called when update is put into update_queue"""
+
+    query = update.callback_query
+    if query is None or query.data not in navigation_steps:
+        return
+
+    steps = pending_navigation.get(query.from_user.id, [None, 0])[1]
+    pending_navigation[query.from_user.id] = [update.update_id, steps + navigation_steps[query.data]]
+
+
+def take_token(user_id: int):
+    """Take a token from user's bucket, return False if it is empty"""
+
+    now = time.monotonic()
+
+    if user_id not in buckets and len(buckets) >= CONFIG.THROTTLE_MAX_USERS:
+        # buckets of idle users are full again, they are the same as new ones
+        for idle_user_id in [
+            bucket_user_id for bucket_user_id, (tokens, refill_time, _) in buckets.items()
+            if tokens + (now - refill_time) * CONFIG.THROTTLE_RATE >= CONFIG.THROTTLE_BURST
+        ]:
+            del buckets[idle_user_id]
+
+    bucket = buckets.setdefault(user_id, [CONFIG.THROTTLE_BURST, now, False])
+    bucket[0] = min(bucket[0] + (now - bucket[1]) * CONFIG.THROTTLE_RATE, CONFIG.THROTTLE_BURST)
+    bucket[1] = now
+
+    if bucket[0] < 1:
+        return False
+
+    bucket[0] -= 1
+    bucket[2] = False
+    return True
+
+
+async def throttle(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Stop handling of superseded navigation callbacks and of updates over user's rate"""
+
+    user = update.effective_user
+    if user is None:
+        return
+
+    query = update.callback_query
+
+    if query is not None and query.data in navigation_steps:
+        update_id, steps = pending_navigation.get(user.id, [update.update_id, navigation_steps[query.data]])
+
+        if update_id != update.update_id:
+            metrics.coalesced_updates += 1
+            await query.answer()
+            raise ApplicationHandlerStop
+
+        pending_navigation.pop(user.id, None)
+        context.user_data["navigation_steps"] = steps
+
+    if not take_token(user.id):
+        metrics.throttled_updates += 1
+
+        # tell once why buttons don't respond, until the user slows down
+        if query is not None and not buckets[user.id][2]:
+            buckets[user.id][2] = True
+            await query.answer("⏳ слишком часто, подождите немного")
+        elif query is not None:
+            await query.answer()
+
+        raise ApplicationHandlerStop
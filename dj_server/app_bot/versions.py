@@ -0,0 +1,114 @@
+import logging
+
+from asgiref.sync import sync_to_async
+
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from . import money
+from .models import Part, PartVersion
+
+logger = logging.getLogger(__name__)
+
+# Order lines are {"version": version_id, "count": count}, keyed by part_id.
+# A new PartVersion is appended whenever sold data of a part changes, old versions
+# are never changed, so confirmed and completed orders keep exact history.
+# Lines of orders made before versioning carry a full copy of part data instead.
+
+VERSIONED_FIELDS = ("name", "category", "description", "price", "image")
+
+
+def part_data(part: Part):
+    return {
+        "name": part.name,
+        "category": part.category,
+        "description": part.description,
+        "price": money.amount(part.price),
+        "image": part.image.url,
+    }
+
+
+def snapshot(part: Part):
+    """Append a version if the part differs from its current version, return current version id"""
+
+    data = part_data(part)
+
+    if part.version_id is not None:
+        version = PartVersion.objects.filter(version_id=part.version_id).values(*VERSIONED_FIELDS).first()
+        if version == data:
+            return part.version_id
+
+    version = PartVersion.objects.create(part_id=part.part_id, **data)
+    Part.objects.filter(part_id=part.part_id).update(version=version)
+    part.version = version
+
+    logger.info("[VERSION] Part [id: %s] version [%s] created", part.part_id, version.version_id)
+
+    return version.version_id
+
+
+async def current_version_id(part: Part):
+    """Id of the version to put into a cart line for the part"""
+
+    if part.version_id is not None:
+        return part.version_id
+
+    return await sync_to_async(snapshot)(part)
+
+
+def line(version_id: int, count: int):
+    return {"version": version_id, "count": count}
+
+
+def resolve(parts: dict, versions: dict):
+    """Lines with part data from given versions, legacy lines are returned as is"""
+
+    lines = dict()
+
+    for part_id, order_line in parts.items():
+        if "version" not in order_line:
+            lines[part_id] = {**order_line, "price": money.amount(order_line.get("price", 0))}
+            continue
+
+        version = versions.get(order_line["version"])
+        lines[part_id] = {
+            "name": version.name if version else "",
+            "category": version.category if version else "",
+            "description": version.description if version else "",
+            "price": version.price if version else money.ZERO,
+            "image": version.image if version else "",
+            "count": order_line["count"],
+        }
+
+    return lines
+
+
+def version_ids(parts: dict):
+    return {order_line["version"] for order_line in parts.values() if "version" in order_line}
+
+
+def resolve_orders(orders: list):
+    """Resolved lines for each of the orders with one query"""
+
+    ids = set()
+    for order in orders:
+        ids |= version_ids(order.parts)
+
+    versions = PartVersion.objects.in_bulk(ids) if ids else {}
+
+    return [resolve(order.parts, versions) for order in orders]
+
+
+async def aresolve(parts: dict):
+    """Resolved lines of one order"""
+
+    ids = version_ids(parts)
+    versions = await PartVersion.objects.ain_bulk(ids) if ids else {}
+
+    return resolve(parts, versions)
+
+
+# must be connected before cache.part_saved, so the catalog snapshot gets the new version
+@receiver(post_save, sender=Part)
+def part_saved(sender, instance: Part, **kwargs):
+    snapshot(instance)
@@ -1,13 +1,19 @@
 import json
+import time
 
 import dj_server.config as CONFIG
 
-from django.http import HttpRequest, HttpResponse, HttpResponseBadRequest
+from asgiref.sync import sync_to_async
+
+from django.db import connection
+from django.http import HttpRequest, HttpResponse, HttpResponseBadRequest, JsonResponse
 from django.shortcuts import render
 
 from telegram import Update
 from __main__ import ptb_application
 
+from . import cart_buffer, lifecycle, metrics, sessions
+
 # Create your views here
 context = {'title': CONFIG.TITLE}
 async def index(request: HttpRequest) -> HttpResponse:
@@ -15,11 +21,83 @@ async def index(request: HttpRequest) -> HttpResponse:
 
 async def telegram(request: HttpRequest) -> HttpResponse:
     """Handle incoming Telegram updates by putting them into the `update_queue`"""
-    await ptb_application.update_queue.put(
-        Update.de_json(data=json.loads(request.body), bot=ptb_application.bot)
-    )
+    update = Update.de_json(data=json.loads(request.body), bot=ptb_application.bot)
+    await lifecycle.ingest(ptb_application, update)
     return HttpResponse()
 
+def ping_db() -> float:
+    """Run the cheapest query and return its latency in seconds"""
+    start_time = time.monotonic()
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1")
+    return time.monotonic() - start_time
+
 async def health(request: HttpRequest) -> HttpResponse:
-    """For the health endpoint, reply with a simple plain text message."""
-    return HttpResponse("The bot is still running fine :)")
\ No newline at end of file
+    """For the health endpoint, report readiness and saturation signals of the bot as json."""
+    failed_checks = list()
+
+    if not lifecycle.is_ready:
+        failed_checks.append("startup")
+
+    try:
+        db_latency = await sync_to_async(ping_db)()
+    except Exception:
+        db_latency = None
+        failed_checks.append("db")
+    else:
+        if db_latency > CONFIG.HEALTH_MAX_DB_LATENCY:
+            failed_checks.append("db_latency")
+
+    update_queue_depth = ptb_application.update_queue.qsize()
+    if update_queue_depth > CONFIG.HEALTH_MAX_UPDATE_QUEUE_DEPTH:
+        failed_checks.append("update_queue_depth")
+
+    oldest_update_age = metrics.oldest_update_age()
+    if oldest_update_age > CONFIG.HEALTH_MAX_OLDEST_UPDATE_AGE:
+        failed_checks.append("oldest_update_age")
+
+    if metrics.notification_backlog > CONFIG.HEALTH_MAX_NOTIFICATION_BACKLOG:
+        failed_checks.append("notification_backlog")
+
+    outbound_delays = {priority_name: metrics.outbound_delay(priority_name) for priority_name in metrics.outbound_delays}
+    if outbound_delays["interactive"][0] > CONFIG.HEALTH_MAX_INTERACTIVE_DELAY:
+        failed_checks.append("interactive_delay")
+
+    return JsonResponse(
+        {
+            "ready": not failed_checks,
+            "failed_checks": failed_checks,
+            "db": {
+                "latency_ms": round(db_latency * 1000, 2) if db_latency is not None else None,
+            },
+            "update_queue": {
+                "depth": update_queue_depth,
+                "oldest_update_age_s": round(oldest_update_age, 3),
+            },
+            "handlers": {
+                "in_progress": metrics.handlers_in_progress,
+                "max_concurrent": ptb_application.update_processor.max_concurrent_updates,
+            },
+            "notifications": {
+                "backlog": metrics.notification_backlog,
+            },
+            "outbound": {
+                "waiting": metrics.outbound_waiting,
+                "retries": metrics.outbound_retries,
+                **{
+                    f"{priority_name}_delay_ms": {"avg": round(average * 1000, 2), "max": round(maximum * 1000, 2)}
+                    for priority_name, (average, maximum) in outbound_delays.items()
+                },
+            },
+            "throttling": {
+                "throttled_updates": metrics.throttled_updates,
+                "coalesced_updates": metrics.coalesced_updates,
+            },
+            "sessions": sessions.memory_report(ptb_application),
+            "carts": {
+                "buffered": len(cart_buffer.carts),
+                "unsaved": cart_buffer.unsaved_count(),
+            },
+        },
+        status=200 if not failed_checks else 503
+    )
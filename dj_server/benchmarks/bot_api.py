@@ -0,0 +1,132 @@
+"""Bot API calls per second the bot's HTTP client can make.
+
+Runs a local stub of Telegram Bot API answering after `--latency` seconds in a separate process,
+then sends `--calls` sendMessage requests, `--concurrency` at once, through connection pools of each size.
+
+usage: python benchmarks/bot_api.py [--calls 2000] [--concurrency 64] [--latency 0.05] [--pool-sizes 1,8,32]
+
+Pool sizes default to 1 and the sizes of both pools from config.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import statistics
+import sys
+import time
+
+import uvicorn
+from telegram import Bot
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dj_server.config as CONFIG
+from app_bot.outbound import make_pool
+
+TOKEN = "123456:benchmark"
+PORT = 8765
+
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "benchmark", "username": "benchmark_bot"}
+
+
+def stub_api(latency: float):
+    """ASGI app answering every bot API method like Telegram does, after `latency` seconds"""
+
+    async def app(scope, receive, send):
+        if scope["type"] != "http":
+            return
+
+        while (await receive()).get("more_body"):
+            pass
+
+        await asyncio.sleep(latency)
+
+        method = scope["path"].rsplit("/", 1)[-1]
+        if method == "getMe":
+            result = BOT_USER
+        else:
+            result = {"message_id": 1, "date": int(time.time()), "chat": {"id": 1, "type": "private"}, "text": "benchmark"}
+
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": json.dumps({"ok": True, "result": result}).encode()})
+
+    return app
+
+
+def serve_stub_api(latency: float):
+    uvicorn.run(stub_api(latency), port=PORT, log_level="warning", lifespan="off")
+
+
+def wait_for_port():
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", PORT)).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+
+
+async def run(bot: Bot, calls: int, concurrency: int):
+    """Send `calls` messages, `concurrency` at once, return calls per second and latencies"""
+
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def call():
+        async with semaphore:
+            start_time = time.perf_counter()
+            await bot.send_message(chat_id=1, text="benchmark")
+            latencies.append(time.perf_counter() - start_time)
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*(call() for _ in range(calls)))
+    return calls / (time.perf_counter() - start_time), latencies
+
+
+async def main(args):
+    print(
+        f"stub latency {args.latency * 1000:.0f}ms, {args.calls} calls, concurrency {args.concurrency}, "
+        f"HTTP/{CONFIG.BOT_API_HTTP_VERSION}"
+    )
+
+    # requests wait for a free connection as long as needed, so that small pools queue instead of failing
+    CONFIG.BOT_API_POOL_TIMEOUT = None
+
+    for pool_size in args.pool_sizes:
+        bot = Bot(TOKEN, base_url=f"http://127.0.0.1:{PORT}/bot", request=make_pool(pool_size))
+        async with bot:
+            await run(bot, min(pool_size, args.calls), pool_size)  # open connections
+            calls_per_second, latencies = await run(bot, args.calls, args.concurrency)
+
+        latencies.sort()
+        print(
+            f"pool {pool_size:>4}: {calls_per_second:8.1f} calls/s, "
+            f"latency p50 {statistics.median(latencies) * 1000:6.1f}ms, "
+            f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:6.1f}ms"
+        )
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bot API calls per second through the bot's HTTP client")
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds the stub API takes to answer")
+    parser.add_argument(
+        "--pool-sizes",
+        type=lambda value: [int(size) for size in value.split(",")],
+        default=[1, CONFIG.BOT_API_NOTIFICATION_POOL_SIZE, CONFIG.BOT_API_INTERACTIVE_POOL_SIZE]
+    )
+
+    args = parser.parse_args()
+
+    stub_process = multiprocessing.Process(target=serve_stub_api, args=(args.latency,), daemon=True)
+    stub_process.start()
+    try:
+        wait_for_port()
+        asyncio.run(main(args))
+    finally:
+        stub_process.terminate()
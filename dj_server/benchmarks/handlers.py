@@ -0,0 +1,334 @@
+"""Time and db queries per call of the bot handlers.
+
+Handlers are called directly, one at a time, against seeded in-memory SQLite and a fake bot API.
+Each benchmark prepares its state before every round, only the handler call is timed.
+
+usage: python benchmarks/handlers.py [--rounds 50] [--only product_cards] [--output results.json] [--compare baseline.json]
+
+With --compare, benchmarks slower than the baseline by more than --threshold, or making more queries,
+are reported and the script exits with 1.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["DJANGO_SETTINGS_MODULE"] = "benchmarks.settings"
+
+import __main__
+import bot
+
+# views take the application from the main module
+__main__.ptb_application = bot.ptb_application
+
+import django
+from asgiref.sync import sync_to_async
+from django.core.management import call_command
+from django.db.backends.signals import connection_created
+from telegram import Update
+
+import dj_server.config as CONFIG
+import app_bot.models as models
+from app_bot import lifecycle, versions
+
+application = bot.ptb_application
+
+USER_ID = 1
+ADMIN_ID = 2
+CATEGORY = next(iter(CONFIG.CATEGORY_CHOICES))
+PARTS_COUNT = 30
+ORDERS_COUNT = 20
+CART_LINES = 5
+
+queries_count = 0
+message_ids = itertools.count(1)
+update_ids = itertools.count(1)
+
+
+def count_queries(execute, sql, params, many, context):
+    global queries_count
+    queries_count += 1
+    return execute(sql, params, many, context)
+
+
+def add_query_counter(sender, connection, **kwargs):
+    connection.execute_wrappers.append(count_queries)
+
+
+def message(chat_id: int, text: str = "benchmark"):
+    return {
+        "message_id": next(message_ids),
+        "date": 0,
+        "chat": {"id": chat_id, "type": "private", "username": f"user{chat_id}"},
+        "from": {"id": chat_id, "is_bot": False, "first_name": "benchmark"},
+        "text": text,
+        "photo": [{"file_id": "photo", "file_unique_id": "photo", "width": 1, "height": 1}],
+    }
+
+
+async def fake_bot_api(endpoint, data, *args, **kwargs):
+    """Answers of bot API methods the handlers call"""
+
+    if endpoint == "getMe":
+        return {"id": 42, "is_bot": True, "first_name": "benchmark", "username": "benchmark_bot"}
+    if endpoint == "sendMediaGroup":
+        return [message(int(data["chat_id"]))]
+    if endpoint.startswith("send") or endpoint.startswith("edit"):
+        return message(int(data.get("chat_id") or USER_ID))
+    return True
+
+
+def callback_update(data: str, user_id: int = USER_ID):
+    return Update.de_json(
+        {
+            "update_id": next(update_ids),
+            "callback_query": {
+                "id": str(next(message_ids)),
+                "from": {"id": user_id, "is_bot": False, "first_name": "benchmark"},
+                "chat_instance": "benchmark",
+                "data": data,
+                "message": message(user_id),
+            },
+        },
+        application.bot
+    )
+
+
+def message_update(text: str, user_id: int = USER_ID):
+    return Update.de_json({"update_id": next(update_ids), "message": message(user_id, text)}, application.bot)
+
+
+def seed():
+    call_command("migrate", verbosity=0, skip_checks=True)
+
+    user = models.User.objects.create(
+        user_id=USER_ID, username="@user1", name="benchmark", phone_number="291234567", delivery_address="address"
+    )
+    models.User.objects.create(
+        user_id=ADMIN_ID, username="@user2", name="admin", phone_number="291234568", delivery_address="address"
+    )
+    models.Admin.objects.create(admin_id=ADMIN_ID, is_notification_enabled=False)
+
+    for number in range(PARTS_COUNT):
+        models.Part.objects.create(name=f"part {number}", category=CATEGORY, price=1.5 + number, available_count=10 ** 9)
+
+    lines = cart_lines()
+    for number in range(ORDERS_COUNT):
+        ordered_time = datetime.now(timezone.utc)
+        # ids apart from ids of carts, which keep their ids when confirmed
+        models.ConfirmedOrder.objects.create(order_id=2 * 10 ** 6 + number, user=user, parts=lines, cost=10, ordered_time=ordered_time)
+        models.CompletedOrder.objects.create(
+            order_id=10 ** 6 + number, user=user, parts=lines, cost=10,
+            ordered_time=ordered_time, accepted_time=ordered_time, completed_time=ordered_time
+        )
+
+    lifecycle.prewarm()
+
+
+def cart_lines():
+    parts = models.Part.objects.order_by("part_id")[:CART_LINES]
+    return {str(part.part_id): versions.line(part.version_id, 2) for part in parts}
+
+
+def middle_part_id():
+    return models.Part.objects.order_by("part_id")[PARTS_COUNT // 2].part_id
+
+
+def new_cart():
+    return models.Order.objects.create(user_id=USER_ID, parts=cart_lines())
+
+
+def user_data(user_id: int = USER_ID):
+    return application.user_data[user_id]
+
+
+def in_product_cards():
+    data = user_data()
+    data.clear()
+    data.update(user_id=USER_ID, order_id=in_product_cards.order_id, category_part=CATEGORY, part_id=middle_part_id())
+
+
+def in_cart():
+    data = user_data()
+    data.clear()
+    data.update(user_id=USER_ID, order_id=new_cart().order_id)
+
+
+def in_profile():
+    data = user_data()
+    data.clear()
+    data.update(user_id=USER_ID)
+
+
+def in_admin_panel():
+    data = user_data(ADMIN_ID)
+    data.clear()
+    data.update(user_id=ADMIN_ID)
+
+
+async def call(handler, update: Update):
+    context = application.context_types.context.from_update(update, application)
+    if update.callback_query is not None:
+        # arguments of the button, as the router of the conversation state passes them
+        context.args = bot.callbacks.decode(update.callback_query.data)[1]
+    return await handler(update, context)
+
+
+async def confirm_order():
+    order = await models.Order.objects.aget(order_id=user_data()["order_id"])
+    update = callback_update(bot.callbacks.encode(bot.into_cart_states["CONFIRM_ORDER"]))
+    context = application.context_types.context.from_update(update, application)
+    return await bot.confirm_order_to_db(update, context, order)
+
+
+# name -> (state set before each round, coroutine function making one call)
+BENCHMARKS = {
+    "start": (in_profile, lambda: call(bot.start, message_update("/start"))),
+    "product_cards.first": (in_product_cards, lambda: call(bot.product_cards, callback_update(bot.callbacks.encode(bot.top_states['PRODUCT_CARDS'], CATEGORY)))),
+    "product_cards.next": (in_product_cards, lambda: call(bot.product_cards, callback_update(bot.callbacks.encode(bot.product_card_states["NEXT"])))),
+    "product_cards.previous": (in_product_cards, lambda: call(bot.product_cards, callback_update(bot.callbacks.encode(bot.product_card_states["PREVIOUS"])))),
+    "product_cards.add": (in_product_cards, lambda: call(bot.product_cards, callback_update(bot.callbacks.encode(bot.product_card_states["ADD"])))),
+    "product_cards.remove": (in_product_cards, lambda: call(bot.product_cards, callback_update(bot.callbacks.encode(bot.product_card_states["REMOVE"])))),
+    "product_cards.enter_count": (in_product_cards, lambda: call(bot.product_cards, message_update("3"))),
+    "into_cart.view": (in_cart, lambda: call(bot.into_cart, callback_update(bot.callbacks.encode(bot.top_states["INTO_CART"])))),
+    "into_cart.make_order": (in_cart, lambda: call(bot.into_cart, callback_update(bot.callbacks.encode(bot.into_cart_states["MAKE_ORDER"])))),
+    "into_cart.confirm_order": (in_cart, lambda: call(bot.into_cart, callback_update(bot.callbacks.encode(bot.into_cart_states["CONFIRM_ORDER"])))),
+    "into_cart.empty_cart": (in_cart, lambda: call(bot.into_cart, callback_update(bot.callbacks.encode(bot.into_cart_states["EMPTY_CART"])))),
+    "confirm_order_to_db": (in_cart, confirm_order),
+    "confirmed_order_list": (in_profile, lambda: call(bot.confirmed_order_list, callback_update(bot.callbacks.encode(bot.top_states["CONFIRMED_ORDER_LIST"])))),
+    "completed_order_list": (in_profile, lambda: call(bot.completed_order_list, callback_update(bot.callbacks.encode(bot.top_states["COMPLETED_ORDER_LIST"])))),
+    "all_confirmed_order_list": (
+        in_admin_panel,
+        lambda: call(bot.all_confirmed_order_list, callback_update(bot.callbacks.encode(bot.admin_panel_states["ALL_CONFIRMED_ORDER_LIST"]), ADMIN_ID))
+    ),
+}
+
+
+async def run_benchmark(prepare, make_call, rounds: int, warmup_rounds: int):
+    global queries_count
+
+    times = []
+    queries = []
+
+    for round_number in range(warmup_rounds + rounds):
+        await sync_to_async(prepare)()
+
+        queries_count = 0
+        start_time = time.perf_counter()
+        await make_call()
+        elapsed_time = time.perf_counter() - start_time
+
+        if round_number >= warmup_rounds:
+            times.append(elapsed_time)
+            queries.append(queries_count)
+
+    return {
+        "rounds": rounds,
+        "min_ms": round(min(times) * 1000, 3),
+        "median_ms": round(statistics.median(times) * 1000, 3),
+        "mean_ms": round(statistics.mean(times) * 1000, 3),
+        "stdev_ms": round(statistics.stdev(times) * 1000, 3) if rounds > 1 else 0.0,
+        "queries": max(queries),
+    }
+
+
+def commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict, threshold: float):
+    """Print changes against baseline, return names of regressed benchmarks"""
+
+    regressions = []
+
+    print(f"\ncompared with {baseline.get('commit')}:")
+    for name, result in results.items():
+        if name not in baseline["benchmarks"]:
+            continue
+
+        old_result = baseline["benchmarks"][name]
+        change = result["median_ms"] / old_result["median_ms"] - 1 if old_result["median_ms"] else 0.0
+        queries_change = result["queries"] - old_result["queries"]
+
+        is_regression = change > threshold or queries_change > 0
+        if is_regression:
+            regressions.append(name)
+
+        print(
+            f"{'!' if is_regression else ' '} {name:<28} {change:+7.1%}  "
+            f"queries {old_result['queries']} -> {result['queries']}"
+        )
+
+    return regressions
+
+
+async def main(args):
+    connection_created.connect(add_query_counter)
+    await sync_to_async(seed)()
+
+    in_product_cards.order_id = (await sync_to_async(new_cart)()).order_id
+
+    object.__setattr__(application.bot, "_do_post", fake_bot_api)
+    await application.initialize()
+
+    results = dict()
+    print(f"{'handler':<30} {'median ms':>10} {'min ms':>9} {'stdev ms':>9} {'queries':>8}")
+
+    for name, (prepare, make_call) in BENCHMARKS.items():
+        if args.only and not name.startswith(args.only):
+            continue
+
+        result = await run_benchmark(prepare, make_call, args.rounds, args.warmup_rounds)
+        results[name] = result
+
+        print(f"{name:<30} {result['median_ms']:>10.3f} {result['min_ms']:>9.3f} {result['stdev_ms']:>9.3f} {result['queries']:>8}")
+
+    await application.shutdown()
+
+    report = {
+        "commit": commit(),
+        "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "benchmarks": results,
+    }
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=1)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+
+        if compare(results, baseline, args.threshold):
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time and db queries per call of the bot handlers")
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--warmup-rounds", type=int, default=3)
+    parser.add_argument("--only", help="run benchmarks whose names start with this")
+    parser.add_argument("--output", help="save results to this JSON file")
+    parser.add_argument("--compare", help="JSON file with results to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1, help="median slowdown reported as regression")
+
+    sys.exit(asyncio.run(main(parser.parse_args())))
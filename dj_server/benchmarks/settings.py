@@ -0,0 +1,9 @@
+from dj_server.settings import *
+
+# in-memory SQLite shared by the loop thread and the thread of async ORM calls
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': 'file:benchmark?mode=memory&cache=shared',
+    }
+}
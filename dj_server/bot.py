@@ -1,5 +1,7 @@
+import argparse
 import asyncio
 import logging
+import re
 from datetime import datetime, timezone
 
 import uvicorn
@@ -8,11 +10,15 @@ from asgiref.sync import sync_to_async
 
 from django.db.models import Q
 
-from telegram.constants import ParseMode
+from telegram.constants import MessageLimit, ParseMode
 from telegram import (
+    Message,
     Update,
     InlineKeyboardButton,
     InlineKeyboardMarkup,
+    InlineQueryResultCachedPhoto,
+    InlineQueryResultPhoto,
+    InlineQueryResultsButton,
     InputMediaPhoto,
     )
 from telegram.ext import (
@@ -20,31 +26,39 @@ from telegram.ext import (
     CallbackContext,
     CommandHandler,
     MessageHandler,
+    InlineQueryHandler,
     CallbackQueryHandler,
-    ConversationHandler,
+    TypeHandler,
     ContextTypes,
     filters
 )
 
 import app_bot.models as models
+import app_bot.analytics as analytics
+import app_bot.assets as assets
+import app_bot.cache as cache
+import app_bot.callbacks as callbacks
+import app_bot.cart_buffer as cart_buffer
+import app_bot.carts as carts
+import app_bot.lifecycle as lifecycle
+import app_bot.logs as logs
+import app_bot.metrics as metrics
+import app_bot.money as money
+import app_bot.notifications as notifications
+import app_bot.orders as orders
+import app_bot.outbound as outbound
+import app_bot.reservations as reservations
+import app_bot.search as search
+import app_bot.sessions as sessions
+import app_bot.stock as stock
+import app_bot.throttling as throttling
+import app_bot.versions as versions
 
 import dj_server.config as CONFIG
 from dj_server.credentials import TOKEN, URL, PORT
 
-# Enable logging
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    filename=f'{datetime.now().strftime("%Y-%m-%d")}.log',
-    level=logging.INFO,
-    encoding='utf-8'
-)
-# set higher logging level for httpx to avoid all GET and POST requests being logged
-logging.getLogger("httpx").setLevel(logging.WARNING)
-
 logger = logging.getLogger(__name__)
 
-SPLIT = "_"
-
 top_states = {
     "START": 0,
     "ADMIN_PANEL": 1,
@@ -69,7 +83,8 @@ user_profile_edit_states = {
 
 admin_panel_states = {
     "NOTIFICATIONS_ON_OFF": 3_0,
-    "ALL_CONFIRMED_ORDER_LIST": 3_1
+    "ALL_CONFIRMED_ORDER_LIST": 3_1,
+    "SALES_REPORT": 3_2
 }
 
 all_confirmed_order_states = {
@@ -77,7 +92,12 @@ all_confirmed_order_states = {
     "NEXT": 4_1,
     "ACCEPT_ORDER": 4_2,
     "COMPLETE_ORDER": 4_3,
-    "CANCEL_ORDER": 4_4
+    "CANCEL_ORDER": 4_4,
+    "SELECT_ORDERS": 4_5,
+    "TOGGLE_ORDER": 4_6,
+    "SELECT_ALL_ORDERS": 4_7,
+    "ACCEPT_SELECTED_ORDERS": 4_8,
+    "COMPLETE_SELECTED_ORDERS": 4_9
 }
 
 confirmed_order_states = {
@@ -105,6 +125,14 @@ into_cart_states = {
     "EMPTY_CART": 8_2
 }
 
+product_list_states = {
+    "LIST": 9_0,
+    "PREVIOUS": 9_1,
+    "NEXT": 9_2,
+    "ADD": 9_3,
+    "SHOW_PHOTOS": 9_4
+}
+
 
 async def delete_last_msg(update: Update, context=None):
     """Delete last message from user"""
@@ -112,6 +140,83 @@ async def delete_last_msg(update: Update, context=None):
     await update.effective_message.delete()
 
 
+def caption_length(text: str):
+    """Length of markdown caption as telegram counts it: without markup, in UTF-16 code units"""
+
+    text = re.sub(r"\\(.)|[*_`]", r"\1", text)
+    return len(text.encode("utf-16-le")) // 2
+
+
+def fit_caption(lines: list):
+    """Whole lines of markdown text which fit a photo caption"""
+
+    caption = ""
+    for line in lines:
+        if caption_length(caption + line) > MessageLimit.CAPTION_LENGTH:
+            break
+        caption += line
+
+    return caption
+
+
+def send_notifications(chat_ids: list, text: str):
+    """Queue the same notification to each chat, they are sent after answers to users"""
+
+    for chat_id in chat_ids:
+        notifications.enqueue(chat_id, text)
+
+
+async def notify_low_stock():
+    """Send admins one digest of parts which are forecast to run out of stock"""
+
+    low_stock_parts = await sync_to_async(lifecycle.run_job, thread_sensitive=False)(stock.forecast_low_stock)
+
+    if not low_stock_parts:
+        return
+
+    text = f"*[⚠️ товары заканчиваются]*\n\n"
+
+    for part, sales_velocity, days_left in low_stock_parts[:CONFIG.LOW_STOCK_DIGEST_MAX_PARTS]:
+        text += (
+            f"● {part.name}, id: {part.part_id}\n"
+            f"_осталось {part.available_count} шт., продается {sales_velocity:.1f} шт./день, "
+            f"хватит на {days_left:.1f} дн._\n\n"
+        )
+
+    if len(low_stock_parts) > CONFIG.LOW_STOCK_DIGEST_MAX_PARTS:
+        text += f"_и еще {len(low_stock_parts) - CONFIG.LOW_STOCK_DIGEST_MAX_PARTS} товаров_"
+
+    send_notifications(cache.admins_with_notifications_enabled(), text)
+
+
+async def evict_idle_sessions():
+    """Forget conversations and user_data of users idle for a long time, in the loop where handlers use them"""
+
+    sessions.evict_idle(ptb_application)
+
+
+async def get_cart(context: ContextTypes.DEFAULT_TYPE):
+    """Get user's cart from the cart buffer or db, creating a new one if the old one was cleaned up as abandoned"""
+
+    order = cart_buffer.get(context.user_data.get("order_id"))
+    if order is not None:
+        return order
+
+    try:
+        order = await models.Order.objects.aget(order_id=context.user_data.get("order_id"))
+    except models.Order.DoesNotExist:
+        order, _ = await models.Order.objects.aget_or_create(user_id=context.user_data.get("user_id"))
+        context.user_data["order_id"] = order.order_id
+
+    return cart_buffer.keep(order)
+
+
+async def save_cart(order: models.Order):
+    """Mark cart contents changed, the cart buffer writes them with the time of the last change"""
+
+    cart_buffer.changed(order)
+
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Display start message"""
 
@@ -140,7 +245,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         order = await models.Order.objects.aget(user=user)
     except:
         order = await models.Order.objects.acreate(user=user)
-        logger.info(f"[PTB] Order [id: {order.order_id}] from user [{user}] created")
+        logger.info("[PTB] Order [id: %s] from user [%s] created", order.order_id, user, extra={"order_id": order.order_id})
 
     text = (
         f"*{CONFIG.TITLE}*\n"
@@ -150,26 +255,26 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     keyboard = [
         [
-            InlineKeyboardButton("🛍 перейти в каталог", callback_data=str(top_states["CHOOSE_CATEGORY"]))
+            InlineKeyboardButton("🛍 перейти в каталог", callback_data=callbacks.encode(top_states["CHOOSE_CATEGORY"]))
         ],
         [
-            InlineKeyboardButton("🛒 корзина", callback_data=str(top_states["INTO_CART"]))
+            InlineKeyboardButton("🛒 корзина", callback_data=callbacks.encode(top_states["INTO_CART"]))
         ],
         [
-            InlineKeyboardButton("🕓 выполняемые заказы", callback_data=str(top_states["CONFIRMED_ORDER_LIST"]))
+            InlineKeyboardButton("🕓 выполняемые заказы", callback_data=callbacks.encode(top_states["CONFIRMED_ORDER_LIST"]))
         ],
         [
-            InlineKeyboardButton("✅ завершенные заказы", callback_data=str(top_states["COMPLETED_ORDER_LIST"]))
+            InlineKeyboardButton("✅ завершенные заказы", callback_data=callbacks.encode(top_states["COMPLETED_ORDER_LIST"]))
         ],
         [
-            InlineKeyboardButton("📝 редактировать профиль", callback_data=str(top_states["USER_PROFILE_EDIT"]))
+            InlineKeyboardButton("📝 редактировать профиль", callback_data=callbacks.encode(top_states["USER_PROFILE_EDIT"]))
         ]
     ]
     
-    if await models.Admin.objects.filter(admin_id=user_id).aexists():
+    if user_id in cache.admins:
         keyboard.insert(
             0,
-            [InlineKeyboardButton("[🪪 admin] войти", callback_data=str(top_states["ADMIN_PANEL"]))]
+            [InlineKeyboardButton("[🪪 admin] войти", callback_data=callbacks.encode(top_states["ADMIN_PANEL"]))]
         )
 
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -181,7 +286,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         await query.edit_message_media(
             media=InputMediaPhoto(
-                media=f"{URL}/static/img/bot/malarka_shop_bot_logo.jpg?a={CONFIG.TIMESTAMP_START}",
+                media=assets.static_url("img/bot/malarka_shop_bot_logo.jpg"),
                 caption=text,
                 parse_mode=ParseMode.MARKDOWN,
             ),
@@ -192,7 +297,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await delete_last_msg(update)
 
         await update.message.reply_photo(
-            photo=f"{URL}/static/img/bot/malarka_shop_bot_logo.jpg?a={CONFIG.TIMESTAMP_START}",
+            photo=assets.static_url("img/bot/malarka_shop_bot_logo.jpg"),
             caption=text,
             parse_mode=ParseMode.MARKDOWN,
             reply_markup=reply_markup
@@ -201,6 +306,20 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return top_states["START"]
 
 
+async def update_profile(user: models.User, profile: dict):
+    """Write fields of user profile which differ from the saved ones, return True if any did"""
+
+    changed_fields = {field: value for field, value in profile.items() if getattr(user, field) != value}
+    if not changed_fields:
+        return False
+
+    for field, value in changed_fields.items():
+        setattr(user, field, value)
+    await models.User.objects.filter(user_id=user.user_id).aupdate(**changed_fields)
+
+    return True
+
+
 async def user_profile_edit(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Edit user profile settings"""
 
@@ -209,7 +328,7 @@ async def user_profile_edit(update: Update, context: ContextTypes.DEFAULT_TYPE):
         query = update.callback_query
         await query.answer()
 
-        callback = query.data
+        callback = callbacks.code(query.data)
 
     user_id = update.effective_chat.id
     tg_username = update.effective_chat.username
@@ -225,13 +344,13 @@ async def user_profile_edit(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     keyboard = [
         [
-            InlineKeyboardButton("👤 указать имя", callback_data=str(user_profile_edit_states["ENTER_NAME"]))
+            InlineKeyboardButton("👤 указать имя", callback_data=callbacks.encode(user_profile_edit_states["ENTER_NAME"]))
         ],
         [
-            InlineKeyboardButton("📞 указать моб. телефон", callback_data=str(user_profile_edit_states["ENTER_PHONE_NUMBER"]))
+            InlineKeyboardButton("📞 указать моб. телефон", callback_data=callbacks.encode(user_profile_edit_states["ENTER_PHONE_NUMBER"]))
         ],
         [
-            InlineKeyboardButton("📍 указать адрес доставки", callback_data=str(user_profile_edit_states["ENTER_DELIVERY_ADDRESS"]))
+            InlineKeyboardButton("📍 указать адрес доставки", callback_data=callbacks.encode(user_profile_edit_states["ENTER_DELIVERY_ADDRESS"]))
         ]
     ]
 
@@ -259,26 +378,23 @@ async def user_profile_edit(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         if user_name and user_phone_number and user_delivery_address:
             keyboard.append(
-                [InlineKeyboardButton("✅ готово", callback_data=str(top_states["START"]))]
+                [InlineKeyboardButton("✅ готово", callback_data=callbacks.encode(top_states["START"]))]
             )
 
-            if await models.User.objects.filter(user_id=user_id).aexists():
-                await models.User.objects.filter(user_id=user_id).aupdate(
-                    username=tg_username,
-                    name=user_name,
-                    phone_number=user_phone_number,
-                    delivery_address=user_delivery_address
-                )
-                logger.info(f"[PTB] User [id: {user_id}, username: {tg_username}, name: {user_name}] updated")
+            user = await models.User.objects.filter(user_id=user_id).afirst()
+            profile = {
+                "username": tg_username,
+                "name": user_name,
+                "phone_number": user_phone_number,
+                "delivery_address": user_delivery_address
+            }
+
+            if user is not None:
+                if await update_profile(user, profile):
+                    logger.info("[PTB] User [id: %s, username: %s, name: %s] updated", user_id, tg_username, user_name)
             else:
-                await models.User.objects.acreate(
-                    user_id=user_id,
-                    username=tg_username,
-                    name=user_name,
-                    phone_number=user_phone_number,
-                    delivery_address=user_delivery_address
-                )
-                logger.info(f"[PTB] User [id: {user_id}, username: {tg_username}, name: {user_name}] registered")
+                await models.User.objects.acreate(user_id=user_id, **profile)
+                logger.info("[PTB] User [id: %s, username: %s, name: %s] registered", user_id, tg_username, user_name)
 
     else:
         text = (
@@ -287,19 +403,17 @@ async def user_profile_edit(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
         keyboard.append(
-            [InlineKeyboardButton("↩️ назад", callback_data=str(top_states["START"]))]
+            [InlineKeyboardButton("↩️ назад", callback_data=callbacks.encode(top_states["START"]))]
         )
 
         user = await models.User.objects.aget(user_id=user_id)
 
-        if user_name:
-            user.name = user_name
-
-        if user_phone_number:
-            user.phone_number = user_phone_number
-
-        if user_delivery_address:
-            user.delivery_address = user_delivery_address
+        await update_profile(user, {
+            "username": tg_username,
+            "name": user_name or user.name,
+            "phone_number": user_phone_number or user.phone_number,
+            "delivery_address": user_delivery_address or user.delivery_address
+        })
 
         text += (
             f"👤 *ваше имя*: _{user.name}_\n"
@@ -307,26 +421,19 @@ async def user_profile_edit(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"📍 *адрес доставки*: _{user.delivery_address}_\n"
         )
 
-        await models.User.objects.filter(user_id=user_id).aupdate(
-                username=tg_username,
-                name=user.name,
-                phone_number=user.phone_number,
-                delivery_address=user.delivery_address
-            )
-
     reply_markup = InlineKeyboardMarkup(keyboard)
 
     if context.user_data.get("msg_id") == None and callback == None:
         await update.message.reply_photo(
-            photo=f"{URL}/static/img/bot/malarka_shop_bot_user_profile_edit.jpg?a={CONFIG.TIMESTAMP_START}",
+            photo=assets.static_url("img/bot/malarka_shop_bot_user_profile_edit.jpg"),
             caption=text,
             parse_mode=ParseMode.MARKDOWN,
             reply_markup=reply_markup
         )
-    elif callback == str(top_states["USER_PROFILE_EDIT"]):
+    elif callback == top_states["USER_PROFILE_EDIT"]:
         await query.edit_message_media(
             media=InputMediaPhoto(
-                media=f"{URL}/static/img/bot/malarka_shop_bot_user_profile_edit.jpg?a={CONFIG.TIMESTAMP_START}",
+                media=assets.static_url("img/bot/malarka_shop_bot_user_profile_edit.jpg"),
                 caption=text,
                 parse_mode=ParseMode.MARKDOWN,
             ),
@@ -337,7 +444,7 @@ async def user_profile_edit(update: Update, context: ContextTypes.DEFAULT_TYPE):
             chat_id=user_id,
             message_id=context.user_data.get("msg_id"),
             media=InputMediaPhoto(
-                media=f"{URL}/static/img/bot/malarka_shop_bot_user_profile_edit.jpg?a={CONFIG.TIMESTAMP_START}",
+                media=assets.static_url("img/bot/malarka_shop_bot_user_profile_edit.jpg"),
                 caption=text,
                 parse_mode=ParseMode.MARKDOWN,
             ),
@@ -448,7 +555,7 @@ async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
 
-    callback = query.data
+    callback = callbacks.code(query.data)
 
     text = (
         f"*{CONFIG.TITLE}*\n"
@@ -458,15 +565,16 @@ async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     admin = await models.Admin.objects.aget(admin_id=context.user_data.get("user_id"))
 
-    if callback == str(admin_panel_states["NOTIFICATIONS_ON_OFF"]):
+    if callback == admin_panel_states["NOTIFICATIONS_ON_OFF"]:
         admin.is_notification_enabled = not admin.is_notification_enabled
         await models.Admin.objects.filter(admin_id=admin.admin_id).aupdate(is_notification_enabled=admin.is_notification_enabled)
+        cache.admins[admin.admin_id] = admin.is_notification_enabled
 
     text += f"*[статистика на сегодня]*\n\n"
 
     confirmed_orders_count = await models.ConfirmedOrder.objects.filter(is_accepted=False).acount()
     accepted_orders_count = await models.ConfirmedOrder.objects.filter(is_accepted=True).acount()
-    completed_orders_count = await models.CompletedOrder.objects.all().acount()
+    completed_orders_count = await sync_to_async(analytics.completed_orders_count)()
     available_parts_count = await models.Part.objects.filter(is_available=True).acount()
         
     text += (
@@ -485,16 +593,19 @@ async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     keyboard = [
         [
-            InlineKeyboardButton("[🪪 admin] выйти", callback_data=str(top_states["START"]))
+            InlineKeyboardButton("[🪪 admin] выйти", callback_data=callbacks.encode(top_states["START"]))
         ],
         [
-            InlineKeyboardButton("🔄 обновить информацию", callback_data=str(top_states["ADMIN_PANEL"]))
+            InlineKeyboardButton("🔄 обновить информацию", callback_data=callbacks.encode(top_states["ADMIN_PANEL"]))
         ],
         [
-            InlineKeyboardButton("🔔 вкл/выкл уведомления о заказах", callback_data=str(admin_panel_states["NOTIFICATIONS_ON_OFF"]))
+            InlineKeyboardButton("🔔 вкл/выкл уведомления о заказах", callback_data=callbacks.encode(admin_panel_states["NOTIFICATIONS_ON_OFF"]))
         ],
         [
-            InlineKeyboardButton("🕓 выполняемые заказы", callback_data=str(admin_panel_states["ALL_CONFIRMED_ORDER_LIST"]))
+            InlineKeyboardButton("🕓 выполняемые заказы", callback_data=callbacks.encode(admin_panel_states["ALL_CONFIRMED_ORDER_LIST"]))
+        ],
+        [
+            InlineKeyboardButton("📊 статистика продаж", callback_data=callbacks.encode(admin_panel_states["SALES_REPORT"]))
         ]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -502,7 +613,7 @@ async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try: # ingnore telegram.error.BadRequest: Message on the same message
         await query.edit_message_media(
             media=InputMediaPhoto(
-                media=f"{URL}/static/img/bot/malarka_shop_bot_admin_panel.jpg?a={CONFIG.TIMESTAMP_START}",
+                media=assets.static_url("img/bot/malarka_shop_bot_admin_panel.jpg"),
                 caption=text,
                 parse_mode=ParseMode.MARKDOWN,
             ),
@@ -514,11 +625,57 @@ async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return top_states["ADMIN_PANEL"]
 
 
+async def sales_report(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    "Sales report from analytics rollups"
+
+    query = update.callback_query
+    await query.answer()
+
+    report = await sync_to_async(analytics.sales_report)()
+
+    lines = [
+        f"*[📊 продажи за {report['days']} дн.]*\n"
+        f"_с {report['since'].strftime('%d.%m.%Y')}, без заказов последних минут_\n\n\n"
+        f"💵 выручка: *{report['revenue']} руб.*\n\n"
+        f"📦 *{report['orders_count']} заказов*, *{report['items_count']} шт.*\n"
+        f"средний чек: _{report['average_order_cost']} руб._\n\n"
+        f"🔁 повторные заказы: _{report['repeat_orders_rate']:.0%}_\n"
+        f"постоянные покупатели: _{report['repeat_customers_rate']:.0%}_\n\n"
+        f"🕓 до принятия: _{report['average_accept_hours']:.1f} ч._\n"
+        f"🚚 доставка: _{report['average_complete_hours']:.1f} ч._\n\n"
+    ]
+
+    if report["by_category"]:
+        lines.append(f"*[по категориям]*\n")
+        for category in report["by_category"][:CONFIG.ANALYTICS_TOP_PARTS_COUNT]:
+            lines.append(f"● {CONFIG.CATEGORY_CHOICES.get(category['category'], category['category'])}: _{money.amount(category['total_revenue'])} руб._\n")
+        lines.append(f"\n")
+
+    if report["top_parts"]:
+        lines.append(f"*[топ товаров]*\n")
+        for part in report["top_parts"]:
+            lines.append(f"● {part['part_name']}, {part['items_count']} шт.: _{money.amount(part['total_revenue'])} руб._\n")
+
+    keyboard = [
+        [InlineKeyboardButton("↩️ назад", callback_data=callbacks.encode(top_states["ADMIN_PANEL"]))]
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+
+    await query.edit_message_caption(
+        # cut at a line, so that markup of the last line isn't split
+        caption=fit_caption(lines),
+        parse_mode=ParseMode.MARKDOWN,
+        reply_markup=reply_markup
+    )
+
+    return top_states["ADMIN_PANEL"]
+
+
 async def all_confirmed_order_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
     "List of all confirmed orders from all users"
 
     query = update.callback_query
-    callback = query.data
+    callback = callbacks.code(query.data)
     await query.answer()
 
     order = None
@@ -528,7 +685,7 @@ async def all_confirmed_order_list(update: Update, context: ContextTypes.DEFAULT
         f"*[🕓 выполняемые заказы]*\n\n\n"
     )
 
-    if callback == str(admin_panel_states["ALL_CONFIRMED_ORDER_LIST"]):
+    if callback == admin_panel_states["ALL_CONFIRMED_ORDER_LIST"]:
         order = await models.ConfirmedOrder.objects.all().afirst()
 
         if order:
@@ -536,43 +693,43 @@ async def all_confirmed_order_list(update: Update, context: ContextTypes.DEFAULT
 
         context.user_data["all_confirmed_order_id"] = order_id
 
-    if callback == str(all_confirmed_order_states["PREVIOUS"]):
+    if callback == all_confirmed_order_states["PREVIOUS"]:
         order = await models.ConfirmedOrder.objects.filter(order_id__lt=order_id).alast()
         if not order:
             order = await models.ConfirmedOrder.objects.all().alast()
         if order:
             context.user_data["all_confirmed_order_id"] = order.order_id
 
-    if callback == str(all_confirmed_order_states["NEXT"]):
+    if callback == all_confirmed_order_states["NEXT"]:
         order = await models.ConfirmedOrder.objects.filter(order_id__gt=order_id).afirst()
         if not order:
             order = await models.ConfirmedOrder.objects.all().afirst()
         if order:
             context.user_data["all_confirmed_order_id"] = order.order_id
 
-    if callback == str(all_confirmed_order_states["CANCEL_ORDER"]):
+    if callback == all_confirmed_order_states["CANCEL_ORDER"]:
         try:
             order = await models.ConfirmedOrder.objects.aget(order_id=order_id)
             user = await sync_to_async(lambda: order.user)()
             
             await models.ConfirmedOrder.objects.filter(order_id=order_id).adelete()
 
-            logger.info(f"[PTB] Order [id: {order.order_id}] from user [{user}] canceled")
+            logger.info("[PTB] Order [id: %s] from user [%s] canceled", order.order_id, user, extra={"order_id": order.order_id})
 
             text_to_user = (
                 f"🔔 ваш заказ *№{order.order_id}*   ❌  отменён\n\n"
                 f"_товары в заказе:_\n"
             )
 
-            for part_id in order.parts:
-                count = order.parts[part_id]['count']
-                price = order.parts[part_id]['price']
-                name = order.parts[part_id]['name']
+            for part_id, line in (await versions.aresolve(order.parts)).items():
+                count = line['count']
+                price = line['price']
+                name = line['name']
 
                 part = await models.Part.objects.aget(part_id=part_id)
                 await models.Part.objects.filter(part_id=part_id).aupdate(available_count=part.available_count+count, is_available=True)
 
-                cost = round(count * price, 2)
+                cost = money.line_cost(count, price)
 
                 text_to_user += (
                     f"● *{name}*\n"
@@ -581,67 +738,19 @@ async def all_confirmed_order_list(update: Update, context: ContextTypes.DEFAULT
 
             text_to_user += f"\n💵 стоимость: _{order.cost}р._"
 
-            await context.bot.send_message(
-                chat_id=user.user_id,
-                text=text_to_user,
-                parse_mode=ParseMode.MARKDOWN,
-            )
-        except:
-            order = None
+            await sync_to_async(cache.refresh_parts)(order.parts.keys())
 
-    if callback == str(all_confirmed_order_states["ACCEPT_ORDER"]):
-        try:
-            order = await models.ConfirmedOrder.objects.aget(order_id=order_id)
-            user = await sync_to_async(lambda: order.user)()
-
-            order.is_accepted = True
-            order.accepted_time = datetime.now(timezone.utc)
-            
-            await models.ConfirmedOrder.objects.filter(order_id=order_id).aupdate(
-                is_accepted = order.is_accepted,
-                accepted_time = order.accepted_time
-            )
-
-            logger.info(f"[PTB] Order [id: {order.order_id}] from user [{user}] applied")
-
-            text_to_user = f"🔔 ваш заказ *№{order.order_id}*   📥  принят"
-
-            await context.bot.send_message(
-                chat_id=user.user_id,
-                text=text_to_user,
-                parse_mode=ParseMode.MARKDOWN,
-            )
+            send_notifications([user.user_id], text_to_user)
         except:
             order = None
 
-    if callback == str(all_confirmed_order_states["COMPLETE_ORDER"]):
-        try:
-            order = await models.ConfirmedOrder.objects.aget(order_id=order_id)
-            user = await sync_to_async(lambda: order.user)()
-            
-            await models.CompletedOrder.objects.acreate(
-                order_id = order.order_id,
-                user = user,
-                parts = order.parts,
-                cost = order.cost,
-                ordered_time = order.ordered_time,
-                accepted_time = order.accepted_time,
-                completed_time = datetime.now(timezone.utc)
-            )
+    if callback == all_confirmed_order_states["ACCEPT_ORDER"]:
+        await sync_to_async(orders.accept_orders)([order_id])
+        order = await models.ConfirmedOrder.objects.filter(order_id=order_id).afirst()
 
-            await models.ConfirmedOrder.objects.filter(order_id=order_id).adelete()
-
-            logger.info(f"[PTB] Order [id: {order.order_id}] from user [{user}] completed")
-
-            text_to_user = f"🔔 ваш заказ *№{order.order_id}*   ✅  завершён"
-
-            await context.bot.send_message(
-                chat_id=user.user_id,
-                text=text_to_user,
-                parse_mode=ParseMode.MARKDOWN,
-            )
-        except:
-            order = None
+    if callback == all_confirmed_order_states["COMPLETE_ORDER"]:
+        completed_orders = await sync_to_async(orders.complete_orders)([order_id])
+        order = completed_orders[0] if completed_orders else None
 
     if order:
         ordered_time = order.ordered_time + CONFIG.TZ_OFFSET
@@ -663,12 +772,12 @@ async def all_confirmed_order_list(update: Update, context: ContextTypes.DEFAULT
         else:
             text += f"*требует подтверждения* ❌\n\n"
 
-        for part_id in order.parts:
-            count = order.parts[part_id]['count']
-            price = order.parts[part_id]['price']
-            name = order.parts[part_id]['name']
+        for part_id, line in (await versions.aresolve(order.parts)).items():
+            count = line['count']
+            price = line['price']
+            name = line['name']
 
-            cost = round(count * price, 2)
+            cost = money.line_cost(count, price)
 
             text += (
                 f"● *{name}*, id: *{part_id}*\n"
@@ -677,50 +786,56 @@ async def all_confirmed_order_list(update: Update, context: ContextTypes.DEFAULT
 
         text += f"\n💵 стоимость: _{order.cost}р._\n\n"
 
-        if callback == str(all_confirmed_order_states["CANCEL_ORDER"]):
+        if callback == all_confirmed_order_states["CANCEL_ORDER"]:
             text += f"🗑 *заказ отменён и удалён у пользователя*"
 
             keyboard = [
-                [InlineKeyboardButton("↩️ назад", callback_data=str(admin_panel_states["ALL_CONFIRMED_ORDER_LIST"]))]
+                [InlineKeyboardButton("↩️ назад", callback_data=callbacks.encode(admin_panel_states["ALL_CONFIRMED_ORDER_LIST"]))]
             ]
 
-        elif callback == str(all_confirmed_order_states["COMPLETE_ORDER"]):
+        elif callback == all_confirmed_order_states["COMPLETE_ORDER"]:
             text += f"✅ *заказ завершён*"
 
             keyboard = [
-                [InlineKeyboardButton("↩️ назад", callback_data=str(admin_panel_states["ALL_CONFIRMED_ORDER_LIST"]))]
+                [InlineKeyboardButton("↩️ назад", callback_data=callbacks.encode(admin_panel_states["ALL_CONFIRMED_ORDER_LIST"]))]
             ]
 
         elif order.is_accepted:
             keyboard = [
                 [
-                    InlineKeyboardButton("⬅️", callback_data=str(all_confirmed_order_states["PREVIOUS"])),
-                    InlineKeyboardButton("➡️", callback_data=str(all_confirmed_order_states["NEXT"])),
+                    InlineKeyboardButton("⬅️", callback_data=callbacks.encode(all_confirmed_order_states["PREVIOUS"])),
+                    InlineKeyboardButton("➡️", callback_data=callbacks.encode(all_confirmed_order_states["NEXT"])),
                 ],
                 [
-                    InlineKeyboardButton("✅ завершить", callback_data=str(all_confirmed_order_states["COMPLETE_ORDER"]))
+                    InlineKeyboardButton("✅ завершить", callback_data=callbacks.encode(all_confirmed_order_states["COMPLETE_ORDER"]))
                 ],
                 [
-                    InlineKeyboardButton("❌ отменить", callback_data=str(all_confirmed_order_states["CANCEL_ORDER"]))
+                    InlineKeyboardButton("❌ отменить", callback_data=callbacks.encode(all_confirmed_order_states["CANCEL_ORDER"]))
                 ],
                 [
-                    InlineKeyboardButton("↩️ назад", callback_data=str(top_states["ADMIN_PANEL"]))
+                    InlineKeyboardButton("☑️ выбрать несколько", callback_data=callbacks.encode(all_confirmed_order_states["SELECT_ORDERS"]))
+                ],
+                [
+                    InlineKeyboardButton("↩️ назад", callback_data=callbacks.encode(top_states["ADMIN_PANEL"]))
                 ]
             ]
         else:
             keyboard = [
                 [
-                    InlineKeyboardButton("⬅️", callback_data=str(all_confirmed_order_states["PREVIOUS"])),
-                    InlineKeyboardButton("➡️", callback_data=str(all_confirmed_order_states["NEXT"])),
+                    InlineKeyboardButton("⬅️", callback_data=callbacks.encode(all_confirmed_order_states["PREVIOUS"])),
+                    InlineKeyboardButton("➡️", callback_data=callbacks.encode(all_confirmed_order_states["NEXT"])),
                 ],
                 [
-                    InlineKeyboardButton("📥 принять", callback_data=str(all_confirmed_order_states["ACCEPT_ORDER"]))
+                    InlineKeyboardButton("📥 принять", callback_data=callbacks.encode(all_confirmed_order_states["ACCEPT_ORDER"]))
                 ],
                 [
-                    InlineKeyboardButton("❌ отменить", callback_data=str(all_confirmed_order_states["CANCEL_ORDER"]))
+                    InlineKeyboardButton("❌ отменить", callback_data=callbacks.encode(all_confirmed_order_states["CANCEL_ORDER"]))
                 ],
                 [
-                    InlineKeyboardButton("↩️ назад", callback_data=str(top_states["ADMIN_PANEL"]))
+                    InlineKeyboardButton("☑️ выбрать несколько", callback_data=callbacks.encode(all_confirmed_order_states["SELECT_ORDERS"]))
+                ],
+                [
+                    InlineKeyboardButton("↩️ назад", callback_data=callbacks.encode(top_states["ADMIN_PANEL"]))
                 ]
             ]
 
@@ -728,15 +843,15 @@ async def all_confirmed_order_list(update: Update, context: ContextTypes.DEFAULT
         text += CONFIG.EMPTY_TEXT
 
         keyboard = [
-            [InlineKeyboardButton("↩️ назад", callback_data=str(top_states["ADMIN_PANEL"]))]
+            [InlineKeyboardButton("↩️ назад", callback_data=callbacks.encode(top_states["ADMIN_PANEL"]))]
         ]
 
     reply_markup = InlineKeyboardMarkup(keyboard)
 
-    if callback == str(admin_panel_states["ALL_CONFIRMED_ORDER_LIST"]):
+    if callback == admin_panel_states["ALL_CONFIRMED_ORDER_LIST"]:
         await query.edit_message_media(
             media=InputMediaPhoto(
-                media=f"{URL}/static/img/bot/malarka_shop_bot_all_confirmed_orders.jpg?a={CONFIG.TIMESTAMP_START}",
+                media=assets.static_url("img/bot/malarka_shop_bot_all_confirmed_orders.jpg"),
                 caption=text,
                 parse_mode=ParseMode.MARKDOWN,
             ),
@@ -755,11 +870,110 @@ async def all_confirmed_order_list(update: Update, context: ContextTypes.DEFAULT
     return admin_panel_states["ALL_CONFIRMED_ORDER_LIST"]
 
 
+async def select_confirmed_orders(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    "Multi-select of confirmed orders from all users to accept or complete them at once"
+
+    query = update.callback_query
+    callback = callbacks.code(query.data)
+    await query.answer()
+
+    selected_order_ids = context.user_data.setdefault("selected_order_ids", set())
+
+    shown_orders = [
+        order async for order in models.ConfirmedOrder.objects.select_related("user")
+        .order_by("order_id")[:CONFIG.BULK_ORDERS_PAGE_SIZE]
+    ]
+
+    text = (
+        f"*[☑️ выбор заказов]*\n\n\n"
+    )
+
+    if callback == all_confirmed_order_states["SELECT_ORDERS"]:
+        selected_order_ids.clear()
+
+    if callback == all_confirmed_order_states["TOGGLE_ORDER"]:
+        order_id = callbacks.number(context.args[0])
+        selected_order_ids.symmetric_difference_update({order_id})
+
+    if callback == all_confirmed_order_states["SELECT_ALL_ORDERS"]:
+        selected_order_ids.update(order.order_id for order in shown_orders)
+
+    if callback == all_confirmed_order_states["ACCEPT_SELECTED_ORDERS"]:
+        accepted_orders = await sync_to_async(orders.accept_orders)(selected_order_ids)
+        selected_order_ids.clear()
+        text += f"📥 *{len(accepted_orders)} заказов* принято\n\n"
+
+    if callback == all_confirmed_order_states["COMPLETE_SELECTED_ORDERS"]:
+        completed_orders = await sync_to_async(orders.complete_orders)(selected_order_ids)
+        selected_order_ids.clear()
+        text += f"✅ *{len(completed_orders)} заказов* завершено\n\n"
+
+    if callback in (
+        all_confirmed_order_states["ACCEPT_SELECTED_ORDERS"],
+        all_confirmed_order_states["COMPLETE_SELECTED_ORDERS"]
+    ):
+        # show orders in their new state
+        shown_orders = [
+            order async for order in models.ConfirmedOrder.objects.select_related("user")
+            .order_by("order_id")[:CONFIG.BULK_ORDERS_PAGE_SIZE]
+        ]
+
+    # orders processed by other admins can't be selected anymore
+    selected_order_ids.intersection_update(order.order_id for order in shown_orders)
+
+    keyboard = list()
+
+    if shown_orders:
+        text += (
+            f"_выберите заказы, затем действие._\n"
+            f"_принимаются только ожидающие подтверждения, завершаются только принятые_\n\n"
+            f"выбрано: *{len(selected_order_ids)}*"
+        )
+
+        for order in shown_orders:
+            mark = "✅" if order.order_id in selected_order_ids else "⬜️"
+            status = "📦" if order.is_accepted else "🕓"
+            keyboard.append([
+                InlineKeyboardButton(
+                    f"{mark} №{order.order_id} {status} {order.user.name}, {order.cost}р.",
+                    callback_data=callbacks.encode(all_confirmed_order_states["TOGGLE_ORDER"], order.order_id)
+                )
+            ])
+
+        keyboard += [
+            [
+                InlineKeyboardButton("☑️ выбрать все", callback_data=callbacks.encode(all_confirmed_order_states["SELECT_ALL_ORDERS"]))
+            ],
+            [
+                InlineKeyboardButton("📥 принять", callback_data=callbacks.encode(all_confirmed_order_states["ACCEPT_SELECTED_ORDERS"])),
+                InlineKeyboardButton("✅ завершить", callback_data=callbacks.encode(all_confirmed_order_states["COMPLETE_SELECTED_ORDERS"]))
+            ]
+        ]
+    else:
+        text += CONFIG.EMPTY_TEXT
+
+    keyboard.append(
+        [InlineKeyboardButton("↩️ назад", callback_data=callbacks.encode(admin_panel_states["ALL_CONFIRMED_ORDER_LIST"]))]
+    )
+    reply_markup = InlineKeyboardMarkup(keyboard)
+
+    try: # ingnore telegram.error.BadRequest: Message on the same message
+        await query.edit_message_caption(
+            caption=text,
+            reply_markup=reply_markup,
+            parse_mode=ParseMode.MARKDOWN
+        )
+    except:
+        pass
+
+    return admin_panel_states["ALL_CONFIRMED_ORDER_LIST"]
+
+
 async def confirmed_order_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """List of user's confirmed orders"""
 
     query = update.callback_query
-    callback = query.data
+    callback = callbacks.code(query.data)
     await query.answer()
 
     order = None
@@ -772,21 +986,21 @@ async def confirmed_order_list(update: Update, context: ContextTypes.DEFAULT_TYP
         f"*[🕓 ваши заказы]*\n\n\n"
     )
 
-    if callback == str(top_states["CONFIRMED_ORDER_LIST"]):
+    if callback == top_states["CONFIRMED_ORDER_LIST"]:
         order = await models.ConfirmedOrder.objects.filter(user=user).afirst()
         if order:
             order_id = order.order_id
 
         context.user_data["confirmed_order_id"] = order_id
 
-    if callback == str(confirmed_order_states["PREVIOUS"]):
+    if callback == confirmed_order_states["PREVIOUS"]:
         order = await models.ConfirmedOrder.objects.filter(Q(user=user) & Q(order_id__lt=order_id)).alast()
         if not order:
             order = await models.ConfirmedOrder.objects.filter(user=user).alast()
         if order:
             context.user_data["confirmed_order_id"] = order.order_id
 
-    if callback == str(confirmed_order_states["NEXT"]):
+    if callback == confirmed_order_states["NEXT"]:
         order = await models.ConfirmedOrder.objects.filter(Q(user=user) & Q(order_id__gt=order_id)).afirst()
         if not order:
             order = await models.ConfirmedOrder.objects.filter(user=user).afirst()
@@ -807,12 +1021,12 @@ async def confirmed_order_list(update: Update, context: ContextTypes.DEFAULT_TYP
         else:
             text += f"принят: 🕓 _в обработке_\n\n"
 
-        for part_id in order.parts:
-            count = order.parts[part_id]['count']
-            price = order.parts[part_id]['price']
-            name = order.parts[part_id]['name']
+        for part_id, line in (await versions.aresolve(order.parts)).items():
+            count = line['count']
+            price = line['price']
+            name = line['name']
 
-            cost = round(count * price, 2)
+            cost = money.line_cost(count, price)
 
             text += (
                 f"● *{name}*\n"
@@ -823,26 +1037,26 @@ async def confirmed_order_list(update: Update, context: ContextTypes.DEFAULT_TYP
 
         keyboard = [
             [
-                InlineKeyboardButton("⬅️", callback_data=str(confirmed_order_states["PREVIOUS"])),
-                InlineKeyboardButton("➡️", callback_data=str(confirmed_order_states["NEXT"])),
+                InlineKeyboardButton("⬅️", callback_data=callbacks.encode(confirmed_order_states["PREVIOUS"])),
+                InlineKeyboardButton("➡️", callback_data=callbacks.encode(confirmed_order_states["NEXT"])),
             ],
             [
-                InlineKeyboardButton("↩️ назад", callback_data=str(top_states["START"]))
+                InlineKeyboardButton("↩️ назад", callback_data=callbacks.encode(top_states["START"]))
             ]
         ]
     else:
         text += CONFIG.EMPTY_TEXT
 
         keyboard = [
-            [InlineKeyboardButton("↩️ назад", callback_data=str(top_states["START"]))]
+            [InlineKeyboardButton("↩️ назад", callback_data=callbacks.encode(top_states["START"]))]
         ]
 
     reply_markup = InlineKeyboardMarkup(keyboard)
 
-    if callback == str(top_states["CONFIRMED_ORDER_LIST"]):
+    if callback == top_states["CONFIRMED_ORDER_LIST"]:
         await query.edit_message_media(
             media=InputMediaPhoto(
-                media=f"{URL}/static/img/bot/malarka_shop_bot_confirmed_orders.jpg?a={CONFIG.TIMESTAMP_START}",
+                media=assets.static_url("img/bot/malarka_shop_bot_confirmed_orders.jpg"),
                 caption=text,
                 parse_mode=ParseMode.MARKDOWN,
             ),
@@ -861,15 +1075,42 @@ async def confirmed_order_list(update: Update, context: ContextTypes.DEFAULT_TYP
     return top_states["CONFIRMED_ORDER_LIST"]
 
 
+# recent completed orders are paged first, archive is queried only when user pages past them
+completed_order_sources = (models.CompletedOrder, models.ArchivedCompletedOrder)
+
+
+async def step_completed_order(user: models.User, order_id, source: int, forward: bool):
+    """Find user's completed order next to the given one, moving to the next source at the end of current one"""
+
+    if order_id is not None:
+        user_orders = completed_order_sources[source].objects.filter(user=user)
+        if forward:
+            order = await user_orders.filter(order_id__gt=order_id).afirst()
+        else:
+            order = await user_orders.filter(order_id__lt=order_id).alast()
+        if order:
+            return order, source
+
+    for offset in range(1, len(completed_order_sources) + 1):
+        next_source = (source + offset if forward else source - offset) % len(completed_order_sources)
+        user_orders = completed_order_sources[next_source].objects.filter(user=user)
+        order = await (user_orders.afirst() if forward else user_orders.alast())
+        if order:
+            return order, next_source
+
+    return None, source
+
+
 async def completed_order_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """List of user's completed orders"""
 
     query = update.callback_query
-    callback = query.data
+    callback = callbacks.code(query.data)
     await query.answer()
 
     order = None
     order_id = context.user_data.get("completed_order_id")
+    order_source = context.user_data.get("completed_order_source", 0)
     
     user_id = context.user_data.get("user_id")
     user = await models.User.objects.aget(user_id=user_id)
@@ -878,26 +1119,19 @@ async def completed_order_list(update: Update, context: ContextTypes.DEFAULT_TYP
         f"*[✅ архив заказов]*\n\n\n"
     )
 
-    if callback == str(top_states["COMPLETED_ORDER_LIST"]):
-        order = await models.CompletedOrder.objects.filter(user=user).afirst()
-        if order:
-            order_id = order.order_id
+    if callback == top_states["COMPLETED_ORDER_LIST"]:
+        # start from the first recent order, archive is the last source
+        order, order_source = await step_completed_order(user, None, len(completed_order_sources) - 1, forward=True)
 
-        context.user_data["completed_order_id"] = order_id
+    if callback == completed_order_states["PREVIOUS"]:
+        order, order_source = await step_completed_order(user, order_id, order_source, forward=False)
 
-    if callback == str(completed_order_states["PREVIOUS"]):
-        order = await models.CompletedOrder.objects.filter(Q(user=user) & Q(order_id__lt=order_id)).alast()
-        if not order:
-            order = await models.CompletedOrder.objects.filter(user=user).alast()
-        if order:
-            context.user_data["completed_order_id"] = order.order_id
+    if callback == completed_order_states["NEXT"]:
+        order, order_source = await step_completed_order(user, order_id, order_source, forward=True)
 
-    if callback == str(completed_order_states["NEXT"]):
-        order = await models.CompletedOrder.objects.filter(Q(user=user) & Q(order_id__gt=order_id)).afirst()
-        if not order:
-            order = await models.CompletedOrder.objects.filter(user=user).afirst()
-        if order:
-            context.user_data["completed_order_id"] = order.order_id
+    if order:
+        context.user_data["completed_order_id"] = order.order_id
+        context.user_data["completed_order_source"] = order_source
 
     if order:
         ordered_time = order.ordered_time + CONFIG.TZ_OFFSET
@@ -911,12 +1145,12 @@ async def completed_order_list(update: Update, context: ContextTypes.DEFAULT_TYP
             f"завершён: _{completed_time.strftime('%d.%m.%Y %H:%M')}_\n\n"
         )
 
-        for part_id in order.parts:
-            count = order.parts[part_id]['count']
-            price = order.parts[part_id]['price']
-            name = order.parts[part_id]['name']
+        for part_id, line in (await versions.aresolve(order.parts)).items():
+            count = line['count']
+            price = line['price']
+            name = line['name']
 
-            cost = round(count * price, 2)
+            cost = money.line_cost(count, price)
 
             text += (
                 f"● *{name}*\n"
@@ -927,26 +1161,26 @@ async def completed_order_list(update: Update, context: ContextTypes.DEFAULT_TYP
 
         keyboard = [
             [
-                InlineKeyboardButton("⬅️", callback_data=str(completed_order_states["PREVIOUS"])),
-                InlineKeyboardButton("➡️", callback_data=str(completed_order_states["NEXT"])),
+                InlineKeyboardButton("⬅️", callback_data=callbacks.encode(completed_order_states["PREVIOUS"])),
+                InlineKeyboardButton("➡️", callback_data=callbacks.encode(completed_order_states["NEXT"])),
             ],
             [
-                InlineKeyboardButton("↩️ назад", callback_data=str(top_states["START"]))
+                InlineKeyboardButton("↩️ назад", callback_data=callbacks.encode(top_states["START"]))
             ]
         ]
     else:
         text += CONFIG.EMPTY_TEXT
 
         keyboard = [
-            [InlineKeyboardButton("↩️ назад", callback_data=str(top_states["START"]))]
+            [InlineKeyboardButton("↩️ назад", callback_data=callbacks.encode(top_states["START"]))]
         ]
 
     reply_markup = InlineKeyboardMarkup(keyboard)
 
-    if callback == str(top_states["COMPLETED_ORDER_LIST"]):
+    if callback == top_states["COMPLETED_ORDER_LIST"]:
         await query.edit_message_media(
             media=InputMediaPhoto(
-                media=f"{URL}/static/img/bot/malarka_shop_bot_completed_orders.jpg?a={CONFIG.TIMESTAMP_START}",
+                media=assets.static_url("img/bot/malarka_shop_bot_completed_orders.jpg"),
                 caption=text,
                 parse_mode=ParseMode.MARKDOWN,
             ),
@@ -971,22 +1205,36 @@ async def choose_category(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
 
-    text = (
-        f"\n_выберите категорию товара ниже:_"
-    )
+    keyboard = list()
+
+    for category, button_name in CONFIG.CATEGORY_CHOICES.items():
+        count = cache.category_counts.get(category, 0)
+
+        if count == 0 and CONFIG.HIDE_EMPTY_CATEGORIES:
+            continue
+
+        keyboard.append([
+            InlineKeyboardButton(
+                f"{button_name} ({count})" if count else f"{button_name} (пусто)",
+                callback_data=callbacks.encode(top_states["PRODUCT_CARDS"], category)
+            )
+        ])
+
+    if keyboard:
+        text = (
+            f"\n_выберите категорию товара ниже:_"
+        )
+    else:
+        text = CONFIG.EMPTY_TEXT
 
-    keyboard = [
-        [InlineKeyboardButton(button_name, callback_data=str(top_states["PRODUCT_CARDS"]) + SPLIT + category)] 
-            for category, button_name in CONFIG.CATEGORY_CHOICES.items()
-    ]
     keyboard += [
-        [InlineKeyboardButton("↩️ назад", callback_data=str(top_states["START"]))]
+        [InlineKeyboardButton("↩️ назад", callback_data=callbacks.encode(top_states["START"]))]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
 
     await query.edit_message_media(
         media=InputMediaPhoto(
-            media=f"{URL}/static/img/bot/malarka_shop_bot_in_catalog.jpg?a={CONFIG.TIMESTAMP_START}",
+            media=assets.static_url("img/bot/malarka_shop_bot_in_catalog.jpg"),
             caption=text,
             parse_mode=ParseMode.MARKDOWN,
         ),
@@ -1005,13 +1253,13 @@ async def empty_category(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text += CONFIG.EMPTY_TEXT
 
     keyboard = [
-        [InlineKeyboardButton("↩️ назад", callback_data=str(top_states["CHOOSE_CATEGORY"]))]
+        [InlineKeyboardButton("↩️ назад", callback_data=callbacks.encode(top_states["CHOOSE_CATEGORY"]))]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
 
     await update.callback_query.edit_message_media(
         media=InputMediaPhoto(
-            media=f"{URL}/static/img/bot/malarka_shop_bot_in_catalog.jpg?a={CONFIG.TIMESTAMP_START}",
+            media=assets.static_url("img/bot/malarka_shop_bot_in_catalog.jpg"),
             caption=text,
             parse_mode=ParseMode.MARKDOWN,
         ),
@@ -1032,21 +1280,27 @@ async def product_cards(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         await query.answer()
 
-        callback = query.data
+        callback = callbacks.code(query.data)
 
-        if len(callback) > 2:
-            category = callback.split(SPLIT, 1)[1]
+        if callback == top_states["PRODUCT_CARDS"] and context.args:
+            category = context.args[0]
             context.user_data["category_part"] = category
             first_call = True
 
+            if not cache.category_counts.get(category):
+                return await empty_category(update, context)
+
+            if context.user_data.get("catalog_view") == "list":
+                return await product_list(update, context)
+
         entered_part_count = None
     else:
         entered_part_count = int(update.message.text)
 
         callback = None
 
-    order_id = context.user_data.get("order_id")
-    order = await models.Order.objects.aget(order_id=order_id)
+    order = await get_cart(context)
+    order_id = order.order_id
 
     part_id = context.user_data.get("part_id")
     part = None
@@ -1054,7 +1308,10 @@ async def product_cards(update: Update, context: ContextTypes.DEFAULT_TYPE):
     part_deleted_from_catalog = False
     part_not_enough_available_count = False
 
-    if callback == str(top_states["PRODUCT_CARDS"]) or first_call:
+    if callback == top_states["PRODUCT_CARDS"]:
+        context.user_data.pop("catalog_view", None)
+
+    if callback == top_states["PRODUCT_CARDS"] or first_call:
         part = await models.Part.objects.filter(Q(is_available=True) & Q(available_count__gt=0) & Q(category=category)).afirst()
 
         if not part:
@@ -1065,6 +1322,8 @@ async def product_cards(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         context.user_data["part_id"] = part_id
 
+        await reservations.apply_available_to_sell(part, order_id)
+
         if str(part_id) in order.parts:
             # if part.available_count == 0:
             #     part_deleted_from_catalog = True
@@ -1072,11 +1331,24 @@ async def product_cards(update: Update, context: ContextTypes.DEFAULT_TYPE):
             #     await models.Order.objects.filter(order_id=order_id).aupdate(parts=order.parts) elif
             if order.parts[str(part_id)]['count'] > part.available_count:
                 order.parts[str(part_id)]['count'] = part.available_count
+                if part.available_count == 0:
+                    order.parts.pop(str(part_id))
                 part_not_enough_available_count = True
-                await models.Order.objects.filter(order_id=order_id).aupdate(parts=order.parts)
+                await save_cart(order)
+                await reservations.hold(order_id, part_id, part.available_count)
+
+    if callback == product_card_states["PREVIOUS"] or callback == product_card_states["NEXT"]:
+        # rapid taps on arrows are coalesced by throttling into the latest one with the sum of their steps
+        steps = context.user_data.pop("navigation_steps", 1 if callback == product_card_states["NEXT"] else -1)
+
+        if steps == 0:
+            return top_states["PRODUCT_CARDS"]
 
-    if callback == str(product_card_states["PREVIOUS"]):
-        part = await models.Part.objects.filter(Q(is_available=True) & Q(available_count__gt=0) & Q(category=category) & Q(part_id__lt=part_id)).alast()
+        callback = product_card_states["NEXT"] if steps > 0 else product_card_states["PREVIOUS"]
+        skip = abs(steps) - 1
+
+    if callback == product_card_states["PREVIOUS"]:
+        part = await models.Part.objects.filter(Q(is_available=True) & Q(available_count__gt=0) & Q(category=category) & Q(part_id__lt=part_id)).order_by("-part_id")[skip:skip + 1].afirst()
 
         if not part:
             part = await models.Part.objects.filter(Q(is_available=True) & Q(available_count__gt=0) & Q(category=category)).alast()
@@ -1084,6 +1356,8 @@ async def product_cards(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if part:
             context.user_data["part_id"] = part.part_id
 
+            await reservations.apply_available_to_sell(part, order_id)
+
             if str(part.part_id) in order.parts:
                 # if part.available_count == 0:
                 #     part_deleted_from_catalog = True
@@ -1091,14 +1365,17 @@ async def product_cards(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 #     await models.Order.objects.filter(order_id=order_id).aupdate(parts=order.parts)
                 if order.parts[str(part.part_id)]['count'] > part.available_count:
                     order.parts[str(part.part_id)]['count'] = part.available_count
+                    if part.available_count == 0:
+                        order.parts.pop(str(part.part_id))
                     part_not_enough_available_count = True
-                    await models.Order.objects.filter(order_id=order_id).aupdate(parts=order.parts)
+                    await save_cart(order)
+                    await reservations.hold(order_id, part.part_id, part.available_count)
         else:
             await empty_category(update, context)
             return top_states["EMPTY_CATEGORY"]
   
-    if callback == str(product_card_states["NEXT"]):
-        part = await models.Part.objects.filter(Q(is_available=True) & Q(available_count__gt=0) & Q(category=category) & Q(part_id__gt=part_id)).afirst()
+    if callback == product_card_states["NEXT"]:
+        part = await models.Part.objects.filter(Q(is_available=True) & Q(available_count__gt=0) & Q(category=category) & Q(part_id__gt=part_id)).order_by("part_id")[skip:skip + 1].afirst()
 
         if not part:
             part = await models.Part.objects.filter(Q(is_available=True) & Q(available_count__gt=0) & Q(category=category)).afirst()
@@ -1106,6 +1383,8 @@ async def product_cards(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if part:
             context.user_data["part_id"] = part.part_id
 
+            await reservations.apply_available_to_sell(part, order_id)
+
             if str(part.part_id) in order.parts:
                 # if part.available_count == 0:
                 #     part_deleted_from_catalog = True
@@ -1113,20 +1392,24 @@ async def product_cards(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 #     await models.Order.objects.filter(order_id=order_id).aupdate(parts=order.parts)
                 if order.parts[str(part.part_id)]['count'] > part.available_count:
                     order.parts[str(part.part_id)]['count'] = part.available_count
+                    if part.available_count == 0:
+                        order.parts.pop(str(part.part_id))
                     part_not_enough_available_count = True
-                    await models.Order.objects.filter(order_id=order_id).aupdate(parts=order.parts)
+                    await save_cart(order)
+                    await reservations.hold(order_id, part.part_id, part.available_count)
         else:
             await empty_category(update, context)
             return top_states["EMPTY_CATEGORY"]
 
-    if callback == str(product_card_states["REMOVE"]):
+    if callback == product_card_states["REMOVE"]:
         part = await models.Part.objects.aget(part_id=part_id)
         if part.is_available == False or part.available_count == 0:
             part_deleted_from_catalog = True
             if str(part_id) in order.parts:
                 order.parts.pop(str(part_id))
-                await models.Order.objects.filter(order_id=order_id).aupdate(parts=order.parts)
+                await save_cart(order)
         elif str(part_id) in order.parts:
+            await reservations.apply_available_to_sell(part, order_id)
             if order.parts[str(part_id)]['count'] - 1 > part.available_count:
                 order.parts[str(part_id)]['count'] = part.available_count
                 part_not_enough_available_count = True
@@ -1134,33 +1417,31 @@ async def product_cards(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 order.parts[str(part_id)]['count'] -= 1
             else:
                 order.parts.pop(str(part_id))
-            await models.Order.objects.filter(order_id=order_id).aupdate(parts=order.parts)
+            if order.parts.get(str(part_id), {}).get('count') == 0:
+                order.parts.pop(str(part_id))
+            await save_cart(order)
 
-    if callback == str(product_card_states["ADD"]):
+    if callback == product_card_states["ADD"]:
         part = await models.Part.objects.aget(part_id=part_id)
         if part.is_available == False or part.available_count == 0:
             part_deleted_from_catalog = True
             if str(part_id) in order.parts:
                 order.parts.pop(str(part_id))
-                await models.Order.objects.filter(order_id=order_id).aupdate(parts=order.parts)
+                await save_cart(order)
         else:
+            await reservations.apply_available_to_sell(part, order_id)
             if str(part_id) in order.parts:
                 if order.parts[str(part_id)]['count'] + 1 <= part.available_count:
                     order.parts[str(part_id)]['count'] += 1
                 else:
                     order.parts[str(part_id)]['count'] = part.available_count
+                    if part.available_count == 0:
+                        order.parts.pop(str(part_id))
                     part_not_enough_available_count = True
-                await models.Order.objects.filter(order_id=order_id).aupdate(parts=order.parts)
+                await save_cart(order)
             elif part.available_count > 0:
-                order.parts[str(part_id)] = {
-                    'name': part.name,
-                    'category': part.category,
-                    'description': part.description,
-                    'price': part.price,
-                    'count': 1,
-                    'image': part.image.url
-                }
-                await models.Order.objects.filter(order_id=order_id).aupdate(parts=order.parts)
+                order.parts[str(part_id)] = versions.line(await versions.current_version_id(part), 1)
+                await save_cart(order)
             else:
                 part_not_enough_available_count = True 
 
@@ -1171,31 +1452,25 @@ async def product_cards(update: Update, context: ContextTypes.DEFAULT_TYPE):
             part_deleted_from_catalog = True
             if str(part_id) in order.parts:
                 order.parts.pop(str(part_id))
-                await models.Order.objects.filter(order_id=order_id).aupdate(parts=order.parts)
+                await save_cart(order)
         elif entered_part_count > 0:
-            if entered_part_count <= part.available_count:
-                order.parts[str(part_id)] = {
-                    'name': part.name,
-                    'category': part.category,
-                    'description': part.description,
-                    'price': part.price,
-                    'count': entered_part_count,
-                    'image': part.image.url
-                }
+            await reservations.apply_available_to_sell(part, order_id)
+            if part.available_count == 0:
+                order.parts.pop(str(part_id), None)
+                part_not_enough_available_count = True
+            elif entered_part_count <= part.available_count:
+                order.parts[str(part_id)] = versions.line(await versions.current_version_id(part), entered_part_count)
             else:
-                order.parts[str(part_id)] = {
-                    'name': part.name,
-                    'category': part.category,
-                    'description': part.description,
-                    'price': part.price,
-                    'count': part.available_count,
-                    'image': part.image.url
-                }
+                order.parts[str(part_id)] = versions.line(await versions.current_version_id(part), part.available_count)
                 part_not_enough_available_count = True
-            await models.Order.objects.filter(order_id=order_id).aupdate(parts=order.parts)
+            await save_cart(order)
         elif order.parts.get(str(part_id)) is not None:
             order.parts.pop(str(part_id))
-            await models.Order.objects.filter(order_id=order_id).aupdate(parts=order.parts)
+            await save_cart(order)
+
+    if callback == product_card_states["ADD"] or callback == product_card_states["REMOVE"] or entered_part_count is not None:
+        await reservations.apply_available_to_sell(part, order_id)
+        await reservations.hold(order_id, part.part_id, order.parts.get(str(part.part_id), {}).get('count', 0))
 
     text = (
         f"*[{CONFIG.CATEGORY_CHOICES[part.category]}]*\n"
@@ -1208,7 +1483,7 @@ async def product_cards(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     if str(part.part_id) in order.parts:
         count = order.parts[str(part.part_id)]['count']
-        cost = round(count * part.price, 2)
+        cost = money.line_cost(count, part.price)
         text += (
             f"\nв корзине: *{count}шт.*\n"
             f"на *{cost}р.*\n"
@@ -1228,28 +1503,29 @@ async def product_cards(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
 
-    img = part.image
+    img = cache.photo_file_ids.get(part.image.name) or part.image
 
     keyboard = [
         [
-            InlineKeyboardButton("⬅️", callback_data=str(product_card_states["PREVIOUS"])),
-            InlineKeyboardButton("➡️", callback_data=str(product_card_states["NEXT"])),
+            InlineKeyboardButton("⬅️", callback_data=callbacks.encode(product_card_states["PREVIOUS"])),
+            InlineKeyboardButton("➡️", callback_data=callbacks.encode(product_card_states["NEXT"])),
         ],
         [
-            InlineKeyboardButton("➕", callback_data=str(product_card_states["ADD"])),
-            InlineKeyboardButton("ввести кол-во", callback_data=str(product_card_states["ENTER_COUNT"])),
-            InlineKeyboardButton("➖", callback_data=str(product_card_states["REMOVE"])),
+            InlineKeyboardButton("➕", callback_data=callbacks.encode(product_card_states["ADD"])),
+            InlineKeyboardButton("ввести кол-во", callback_data=callbacks.encode(product_card_states["ENTER_COUNT"])),
+            InlineKeyboardButton("➖", callback_data=callbacks.encode(product_card_states["REMOVE"])),
         ],
         [
-            InlineKeyboardButton("🛒 в корзину", callback_data=str(top_states["INTO_CART"]))
+            InlineKeyboardButton("🛒 в корзину", callback_data=callbacks.encode(top_states["INTO_CART"])),
+            InlineKeyboardButton("📋 списком", callback_data=callbacks.encode(product_list_states["LIST"]))
         ],
         [
-            InlineKeyboardButton("↩️ категории", callback_data=str(top_states["CHOOSE_CATEGORY"]))
+            InlineKeyboardButton("↩️ категории", callback_data=callbacks.encode(top_states["CHOOSE_CATEGORY"]))
         ]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
 
-    if callback == str(product_card_states["ADD"]) or callback == str(product_card_states["REMOVE"]):
+    if callback == product_card_states["ADD"] or callback == product_card_states["REMOVE"]:
         try: # ingnore telegram.error.BadRequest: Message on the same message
             await query.edit_message_caption(
                 caption=text,
@@ -1260,7 +1536,7 @@ async def product_cards(update: Update, context: ContextTypes.DEFAULT_TYPE):
             pass
     elif callback:
         try: # ingnore telegram.error.BadRequest: Message on the same message
-            await query.edit_message_media(
+            message = await query.edit_message_media(
                 media=InputMediaPhoto(
                     media=img,
                     caption=text,
@@ -1268,10 +1544,11 @@ async def product_cards(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 ),
                 reply_markup=reply_markup
             )
+            await remember_photo(part, message)
         except:
             pass
     else:
-        await context.bot.edit_message_media(
+        message = await context.bot.edit_message_media(
             chat_id=context.user_data.get("user_id"),
             message_id=context.user_data.get("msg_id"),
             media=InputMediaPhoto(
@@ -1281,6 +1558,252 @@ async def product_cards(update: Update, context: ContextTypes.DEFAULT_TYPE):
             ),
             reply_markup=reply_markup
         )
+        await remember_photo(part, message)
+
+    return top_states["PRODUCT_CARDS"]
+
+
+async def remember_photo(part: models.Part, message):
+    """Save telegram file id of part photo uploaded with the message"""
+
+    if not isinstance(message, Message) or not message.photo or part.image.name in cache.photo_file_ids:
+        return
+
+    file_id = message.photo[-1].file_id
+    await models.PartPhoto.objects.aupdate_or_create(image=part.image.name, defaults={"file_id": file_id})
+    cache.photo_file_ids[part.image.name] = file_id
+
+
+async def inline_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Answer inline query with parts from catalog matching it"""
+
+    inline_query = update.inline_query
+
+    offset = int(inline_query.offset) if inline_query.offset.isdigit() else 0
+    parts = search.search(inline_query.query)
+    page = parts[offset:offset + CONFIG.INLINE_RESULTS_PAGE_SIZE]
+
+    results = list()
+
+    for part in page:
+        caption = (
+            f"*{part.name}*\n"
+            f"_{CONFIG.CATEGORY_CHOICES.get(part.category, part.category)}_\n\n"
+            f"цена за 1шт.: *{part.price}р.*\n"
+            f"в наличии: *{part.available_count} шт.*\n"
+            f"id: *{part.part_id}*"
+        )
+        file_id = cache.photo_file_ids.get(part.image.name)
+
+        if file_id:
+            results.append(InlineQueryResultCachedPhoto(
+                id=str(part.part_id),
+                photo_file_id=file_id,
+                title=part.name,
+                caption=caption,
+                parse_mode=ParseMode.MARKDOWN
+            ))
+        else:
+            results.append(InlineQueryResultPhoto(
+                id=str(part.part_id),
+                photo_url=assets.media_url(part.image.name),
+                thumbnail_url=assets.media_url(part.image.name),
+                title=part.name,
+                caption=caption,
+                parse_mode=ParseMode.MARKDOWN
+            ))
+
+    next_offset = offset + CONFIG.INLINE_RESULTS_PAGE_SIZE
+
+    await inline_query.answer(
+        results=results,
+        cache_time=CONFIG.INLINE_CACHE_TIME,
+        next_offset=str(next_offset) if next_offset < len(parts) else "",
+        button=InlineQueryResultsButton(text="🛍 перейти в каталог", start_parameter="catalog")
+    )
+
+
+async def add_part_to_cart(order: models.Order, part: models.Part):
+    """Add one more part to cart within available count, return False if there is no more available"""
+
+    await reservations.apply_available_to_sell(part, order.order_id)
+
+    part_id = str(part.part_id)
+    count = order.parts[part_id]['count'] if part_id in order.parts else 0
+
+    if not part.is_available or count + 1 > part.available_count:
+        if part.available_count == 0:
+            order.parts.pop(part_id, None)
+        elif part_id in order.parts:
+            order.parts[part_id]['count'] = part.available_count
+        added = False
+    elif part_id in order.parts:
+        order.parts[part_id]['count'] += 1
+        added = True
+    else:
+        order.parts[part_id] = versions.line(await versions.current_version_id(part), 1)
+        added = True
+
+    await save_cart(order)
+    await reservations.hold(order.order_id, part.part_id, order.parts.get(part_id, {}).get('count', 0))
+
+    return added
+
+
+async def product_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Display a page of parts in chosen category as a list with buttons to add them into cart"""
+
+    query = update.callback_query
+    callback = callbacks.code(query.data)
+
+    # on choice of category the query is already answered by product_cards
+    if not callback == top_states["PRODUCT_CARDS"]:
+        await query.answer()
+
+    category = context.user_data.get("category_part")
+    context.user_data["catalog_view"] = "list"
+
+    first_part_id = context.user_data.get("list_first_part_id", 0)
+    has_previous_page = context.user_data.get("list_has_previous_page", False)
+
+    order = await get_cart(context)
+
+    not_enough_available_count = False
+
+    if callback == product_list_states["ADD"]:
+        part = await models.Part.objects.filter(part_id=callbacks.number(context.args[0])).afirst()
+        not_enough_available_count = part is None or not await add_part_to_cart(order, part)
+
+    in_category = models.Part.objects.filter(is_available=True, available_count__gt=0, category=category)
+
+    # one keyset query per page, one extra row tells whether there is a page further
+    if callback == product_list_states["PREVIOUS"]:
+        parts = [
+            part async for part in in_category.filter(part_id__lt=first_part_id)
+            .order_by("-part_id")[:CONFIG.PRODUCT_LIST_PAGE_SIZE + 1]
+        ][::-1]
+        has_previous_page = len(parts) > CONFIG.PRODUCT_LIST_PAGE_SIZE
+        parts = parts[-CONFIG.PRODUCT_LIST_PAGE_SIZE:]
+        has_next_page = True
+    else:
+        if callback == product_list_states["NEXT"]:
+            after_part_id = context.user_data.get("list_last_part_id", 0)
+            has_previous_page = True
+        elif callback == product_list_states["ADD"] or callback == product_list_states["SHOW_PHOTOS"]:
+            after_part_id = first_part_id - 1
+        else:
+            after_part_id = 0
+            has_previous_page = False
+
+        parts = [
+            part async for part in in_category.filter(part_id__gt=after_part_id)
+            .order_by("part_id")[:CONFIG.PRODUCT_LIST_PAGE_SIZE + 1]
+        ]
+        has_next_page = len(parts) > CONFIG.PRODUCT_LIST_PAGE_SIZE
+        parts = parts[:CONFIG.PRODUCT_LIST_PAGE_SIZE]
+
+    if not parts:
+        return await empty_category(update, context)
+
+    context.user_data["list_first_part_id"] = parts[0].part_id
+    context.user_data["list_last_part_id"] = parts[-1].part_id
+    context.user_data["list_has_previous_page"] = has_previous_page
+
+    text = f"*[{CONFIG.CATEGORY_CHOICES[category]}]*\n\n"
+
+    keyboard = list()
+
+    for number, part in enumerate(parts, 1):
+        text += (
+            f"*{number}. {part.name}*\n"
+            f"{part.price}р., в наличии {part.available_count} шт."
+        )
+        if str(part.part_id) in order.parts:
+            text += f", _в корзине {order.parts[str(part.part_id)]['count']} шт._"
+        text += "\n\n"
+
+    for row_start in range(0, len(parts), 4):
+        keyboard.append([
+            InlineKeyboardButton(f"➕ {number}", callback_data=callbacks.encode(product_list_states["ADD"], part.part_id))
+            for number, part in enumerate(parts[row_start:row_start + 4], row_start + 1)
+        ])
+
+    if not_enough_available_count:
+        text += (
+            f"⚠️ *произошла ошибка*\n"
+            f"_выставлено максимально доступное количество товара, либо товар убран из корзины_\n"
+        )
+
+    navigation = list()
+    if has_previous_page:
+        navigation.append(InlineKeyboardButton("⬅️", callback_data=callbacks.encode(product_list_states["PREVIOUS"])))
+    if has_next_page:
+        navigation.append(InlineKeyboardButton("➡️", callback_data=callbacks.encode(product_list_states["NEXT"])))
+    if navigation:
+        keyboard.append(navigation)
+
+    keyboard += [
+        [
+            InlineKeyboardButton("🖼 фото", callback_data=callbacks.encode(product_list_states["SHOW_PHOTOS"])),
+            InlineKeyboardButton("🃏 карточками", callback_data=callbacks.encode(top_states["PRODUCT_CARDS"]))
+        ],
+        [
+            InlineKeyboardButton("🛒 в корзину", callback_data=callbacks.encode(top_states["INTO_CART"]))
+        ],
+        [
+            InlineKeyboardButton("↩️ категории", callback_data=callbacks.encode(top_states["CHOOSE_CATEGORY"]))
+        ]
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+
+    if callback == product_list_states["SHOW_PHOTOS"]:
+        # album goes above the list, so the list is sent again below it
+        if len(parts) == 1:
+            # telegram accepts albums of 2-10 photos only
+            messages = [
+                await context.bot.send_photo(
+                    chat_id=query.message.chat_id,
+                    photo=cache.photo_file_ids.get(parts[0].image.name) or parts[0].image,
+                    caption=f"1. {parts[0].name}"
+                )
+            ]
+        else:
+            messages = await context.bot.send_media_group(
+                chat_id=query.message.chat_id,
+                media=[
+                    InputMediaPhoto(media=cache.photo_file_ids.get(part.image.name) or part.image, caption=f"{number}. {part.name}")
+                    for number, part in enumerate(parts, 1)
+                ]
+            )
+        for part, message in zip(parts, messages):
+            await remember_photo(part, message)
+        await delete_last_msg(update)
+        message = await context.bot.send_photo(
+            chat_id=query.message.chat_id,
+            photo=assets.static_url("img/bot/malarka_shop_bot_in_catalog.jpg"),
+            caption=text,
+            parse_mode=ParseMode.MARKDOWN,
+            reply_markup=reply_markup
+        )
+        context.user_data["msg_id"] = message.message_id
+    elif callback == product_list_states["LIST"] or callback == top_states["PRODUCT_CARDS"]:
+        await query.edit_message_media(
+            media=InputMediaPhoto(
+                media=assets.static_url("img/bot/malarka_shop_bot_in_catalog.jpg"),
+                caption=text,
+                parse_mode=ParseMode.MARKDOWN,
+            ),
+            reply_markup=reply_markup
+        )
+    else:
+        try: # ingnore telegram.error.BadRequest: Message on the same message
+            await query.edit_message_caption(
+                caption=text,
+                reply_markup=reply_markup,
+                parse_mode=ParseMode.MARKDOWN,
+            )
+        except:
+            pass
 
     return top_states["PRODUCT_CARDS"]
 
@@ -1329,7 +1852,10 @@ async def confirm_order_to_db(update: Update, context: ContextTypes.DEFAULT_TYPE
         if count == 0:
             await models.Part.objects.filter(part_id=part.part_id).aupdate(is_available=False)
 
+    await sync_to_async(cache.refresh_parts)(order.parts.keys())
+
     await models.Order.objects.filter(order_id=order.order_id).adelete()
+    cart_buffer.discard(order.order_id)
 
     text = (
         f"заказ *№{order.order_id}* оформлен\n"
@@ -1355,12 +1881,12 @@ async def confirm_order_to_db(update: Update, context: ContextTypes.DEFAULT_TYPE
         f"_товары в заказе:_\n"
     )
 
-    for part_id in order.parts:
-        count = order.parts[part_id]['count']
-        price = order.parts[part_id]['price']
-        name = order.parts[part_id]['name']
+    for part_id, line in (await versions.aresolve(order.parts)).items():
+        count = line['count']
+        price = line['price']
+        name = line['name']
 
-        cost = round(count * price, 2)
+        cost = money.line_cost(count, price)
 
         text_to_admin += (
             f"● *{name}*, id: *{part_id}*\n"
@@ -1369,28 +1895,24 @@ async def confirm_order_to_db(update: Update, context: ContextTypes.DEFAULT_TYPE
 
     text_to_admin += f"\n💵 стоимость: _{order.cost}р._"
     
-    admins_with_notifications_enabled = models.Admin.objects.filter(is_notification_enabled=True)
-
-    async for admin in admins_with_notifications_enabled:
-        await context.bot.send_message(
-            chat_id=admin.admin_id,
-            text=text_to_admin,
-            parse_mode=ParseMode.MARKDOWN,
-        )
+    send_notifications(cache.admins_with_notifications_enabled(), text_to_admin)
     
-    logger.info(f"[PTB] Order [id: {order.order_id}] from user [{user}] confirmed")
+    logger.info("[PTB] Order [id: %s] from user [%s] confirmed", order.order_id, user, extra={"order_id": order.order_id})
 
 
 async def into_cart(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Cart"""
 
     query = update.callback_query
-    callback = query.data
+    callback = callbacks.code(query.data)
     await query.answer()
     
-    order_id = context.user_data.get("order_id")
-    order = await models.Order.objects.aget(order_id=order_id)
-    order.cost = 0
+    order = await get_cart(context)
+    order_id = order.order_id
+    order.cost = money.ZERO
+
+    # the cart is saved whenever the user looks at it
+    await cart_buffer.flush(order_id)
 
     user = await models.User.objects.aget(user_id=context.user_data.get("user_id"))
 
@@ -1406,11 +1928,11 @@ async def into_cart(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         parts = models.Part.objects.filter(part_id__in=list(map(int, order.parts.keys())))
 
-        if callback == str(top_states["INTO_CART"]):
+        if callback == top_states["INTO_CART"]:
             async for part in parts:
                 count = order.parts[str(part.part_id)]['count']
                 price = part.price
-                cost = round(count * price, 2)
+                cost = money.line_cost(count, price)
                 order.cost += cost
 
                 text += (
@@ -1418,7 +1940,6 @@ async def into_cart(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     f"{count}шт. x {price}р.= _{cost}р._\n"
                 )
 
-            order.cost = round(order.cost, 2)
             text += (
                 f"\n💵 *итого:* _{order.cost}р._\n"
             )
@@ -1433,22 +1954,22 @@ async def into_cart(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
             keyboard = [
                 [
-                    InlineKeyboardButton("📦 оформить заказ", callback_data=str(into_cart_states["MAKE_ORDER"]))
+                    InlineKeyboardButton("📦 оформить заказ", callback_data=callbacks.encode(into_cart_states["MAKE_ORDER"]))
                 ],
                 [
-                    InlineKeyboardButton("🗑 очистить корзину", callback_data=str(into_cart_states["EMPTY_CART"]))
+                    InlineKeyboardButton("🗑 очистить корзину", callback_data=callbacks.encode(into_cart_states["EMPTY_CART"]))
                 ],
                 [
-                    InlineKeyboardButton("↩️ в начало", callback_data=str(top_states["START"]))
+                    InlineKeyboardButton("↩️ в начало", callback_data=callbacks.encode(top_states["START"]))
                 ]
             ]
             reply_markup = InlineKeyboardMarkup(keyboard)
 
-        if callback == str(into_cart_states["MAKE_ORDER"]):
+        if callback == into_cart_states["MAKE_ORDER"]:
             async for part in parts:
                 count = order.parts[str(part.part_id)]['count']
                 price = part.price
-                cost = round(count * price, 2)
+                cost = money.line_cost(count, price)
                 order.cost += cost
 
                 text += (
@@ -1456,7 +1977,6 @@ async def into_cart(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     f"{count}шт. x {price}р.= _{cost}р._\n"
                 )
 
-            order.cost = round(order.cost, 2)
             text += (
                 f"\n💵 *итого:* _{order.cost}р._\n"
             )
@@ -1475,15 +1995,15 @@ async def into_cart(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
             keyboard = [
                 [
-                    InlineKeyboardButton("✅ да", callback_data=str(into_cart_states["CONFIRM_ORDER"]))
+                    InlineKeyboardButton("✅ да", callback_data=callbacks.encode(into_cart_states["CONFIRM_ORDER"]))
                 ],
                 [
-                    InlineKeyboardButton("↩️ в начало", callback_data=str(top_states["START"]))
+                    InlineKeyboardButton("↩️ в начало", callback_data=callbacks.encode(top_states["START"]))
                 ]
             ]
             reply_markup = InlineKeyboardMarkup(keyboard)
 
-        if callback == str(into_cart_states["CONFIRM_ORDER"]):
+        if callback == into_cart_states["CONFIRM_ORDER"]:
 
             parts_id_deleted_from_catalog = list()
             parts_id_not_enough_available_count = list()
@@ -1501,14 +2021,12 @@ async def into_cart(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     parts_id_deleted_from_catalog.append(part_id)
                     order.parts.pop(part_id)
                 else:
-                    order.parts[part_id]['name'] = part.name
-                    order.parts[part_id]['category'] = part.category
-                    order.parts[part_id]['description'] = part.description
-                    order.parts[part_id]['price'] = part.price
+                    await reservations.apply_available_to_sell(part, order_id)
+
                     count = order.parts[part_id]['count']
-                    order.parts[part_id]['image'] = part.image.url
+                    order.parts[part_id] = versions.line(await versions.current_version_id(part), count)
 
-                    cost = round(count * part.price, 2)
+                    cost = money.line_cost(count, part.price)
 
                     if count > part.available_count:
                         text += (
@@ -1518,6 +2036,8 @@ async def into_cart(update: Update, context: ContextTypes.DEFAULT_TYPE):
                         )
 
                         order.parts[part_id]['count'] = part.available_count
+                        if part.available_count == 0:
+                            order.parts.pop(part_id)
                         parts_id_not_enough_available_count.append(part_id)
                     else:
                         text += (
@@ -1526,17 +2046,16 @@ async def into_cart(update: Update, context: ContextTypes.DEFAULT_TYPE):
                         )
                         order.cost += cost
 
-            order.cost = round(order.cost, 2)
             text += (
                 f"\n💵 *итого:* _{order.cost}р._\n"
             )
 
             if len(parts_id_deleted_from_catalog) or len(parts_id_not_enough_available_count):   
-                await models.Order.objects.filter(order_id=order_id).aupdate(parts=order.parts)
+                await save_cart(order)
 
                 keyboard = [
                     [
-                        InlineKeyboardButton("✅ ок", callback_data=str(into_cart_states["MAKE_ORDER"]))
+                        InlineKeyboardButton("✅ ок", callback_data=callbacks.encode(into_cart_states["MAKE_ORDER"]))
                     ]
                 ]
                 reply_markup = InlineKeyboardMarkup(keyboard)
@@ -1549,14 +2068,16 @@ async def into_cart(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 await confirm_order_to_db(update, context, order)
                 return top_states["END"]
 
-        if callback == str(into_cart_states["EMPTY_CART"]):
+        if callback == into_cart_states["EMPTY_CART"]:
 
-            await models.Order.objects.filter(order_id=order_id).aupdate(parts={})
+            order.parts = {}
+            await save_cart(order)
+            await reservations.release(order_id)
 
             text += CONFIG.EMPTY_TEXT
             keyboard = [   
                 [
-                    InlineKeyboardButton("↩️ в начало", callback_data=str(top_states["START"]))
+                    InlineKeyboardButton("↩️ в начало", callback_data=callbacks.encode(top_states["START"]))
                 ]
             ]
             reply_markup = InlineKeyboardMarkup(keyboard)
@@ -1565,15 +2086,15 @@ async def into_cart(update: Update, context: ContextTypes.DEFAULT_TYPE):
         text += CONFIG.EMPTY_TEXT
         keyboard = [   
             [
-                InlineKeyboardButton("↩️ в начало", callback_data=str(top_states["START"]))
+                InlineKeyboardButton("↩️ в начало", callback_data=callbacks.encode(top_states["START"]))
             ]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
 
-    if callback == str(top_states["INTO_CART"]):
+    if callback == top_states["INTO_CART"]:
         await query.edit_message_media(
                 media=InputMediaPhoto(
-                    media=f"{URL}/static/img/bot/malarka_shop_bot_cart.jpg?a={CONFIG.TIMESTAMP_START}",
+                    media=assets.static_url("img/bot/malarka_shop_bot_cart.jpg"),
                     caption=text,
                     parse_mode=ParseMode.MARKDOWN,
                 ),
@@ -1590,183 +2111,118 @@ async def into_cart(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 # Set up PTB application and a web application for handling the incoming requests.
-context_types = ContextTypes(context=CallbackContext)
+context_types = ContextTypes(context=CallbackContext, user_data=sessions.Session)
 ptb_application = (
-    Application.builder().token(TOKEN).updater(None).context_types(context_types).build()
+    Application.builder()
+    .token(TOKEN)
+    .updater(None)
+    .context_types(context_types)
+    .concurrent_updates(metrics.MeteredUpdateProcessor(1))
+    .request(outbound.PriorityPoolsRequest())
+    .rate_limiter(outbound.PriorityRateLimiter())
+    .build()
 )
 
 
 # Register handlers
+throttling.navigation_steps.update({
+    callbacks.encode(product_card_states["PREVIOUS"]): -1,
+    callbacks.encode(product_card_states["NEXT"]): 1,
+})
+ptb_application.add_handler(TypeHandler(Update, sessions.touch), group=-2)
+ptb_application.add_handler(TypeHandler(Update, throttling.throttle), group=-1)
+
+ptb_application.add_handler(InlineQueryHandler(inline_search))
+
 ptb_application.add_handler(
-    ConversationHandler(
+    sessions.Conversation(
         entry_points=[CommandHandler("start", start)],
         states={
 
             top_states["START"]: [
-                CallbackQueryHandler(
-                    choose_category, 
-                    pattern="^" + str(top_states["CHOOSE_CATEGORY"]) + "$"
-                ),
-                CallbackQueryHandler(
-                    into_cart,
-                    pattern="^" + str(top_states["INTO_CART"]) + "$"
-                ),
-                CallbackQueryHandler(
-                    confirmed_order_list, 
-                    pattern="^" + str(top_states["CONFIRMED_ORDER_LIST"]) + "$"
-                ),
-                CallbackQueryHandler(
-                    completed_order_list, 
-                    pattern="^" + str(top_states["COMPLETED_ORDER_LIST"]) + "$"
-                ),
-                CallbackQueryHandler(
-                    admin_panel, 
-                    pattern="^" + str(top_states["ADMIN_PANEL"]) + "$"
-                ),
-                CallbackQueryHandler(
-                    user_profile_edit, 
-                    pattern="^" + str(top_states["USER_PROFILE_EDIT"]) + "$"
-                )
+                callbacks.Router({
+                    top_states["CHOOSE_CATEGORY"]: choose_category,
+                    top_states["INTO_CART"]: into_cart,
+                    top_states["CONFIRMED_ORDER_LIST"]: confirmed_order_list,
+                    top_states["COMPLETED_ORDER_LIST"]: completed_order_list,
+                    top_states["ADMIN_PANEL"]: admin_panel,
+                    top_states["USER_PROFILE_EDIT"]: user_profile_edit,
+                })
             ],
 
             top_states["ADMIN_PANEL"]: [
-                CallbackQueryHandler(
-                    admin_panel, 
-                    pattern="^" + str(top_states["ADMIN_PANEL"]) + "$"
-                ),
-                CallbackQueryHandler(
-                    admin_panel, 
-                    pattern="^" + str(admin_panel_states["NOTIFICATIONS_ON_OFF"]) + "$"
-                ),
-                CallbackQueryHandler(
-                    all_confirmed_order_list, 
-                    pattern="^" + str(admin_panel_states["ALL_CONFIRMED_ORDER_LIST"]) + "$"
-                ),
-                CallbackQueryHandler(
-                    start, 
-                    pattern="^" + str(top_states["START"]) + "$"
-                )
+                callbacks.Router({
+                    top_states["ADMIN_PANEL"]: admin_panel,
+                    admin_panel_states["NOTIFICATIONS_ON_OFF"]: admin_panel,
+                    admin_panel_states["ALL_CONFIRMED_ORDER_LIST"]: all_confirmed_order_list,
+                    admin_panel_states["SALES_REPORT"]: sales_report,
+                    top_states["START"]: start,
+                })
             ],
 
             top_states["USER_PROFILE_EDIT"]: [
-                CallbackQueryHandler(
-                    start, 
-                    pattern="^" + str(top_states["START"]) + "$"
-                ),
-                CallbackQueryHandler(
-                    ask_for_enter_name,
-                    pattern="^" + str(user_profile_edit_states["ENTER_NAME"]) + "$"
-                ),
-                CallbackQueryHandler(
-                    ask_for_enter_phone_number,
-                    pattern="^" + str(user_profile_edit_states["ENTER_PHONE_NUMBER"]) + "$"
-                ),
-                CallbackQueryHandler(
-                    ask_for_enter_delivery_address,
-                    pattern="^" + str(user_profile_edit_states["ENTER_DELIVERY_ADDRESS"]) + "$"
-                )
+                callbacks.Router({
+                    top_states["START"]: start,
+                    user_profile_edit_states["ENTER_NAME"]: ask_for_enter_name,
+                    user_profile_edit_states["ENTER_PHONE_NUMBER"]: ask_for_enter_phone_number,
+                    user_profile_edit_states["ENTER_DELIVERY_ADDRESS"]: ask_for_enter_delivery_address,
+                })
             ],
 
             top_states["CHOOSE_CATEGORY"]: [
-                CallbackQueryHandler(
-                    start, 
-                    pattern="^" + str(top_states["START"]) + "$"
-                ),
-                CallbackQueryHandler(
-                    product_cards,
-                    pattern="^" + str(top_states["PRODUCT_CARDS"]) + "_[a-zA-Z_]{1,64}$"
-                )
+                callbacks.Router({
+                    top_states["START"]: start,
+                    top_states["PRODUCT_CARDS"]: product_cards,
+                })
             ],
 
             top_states["EMPTY_CATEGORY"]: [
-                CallbackQueryHandler(
-                    choose_category, 
-                    pattern="^" + str(top_states["CHOOSE_CATEGORY"]) + "$"
-                )
+                callbacks.Router({
+                    top_states["CHOOSE_CATEGORY"]: choose_category,
+                })
             ],
 
             top_states["PRODUCT_CARDS"]: [
-                CallbackQueryHandler(
-                    choose_category, 
-                    pattern="^" + str(top_states["CHOOSE_CATEGORY"]) + "$"
-                ),
-                CallbackQueryHandler(
-                    product_cards,
-                    pattern="^" + str(top_states["PRODUCT_CARDS"]) + "$"
-                ),
-                CallbackQueryHandler(
-                    product_cards,
-                    pattern="^" + str(product_card_states["NEXT"]) + "$"
-                ),
-                CallbackQueryHandler(
-                    product_cards,
-                    pattern="^" + str(product_card_states["PREVIOUS"]) + "$"
-                ),
-                CallbackQueryHandler(
-                    product_cards,
-                    pattern="^" + str(product_card_states["ADD"]) + "$"
-                ),
-                CallbackQueryHandler(
-                    product_cards,
-                    pattern="^" + str(product_card_states["REMOVE"]) + "$"
-                ),
-                CallbackQueryHandler(
-                    ask_for_enter_part_count_in_cart,
-                    pattern="^" + str(product_card_states["ENTER_COUNT"]) + "$"
-                ),
-                CallbackQueryHandler(
-                    into_cart,
-                    pattern="^" + str(top_states["INTO_CART"]) + "$"
-                )
+                callbacks.Router({
+                    top_states["CHOOSE_CATEGORY"]: choose_category,
+                    top_states["PRODUCT_CARDS"]: product_cards,
+                    product_card_states["NEXT"]: product_cards,
+                    product_card_states["PREVIOUS"]: product_cards,
+                    product_card_states["ADD"]: product_cards,
+                    product_card_states["REMOVE"]: product_cards,
+                    product_card_states["ENTER_COUNT"]: ask_for_enter_part_count_in_cart,
+                    product_list_states["LIST"]: product_list,
+                    product_list_states["PREVIOUS"]: product_list,
+                    product_list_states["NEXT"]: product_list,
+                    product_list_states["ADD"]: product_list,
+                    product_list_states["SHOW_PHOTOS"]: product_list,
+                    top_states["INTO_CART"]: into_cart,
+                })
             ],
 
             top_states["INTO_CART"]: [
-                CallbackQueryHandler(
-                    start,
-                    pattern="^" + str(top_states["START"]) + "$"
-                ),
-                CallbackQueryHandler(
-                    into_cart,
-                    pattern="^" + str(into_cart_states["MAKE_ORDER"]) + "$"
-                ),
-                CallbackQueryHandler(
-                    into_cart,
-                    pattern="^" + str(into_cart_states["CONFIRM_ORDER"]) + "$"
-                ),
-                CallbackQueryHandler(
-                    into_cart,
-                    pattern="^" + str(into_cart_states["EMPTY_CART"]) + "$"
-                )
+                callbacks.Router({
+                    top_states["START"]: start,
+                    into_cart_states["MAKE_ORDER"]: into_cart,
+                    into_cart_states["CONFIRM_ORDER"]: into_cart,
+                    into_cart_states["EMPTY_CART"]: into_cart,
+                })
             ],
 
             top_states["CONFIRMED_ORDER_LIST"]: [
-                CallbackQueryHandler(
-                    start, 
-                    pattern="^" + str(top_states["START"]) + "$"
-                ),
-                CallbackQueryHandler(
-                    confirmed_order_list, 
-                    pattern="^" + str(confirmed_order_states["PREVIOUS"]) + "$"
-                ),
-                CallbackQueryHandler(
-                    confirmed_order_list, 
-                    pattern="^" + str(confirmed_order_states["NEXT"]) + "$"
-                )
+                callbacks.Router({
+                    top_states["START"]: start,
+                    confirmed_order_states["PREVIOUS"]: confirmed_order_list,
+                    confirmed_order_states["NEXT"]: confirmed_order_list,
+                })
             ],
 
             top_states["COMPLETED_ORDER_LIST"]: [
-                CallbackQueryHandler(
-                    start, 
-                    pattern="^" + str(top_states["START"]) + "$"
-                ),
-                CallbackQueryHandler(
-                    completed_order_list, 
-                    pattern="^" + str(completed_order_states["PREVIOUS"]) + "$"
-                ),
-                CallbackQueryHandler(
-                    completed_order_list, 
-                    pattern="^" + str(completed_order_states["NEXT"]) + "$"
-                )
+                callbacks.Router({
+                    top_states["START"]: start,
+                    completed_order_states["PREVIOUS"]: completed_order_list,
+                    completed_order_states["NEXT"]: completed_order_list,
+                })
             ],
 
             top_states["END"]: [],
@@ -1787,34 +2243,20 @@ ptb_application.add_handler(
 
             
             admin_panel_states["ALL_CONFIRMED_ORDER_LIST"]: [
-                CallbackQueryHandler(
-                    admin_panel, 
-                    pattern="^" + str(top_states["ADMIN_PANEL"]) + "$"
-                ),
-                CallbackQueryHandler(
-                    all_confirmed_order_list,
-                    pattern="^" + str(admin_panel_states["ALL_CONFIRMED_ORDER_LIST"]) + "$"
-                ),
-                CallbackQueryHandler(
-                    all_confirmed_order_list, 
-                    pattern="^" + str(all_confirmed_order_states["PREVIOUS"]) + "$"
-                ),
-                CallbackQueryHandler(
-                    all_confirmed_order_list, 
-                    pattern="^" + str(all_confirmed_order_states["NEXT"]) + "$"
-                ),
-                CallbackQueryHandler(
-                    all_confirmed_order_list, 
-                    pattern="^" + str(all_confirmed_order_states["ACCEPT_ORDER"]) + "$"
-                ),
-                CallbackQueryHandler(
-                    all_confirmed_order_list, 
-                    pattern="^" + str(all_confirmed_order_states["COMPLETE_ORDER"]) + "$"
-                ),
-                CallbackQueryHandler(
-                    all_confirmed_order_list, 
-                    pattern="^" + str(all_confirmed_order_states["CANCEL_ORDER"]) + "$"
-                )
+                callbacks.Router({
+                    top_states["ADMIN_PANEL"]: admin_panel,
+                    admin_panel_states["ALL_CONFIRMED_ORDER_LIST"]: all_confirmed_order_list,
+                    all_confirmed_order_states["PREVIOUS"]: all_confirmed_order_list,
+                    all_confirmed_order_states["NEXT"]: all_confirmed_order_list,
+                    all_confirmed_order_states["ACCEPT_ORDER"]: all_confirmed_order_list,
+                    all_confirmed_order_states["COMPLETE_ORDER"]: all_confirmed_order_list,
+                    all_confirmed_order_states["CANCEL_ORDER"]: all_confirmed_order_list,
+                    all_confirmed_order_states["SELECT_ORDERS"]: select_confirmed_orders,
+                    all_confirmed_order_states["TOGGLE_ORDER"]: select_confirmed_orders,
+                    all_confirmed_order_states["SELECT_ALL_ORDERS"]: select_confirmed_orders,
+                    all_confirmed_order_states["ACCEPT_SELECTED_ORDERS"]: select_confirmed_orders,
+                    all_confirmed_order_states["COMPLETE_SELECTED_ORDERS"]: select_confirmed_orders,
+                })
             ],
 
 
@@ -1829,8 +2271,13 @@ ptb_application.add_handler(
     )
 )
 
+# buttons of conversations forgotten by sessions
+ptb_application.add_handler(CallbackQueryHandler(callbacks.expired))
+
+logs.name_handlers(ptb_application)
 
-async def main() -> None:
+
+async def main(updates_mode: str) -> None:
     """Finalize configuration and run the applications."""
 
     webserver = uvicorn.Server(
@@ -1842,14 +2289,42 @@ async def main() -> None:
         )
     )
 
-    # Pass webhook settings to telegram
-    await ptb_application.bot.set_webhook(url=f"{URL}/telegram", allowed_updates=Update.ALL_TYPES)
-
     # Run application and webserver together
     async with ptb_application:
         await ptb_application.start()
+        await lifecycle.startup(
+            ptb_application,
+            webhook_url=f"{URL}/telegram" if updates_mode == "webhook" else None
+        )
+
+        lifecycle.run_periodically(carts.cleanup_carts, CONFIG.ABANDONED_CART_CLEANUP_INTERVAL)
+        lifecycle.run_periodically(analytics.rollup_completed_orders, CONFIG.ANALYTICS_ROLLUP_INTERVAL)
+        lifecycle.run_periodically(notify_low_stock, CONFIG.LOW_STOCK_CHECK_INTERVAL)
+        lifecycle.run_periodically(evict_idle_sessions, CONFIG.SESSIONS_EVICT_INTERVAL)
+        lifecycle.run_periodically(cart_buffer.flush_idle, CONFIG.CART_BUFFER_FLUSH_INTERVAL)
+
+        if CONFIG.STOCK_RESERVATION_ENABLED:
+            lifecycle.run_periodically(reservations.sweep_expired, CONFIG.STOCK_RESERVATION_SWEEP_INTERVAL)
+
         await webserver.serve()
-        await ptb_application.stop()
+        await lifecycle.shutdown(ptb_application)
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run the bot with its web server")
+    parser.add_argument(
+        "--updates",
+        choices=["webhook", "polling"],
+        default=CONFIG.UPDATES_MODE,
+        help="take updates from webhook requests or with long polling"
+    )
+    args = parser.parse_args()
+
+    # Enable logging, records are written to the rotated file by a separate thread
+    logs.setup()
+    # set higher logging level for httpx to avoid all GET and POST requests being logged
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    try:
+        asyncio.run(main(updates_mode=args.updates))
+    finally:
+        logs.stop()
\ No newline at end of file
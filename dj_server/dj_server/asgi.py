@@ -13,4 +13,16 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'dj_server.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from django.conf import settings
+from app_bot.static_files import StaticFilesApp
+
+# static and media files are served before requests reach Django
+application = StaticFilesApp(
+    django_application,
+    {
+        "/" + settings.STATIC_URL.lstrip("/"): settings.STATIC_ROOT,
+        "/" + settings.MEDIA_URL.lstrip("/"): settings.MEDIA_ROOT,
+    }
+)
@@ -2,8 +2,6 @@ import datetime
 
 TZ_OFFSET = datetime.timedelta(hours=3)
 
-TIMESTAMP_START = int(datetime.datetime.now().timestamp())
-
 TITLE = 'MalarkaShop'
 CHANNEL_LINK="tg://resolve?domain=malarkashop_bot"
 
@@ -25,8 +23,157 @@ CATEGORY_CHOICES = {
     "preorder": "🛠 предзаказ"
 }
 
+# categories without parts in stock are hidden from catalog menu, otherwise marked as empty
+HIDE_EMPTY_CATEGORIES = True
+
+# parts on one page of catalog list view, page text must fit 1024 characters of photo caption
+PRODUCT_LIST_PAGE_SIZE = 8
+
 DEFAULT_PART_IMAGE = "malarka_shop_bot_part_no_image.jpg"
 
 EMPTY_TEXT = (
     f"здесь пусто.."
-)
\ No newline at end of file
+)
+
+
+""" BOT PROCESS LIFECYCLE """
+
+# seconds given to handlers to process queued updates on shutdown,
+# updates which are still queued after that are saved and replayed on next start
+SHUTDOWN_DRAIN_TIMEOUT = 10
+PENDING_UPDATES_FILE = "pending_updates.json"
+
+# how telegram gives updates to the bot, `python bot.py --updates polling` overrides it
+UPDATES_MODE = "webhook"            # "webhook" or "polling", polling needs no public URL for updates
+POLLING_BATCH_SIZE = 100            # updates taken with one getUpdates, telegram allows 100 at most
+POLLING_TIMEOUT = 50                # seconds getUpdates waits for new updates
+POLLING_RETRY_INTERVAL = 5          # seconds before next getUpdates after a network error
+
+
+""" HEALTH CHECK """
+
+# /health reports not ready when any of these limits is exceeded
+HEALTH_MAX_DB_LATENCY = 0.5             # seconds
+HEALTH_MAX_UPDATE_QUEUE_DEPTH = 100     # updates
+HEALTH_MAX_OLDEST_UPDATE_AGE = 10       # seconds
+HEALTH_MAX_NOTIFICATION_BACKLOG = 200   # notifications
+HEALTH_MAX_INTERACTIVE_DELAY = 2        # seconds answers and edits wait for their turn on average
+
+
+""" STOCK RESERVATION """
+
+# when enabled, parts added to cart are held for other users until the hold expires
+STOCK_RESERVATION_ENABLED = False
+STOCK_RESERVATION_TTL = datetime.timedelta(minutes=15)
+STOCK_RESERVATION_SWEEP_INTERVAL = 60     # seconds between deletions of expired holds
+STOCK_RESERVATION_SWEEP_BATCH_SIZE = 500  # holds deleted per query
+
+
+""" ABANDONED CARTS CLEANUP """
+
+ABANDONED_CART_CLEANUP_INTERVAL = 60 * 60               # seconds between cleanups
+ABANDONED_CART_TTL = datetime.timedelta(days=30)        # carts without changes for this long are deleted
+EMPTY_CART_TTL = datetime.timedelta(days=1)             # the same for empty carts
+ABANDONED_CART_BATCH_SIZE = 500                         # carts deleted or refreshed per query
+
+
+""" COMPLETED ORDERS ARCHIVE """
+
+# completed orders older than this are moved to archive by archive_completed_orders command
+COMPLETED_ORDER_ARCHIVE_AGE = datetime.timedelta(days=180)
+COMPLETED_ORDER_ARCHIVE_BATCH_SIZE = 1000
+
+
+""" SALES ANALYTICS """
+
+ANALYTICS_ROLLUP_INTERVAL = 10 * 60     # seconds between rollups of newly completed orders
+ANALYTICS_ROLLUP_BATCH_SIZE = 1000      # orders rolled up per transaction
+ANALYTICS_REPORT_DAYS = 30              # period of the report in admin panel
+ANALYTICS_TOP_PARTS_COUNT = 5
+
+
+""" LOW STOCK ALERTS """
+
+LOW_STOCK_CHECK_INTERVAL = 15 * 60                          # seconds between forecasts
+SALES_VELOCITY_HALF_LIFE = datetime.timedelta(days=7)       # weight of a sale halves after this time
+LOW_STOCK_DAYS = 3                                          # alert when stock is forecast to run out sooner
+LOW_STOCK_REALERT_INTERVAL = datetime.timedelta(days=1)     # don't repeat alert for the same part more often
+LOW_STOCK_DIGEST_MAX_PARTS = 30                             # parts listed in one digest message
+LOW_STOCK_BATCH_SIZE = 1000                                 # orders read per query
+
+
+""" ORDER NOTIFICATIONS """
+
+NOTIFICATIONS_IN_FLIGHT = 10    # queued notifications sent at once, their rate is limited by the outbound scheduler
+BULK_ORDERS_PAGE_SIZE = 20      # orders shown for multi-select in admin panel
+
+
+""" ADMIN SITE """
+
+# unfiltered admin lists of tables with more rows than this show estimated row count from MySQL statistics
+ADMIN_ESTIMATED_COUNT_MIN_ROWS = 100_000
+
+
+""" INLINE SEARCH """
+
+INLINE_RESULTS_PAGE_SIZE = 50       # results per answer, telegram allows 50 at most
+INLINE_CACHE_TIME = 5 * 60          # seconds telegram may cache results of the same query
+INLINE_RESULTS_CACHE_SIZE = 1000    # queries whose results are kept in memory
+
+
+""" THROTTLING """
+
+THROTTLE_RATE = 3               # updates per second a user may send on average
+THROTTLE_BURST = 10             # updates a user may send at once
+THROTTLE_MAX_USERS = 10000      # token buckets kept before idle ones are dropped
+
+
+""" SESSIONS """
+
+CONVERSATION_TIMEOUT = datetime.timedelta(hours=12)     # users idle for this long lose their conversation state and user_data
+SESSIONS_MAX_USERS = 100000                         # users kept in memory, the least recently active ones are forgotten over it
+SESSIONS_EVICT_INTERVAL = 5 * 60                    # seconds between checks for idle users
+SESSIONS_MEMORY_SAMPLE = 100                        # recently active users measured for the memory report of health endpoint
+
+
+""" CART BUFFER """
+
+CART_BUFFER_IDLE_TIME = 10          # seconds a cart isn't used before its changes are written and it is dropped from memory
+CART_BUFFER_FLUSH_INTERVAL = 2      # seconds between checks for idle carts
+
+
+""" OUTBOUND REQUESTS """
+
+# limits of requests to telegram bot API, notifications wait while answers and edits are sent
+OUTBOUND_PER_SECOND = 30        # requests per second of the whole bot
+OUTBOUND_BURST = 30             # requests sent at once after a pause
+OUTBOUND_CHAT_RATE = 1          # requests per second to one chat
+OUTBOUND_CHAT_BURST = 5         # requests sent at once to one chat
+OUTBOUND_MAX_CHATS = 10000      # chat token buckets kept before idle ones are dropped
+OUTBOUND_MAX_RETRIES = 3        # repeats of a request after flood limit errors
+
+# connections to bot API, answers and edits don't share them with notifications
+BOT_API_INTERACTIVE_POOL_SIZE = 32
+BOT_API_NOTIFICATION_POOL_SIZE = 8
+BOT_API_KEEPALIVE_EXPIRY = 60       # seconds an idle connection is kept open
+BOT_API_HTTP_VERSION = "1.1"        # "2" needs `pip install "python-telegram-bot[http2]"`
+BOT_API_CONNECT_TIMEOUT = 5         # seconds
+BOT_API_READ_TIMEOUT = 10           # seconds
+BOT_API_WRITE_TIMEOUT = 10          # seconds
+BOT_API_POOL_TIMEOUT = 5            # seconds a request waits for a free connection
+
+
+""" LOGGING """
+
+LOG_FILE = "bot.log"                # JSON lines, rotated files get the time they were closed appended
+LOG_MAX_BYTES = 50 * 1024 * 1024    # size at which the file is rotated before midnight
+LOG_BACKUP_COUNT = 30               # rotated files kept
+
+
+""" STATIC FILES """
+
+STATIC_FILES_MAX_AGE = 7 * 24 * 60 * 60     # seconds telegram and browsers may cache static and media files
+STATIC_FILES_CHUNK_SIZE = 256 * 1024        # bytes read at once when the server can't send files by itself
+
+# content hashes of bot images and part photos, built by `python manage.py build_asset_manifest` on deploy
+ASSET_MANIFEST_FILE = "asset_manifest.json"